@@ -0,0 +1,170 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Build duration history
+"""
+
+from __future__ import print_function
+import os
+import json
+import time
+import threading
+from pybombs import pb_logging
+from pybombs.prefix_lock import FileLock, get_lock_timeout
+
+HISTORY_VERSION = 1
+MAX_RUNS = 20 # Number of builds that are stored per package
+ESTIMATE_RUNS = 3 # Number of successful builds that are averaged for estimates
+
+def format_duration(seconds):
+    """
+    Turn a duration in seconds into something readable, e.g. '4m05s'.
+    """
+    if seconds is None:
+        return "-"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return "{0}s".format(seconds)
+    if seconds < 3600:
+        return "{0}m{1:02d}s".format(seconds // 60, seconds % 60)
+    return "{0}h{1:02d}m".format(seconds // 3600, (seconds % 3600) // 60)
+
+class BuildHistory(object):
+    """
+    Stores how long the build phases (configure, make, install) of source
+    packages took, together with the makewidth and whether the build was
+    successful. Every prefix has its own history file.
+
+    If several processes build packages in the same prefix, their builds
+    are merged: record() re-reads the file before adding a build.
+    """
+    def __init__(self, history_file):
+        self.log = pb_logging.logger.getChild("BuildHistory")
+        self.history_file = history_file
+        self._lock = threading.RLock()
+        self._data = None
+
+    def record(self, pkg, phases, makewidth=None, success=True):
+        """
+        Store a build of pkg, and write the history file.
+
+        - phases: List of (phase, seconds) tuples, in the order they were run
+        """
+        try:
+            makewidth = int(makewidth)
+        except (TypeError, ValueError):
+            makewidth = None
+        build = {
+            'time': time.time(),
+            'phases': [[phase, round(seconds, 2)] for phase, seconds in phases],
+            'total': round(sum([seconds for _, seconds in phases]), 2),
+            'makewidth': makewidth,
+            'success': bool(success),
+        }
+        history_lock = FileLock(
+            self.history_file + '.lock',
+            timeout=get_lock_timeout(),
+            description="lock on build history {0}".format(self.history_file),
+        )
+        with self._lock, history_lock:
+            self._data = None
+            self._load()
+            builds = self._data.setdefault(pkg, [])
+            builds.append(build)
+            del builds[:-MAX_RUNS]
+            self.save()
+
+    def save(self):
+        " Write the history file "
+        with self._lock:
+            if self._data is None:
+                return
+            tmp_filename = self.history_file + '.tmp'
+            try:
+                if not os.path.isdir(os.path.dirname(self.history_file)):
+                    os.makedirs(os.path.dirname(self.history_file))
+                with open(tmp_filename, 'w') as history_file:
+                    json.dump({'version': HISTORY_VERSION, 'packages': self._data}, history_file)
+                os.rename(tmp_filename, self.history_file)
+            except (IOError, OSError) as ex:
+                self.log.warn("Could not write build history {0}: {1}".format(self.history_file, str(ex)))
+
+    def get_packages(self):
+        " Return a list of all packages that have a build history "
+        with self._lock:
+            self._load()
+            return sorted(self._data.keys())
+
+    def get_builds(self, pkg):
+        " Return all stored builds of pkg, oldest first "
+        with self._lock:
+            self._load()
+            return list(self._data.get(pkg, []))
+
+    def estimate(self, pkg):
+        """
+        Return the expected build time of pkg in seconds, or None if it was
+        never successfully built.
+        """
+        totals = [build['total'] for build in self.get_builds(pkg) if build['success']]
+        if not totals:
+            return None
+        totals = totals[-ESTIMATE_RUNS:]
+        return sum(totals) / len(totals)
+
+    def estimate_all(self, packages):
+        """
+        Return a dict with the expected build time for every package in
+        packages. Packages without history are assumed to take as long as
+        the average package that has one. Returns None if none of the
+        packages has a history.
+        """
+        estimates = {pkg: self.estimate(pkg) for pkg in packages}
+        known = [x for x in estimates.values() if x is not None]
+        if not known:
+            return None
+        average = sum(known) / len(known)
+        return {pkg: average if x is None else x for pkg, x in estimates.items()}
+
+    def _load(self):
+        " Load the history file, unless it's already loaded. Lock must be held. "
+        if self._data is not None:
+            return
+        self._data = {}
+        if not os.path.isfile(self.history_file):
+            return
+        try:
+            with open(self.history_file) as history_file:
+                data = json.load(history_file)
+            if data.get('version') == HISTORY_VERSION:
+                self._data = data.get('packages', {})
+        except (IOError, OSError, ValueError, AttributeError) as ex:
+            self.log.warn("Could not read build history {0}: {1}".format(self.history_file, str(ex)))
+
+if __name__ == "__main__":
+    import tempfile
+    hist = BuildHistory(os.path.join(tempfile.mkdtemp(), 'build_history.json'))
+    hist.record('foo', [('configure', 2.5), ('make', 60.0), ('install', 1.0)], makewidth=4)
+    hist.record('foo', [('configure', 2.0), ('make', 10.0)], makewidth=4, success=False)
+    hist.record('bar', [('make', 3700)], makewidth='2')
+    print(BuildHistory(hist.history_file).get_builds('foo'))
+    print(format_duration(hist.estimate('foo')), format_duration(hist.estimate('bar')))
+    print(hist.estimate_all(['foo', 'bar', 'baz']))
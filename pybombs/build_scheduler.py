@@ -0,0 +1,188 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of GNU Radio
+#
+# GNU Radio is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# GNU Radio is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GNU Radio; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+""" Runs package builds in dependency order, optionally in parallel """
+
+import threading
+from collections import deque
+from contextlib import contextmanager
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty  # Py3k
+from pybombs import pb_logging
+from pybombs.build_history import format_duration
+from pybombs.config_manager import config_manager
+from pybombs.utils import subproc
+
+POLL_INTERVAL = 0.5 # s
+
+@contextmanager
+def recipe_makewidth(rec, makewidth):
+    """
+    Context manager: Limit the makewidth of a single recipe while building
+    it. If the recipe already defines a smaller makewidth in its vars, that
+    one is kept. Afterwards, the recipe's vars are restored, so later users
+    of the (cached) recipe get the configured makewidth again. If makewidth
+    is None, the recipe is left alone.
+    """
+    if makewidth is None:
+        yield
+        return
+    old_makewidth = rec.vars.get('makewidth')
+    try:
+        makewidth = min(makewidth, int(old_makewidth))
+    except (TypeError, ValueError):
+        pass
+    rec.vars['makewidth'] = str(makewidth)
+    try:
+        yield
+    finally:
+        if old_makewidth is None:
+            rec.vars.pop('makewidth', None)
+        else:
+            rec.vars['makewidth'] = old_makewidth
+
+class BuildScheduler(object):
+    """
+    Walks a DepGraph and calls a build function for every package, starting
+    at the leaf nodes. A package is started as soon as all of its dependencies
+    were built, and up to `jobs' packages are built at the same time.
+
+    The makewidth budget (the 'makewidth' config option) is split between the
+    packages that are being built concurrently.
+
+    When several packages are ready to build, the ones at the start of the
+    longest chains of expected build times (from the prefix's build history)
+    are started first. The history is also used to log ETAs.
+    """
+    def __init__(self, dep_graph, jobs=None, makewidth=None, estimates=None):
+        self.log = pb_logging.logger.getChild("BuildScheduler")
+        self.dep_graph = dep_graph
+        self.jobs = max(1, int(jobs or config_manager.get('jobs', 1)))
+        self.makewidth = max(1, int(makewidth or config_manager.get('makewidth', 1)))
+        if estimates is None:
+            history = config_manager.get_active_prefix().build_history
+            if history is not None:
+                estimates = history.estimate_all(dep_graph.get_values())
+        # pkg -> expected build time, or None if we have no idea
+        self.estimates = estimates
+        self._chain_length = {}
+
+    def get_chain_length(self, pkg):
+        """
+        Return the expected time it takes from starting pkg until all
+        packages that depend on it are built (in units of one package build
+        if there's no build history).
+        """
+        if not self._chain_length:
+            weight = (lambda x: self.estimates[x]) if self.estimates else (lambda x: 1)
+            for this_pkg in reversed(self.dep_graph.serialize()):
+                self._chain_length[this_pkg] = weight(this_pkg) + max(
+                    [self._chain_length[x] for x in self.dep_graph.get_dependees(this_pkg)] or [0]
+                )
+        return self._chain_length[pkg]
+
+    def log_eta(self, remaining):
+        """
+        Log how long building the packages in remaining will probably take.
+        Builds that are already running count as if they had just started.
+        """
+        if not self.estimates or not remaining:
+            return
+        eta = max(
+            max([self.get_chain_length(pkg) for pkg in remaining]),
+            sum([self.estimates[pkg] for pkg in remaining]) / self.jobs,
+        )
+        self.log.info("{0} package(s) left to build, estimated time: {1}".format(
+            len(remaining), format_duration(eta)
+        ))
+
+    def run(self, build_callback):
+        """
+        Build all packages in the graph.
+
+        build_callback(pkg, makewidth) does the actual work. It must return
+        True on success. When a build fails, no new builds are started, the
+        ones that are running are allowed to finish, and run() returns False.
+        """
+        # Make sure the graph is valid before we start anything:
+        order = self.dep_graph.serialize()
+        remaining = set(order)
+        self.log_eta(remaining)
+        if self.jobs == 1:
+            for pkg in order:
+                if not build_callback(pkg, self.makewidth):
+                    return False
+                remaining.remove(pkg)
+                self.log_eta(remaining)
+            return True
+        position = {pkg: idx for idx, pkg in enumerate(order)}
+        # Longest chains first, otherwise keep the topological order:
+        sort_key = lambda x: (-self.get_chain_length(x), position[x])
+        deps_left = {pkg: len(self.dep_graph.get_deps(pkg)) for pkg in order}
+        ready = deque(sorted([pkg for pkg in order if deps_left[pkg] == 0], key=sort_key))
+        running = set()
+        results = Queue()
+        failed = False
+        def _worker(pkg, makewidth):
+            " Thread function: Run the build, report back. "
+            try:
+                results.put((pkg, bool(build_callback(pkg, makewidth))))
+            except Exception as ex:
+                self.log.error("Unexpected error while building {0}: {1}".format(pkg, str(ex)))
+                results.put((pkg, False))
+        try:
+            while ready or running:
+                while ready and len(running) < self.jobs and not failed:
+                    pkg = ready.popleft()
+                    concurrency = min(self.jobs, len(running) + len(ready) + 1)
+                    makewidth = max(1, self.makewidth // concurrency)
+                    self.log.debug("Starting build of {0} (makewidth {1})".format(pkg, makewidth))
+                    worker = threading.Thread(target=_worker, args=(pkg, makewidth))
+                    worker.daemon = True
+                    running.add(pkg)
+                    worker.start()
+                if not running:
+                    break
+                try:
+                    pkg, success = results.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    continue
+                running.remove(pkg)
+                remaining.remove(pkg)
+                if not success:
+                    failed = True
+                    if running:
+                        self.log.info("Waiting for running builds to finish: {0}".format(
+                            ", ".join(sorted(running))
+                        ))
+                    continue
+                self.log_eta(remaining)
+                for dependee in self.dep_graph.get_dependees(pkg):
+                    deps_left[dependee] -= 1
+                    if deps_left[dependee] == 0:
+                        ready.append(dependee)
+                ready = deque(sorted(ready, key=sort_key))
+        except KeyboardInterrupt:
+            self.log.info("Caught Ctrl+C. Stopping all builds.")
+            subproc.terminate_all()
+            raise
+        return not failed
@@ -19,21 +19,36 @@
 # Boston, MA 02110-1301, USA.
 #
 
-### List of commands:
+""" PyBOMBS commands """
+
 from .base import CommandBase, SubCommandBase, dispatch
-from .autoconfig import AutoConfig
-from .config import Config
-from .deploy import Deploy
-from .digraph import Digraph
-from .fetch import Fetch
-from .git import Git
-from .install import Install, Doge
-from .inv import Inv
-from .lint import Lint
-from .prefix import Prefix
-from .recipes import Recipes
-from .rebuild import Rebuild
-from .remove import Remove
-from .run import Run
-# Leave this at the end
-from .help import Help
+
+### List of commands:
+# Every entry: (COMMAND, MODULE, CLASS)
+# Command modules are only imported when their command is run (or its help
+# is shown). The help strings for the command list come from cmd_help.py,
+# which is generated from the command classes (see tests/startup_time.py).
+COMMANDS = [
+    ('auto-config', 'autoconfig', 'AutoConfig'),
+    ('config', 'config', 'Config'),
+    ('deploy', 'deploy', 'Deploy'),
+    ('digraph', 'digraph', 'Digraph'),
+    ('fetch', 'fetch', 'Fetch'),
+    ('refetch', 'fetch', 'Fetch'),
+    ('git', 'git', 'Git'),
+    ('history', 'history', 'History'),
+    ('install', 'install', 'Install'),
+    ('update', 'install', 'Install'),
+    ('doge', 'install', 'Doge'),
+    ('inv', 'inv', 'Inv'),
+    ('lint', 'lint', 'Lint'),
+    ('plan', 'plan', 'Plan'),
+    ('prefix', 'prefix', 'Prefix'),
+    ('recipes', 'recipes', 'Recipes'),
+    ('rebuild', 'rebuild', 'Rebuild'),
+    ('remove', 'remove', 'Remove'),
+    ('run', 'run', 'Run'),
+    ('why', 'why', 'Why'),
+    # Leave this at the end
+    ('help', 'help', 'Help'),
+]
@@ -75,6 +75,16 @@ class CommandBase(object):
         """
         raise PBException("run() method not implemented for command {1}!".format(self.cmd))
 
+    def lock_prefix(self, exclusive=False):
+        """
+        Lock the prefix until the command is done, so other PyBOMBS processes
+        can't get in the way. Commands that work on individual packages take
+        a shared lock (the packages get locked separately), commands that
+        work on the whole prefix take an exclusive lock.
+        """
+        if self.prefix is not None:
+            self.prefix.lock.lock_prefix(exclusive)
+
 
 class SubCommandBase(CommandBase):
     """
@@ -122,14 +132,18 @@ class SubCommandBase(CommandBase):
 ##############################################################################
 # Argument Parser
 ##############################################################################
-def init_arg_parser(show_help_for=None, hide_hidden=True):
+def init_arg_parser(show_help_for=None, hide_hidden=True, setup_cmds=None):
     """
     Create a base argument parser
+
+    Setting up the subparser for a command means importing its module, so
+    if setup_cmds is a list, only the commands in there (and show_help_for)
+    are set up. All other commands only get their help string.
     """
     def dummy_error(msg):
         " Bogus error handler for ArgParse in case we don't want all the output."
         raise PBException('parse error')
-    cmd_list = get_cmd_list(hide_hidden=hide_hidden)
+    from pybombs.commands import COMMANDS
     # Set up global options:
     parser = argparse.ArgumentParser(
         description='PyBOMBS: A meta-package manager integrated with CGRAN.',
@@ -147,50 +161,88 @@ def init_arg_parser(show_help_for=None, hide_hidden=True):
     if hide_hidden:
         parser.error = dummy_error
     # Set up options for each command:
-    for cmd in cmd_list:
-        for cmd_name, cmd_help in iteritems(cmd.cmds):
-            subparser = subparsers.add_parser(cmd_name, help=cmd_help, add_help=True)
-            cmd.setup_subparser(subparser, cmd_name)
-            if cmd_name == show_help_for:
-                subparser.print_help()
-                exit(0)
+    for this_cmd_name, _, _ in COMMANDS:
+        cmd_help, hidden = get_cmd_help(this_cmd_name)
+        if hide_hidden and hidden:
+            continue
+        subparser = subparsers.add_parser(this_cmd_name, help=cmd_help, add_help=True)
+        if setup_cmds is None or this_cmd_name in setup_cmds or this_cmd_name == show_help_for:
+            get_cmd_class(this_cmd_name).setup_subparser(subparser, this_cmd_name)
+        if this_cmd_name == show_help_for:
+            subparser.print_help()
+            exit(0)
     return parser
 
+def get_cmd_name(argv=None):
+    """
+    Return the name of the command that's being called (the first positional
+    argument after the global options), or None if we can't tell.
+    """
+    def raise_error(msg):
+        " Don't print anything or exit, we only want to know the command "
+        raise PBException(msg)
+    parser = argparse.ArgumentParser(add_help=False)
+    config_manager.add_global_args(parser)
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    parser.error = raise_error
+    try:
+        args = parser.parse_known_args(argv)[0]
+    except PBException:
+        return None
+    if not args.command:
+        return None
+    return args.command[0]
+
 ##############################################################################
 # Dispatcher functions
 ##############################################################################
-def get_cmd_list(hide_hidden=False):
+def get_cmd_class(cmd_name):
     """
-    Returns a list of all command classes, excluding PyBombsCmd
+    Return the command class for cmd_name. This imports its module.
     """
-    from pybombs import commands
-    cmd_list = []
-    for g in commands.__dict__.values():
-        try:
-            if issubclass(g, CommandBase) and len(g.cmds) and not (hide_hidden and g.hidden):
-                cmd_list.append(g)
-        except (TypeError, AttributeError):
-            pass
-    return cmd_list
+    import importlib
+    from pybombs.commands import COMMANDS
+    for this_cmd_name, module_name, class_name in COMMANDS:
+        if this_cmd_name == cmd_name:
+            module = importlib.import_module('pybombs.commands.' + module_name)
+            return getattr(module, class_name)
+    raise PBException("Invalid command: {0}".format(cmd_name))
+
+def get_cmd_help(cmd_name):
+    """
+    Return a tuple (help string, hidden) for cmd_name. This comes from the
+    generated table in cmd_help.py, so the command module isn't imported,
+    unless the command is missing from the table.
+    """
+    from pybombs.commands.cmd_help import CMD_HELP
+    if cmd_name in CMD_HELP:
+        return CMD_HELP[cmd_name]
+    cmd_class = get_cmd_class(cmd_name)
+    return cmd_class.cmds.get(cmd_name), cmd_class.hidden
 
-def get_cmd_dict(cmd_list):
+def get_cmd_list(hide_hidden=False):
     """
-    Create a command: class type dict of all commands
+    Returns a list of all command classes. This imports all command modules.
     """
-    cmd_dict = {}
-    for cmd in cmd_list:
-        for cmd_name in cmd.cmds:
-            cmd_dict[cmd_name] = cmd
-    return cmd_dict
+    from pybombs.commands import COMMANDS
+    cmd_list = []
+    for cmd_name, _, _ in COMMANDS:
+        cmd = get_cmd_class(cmd_name)
+        if not (hide_hidden and cmd.hidden) and cmd not in cmd_list:
+            cmd_list.append(cmd)
+    return cmd_list
 
 def dispatch():
     """
     Dispatch the actual command class
     """
+    cmd_name = get_cmd_name()
+    setup_cmds = [cmd_name] if cmd_name is not None else []
     try:
-        args = init_arg_parser().parse_args()
+        args = init_arg_parser(setup_cmds=setup_cmds).parse_args()
     except PBException:
+        args = init_arg_parser(hide_hidden=False, setup_cmds=setup_cmds).parse_args()
+    if args.command != cmd_name:
+        # We guessed the wrong command, so set up all of them
         args = init_arg_parser(hide_hidden=False).parse_args()
-    cmd_list = get_cmd_list()
-    return get_cmd_dict(cmd_list)[args.command](cmd=args.command, args=args).run()
-
+    return get_cmd_class(args.command)(cmd=args.command, args=args).run()
@@ -0,0 +1,50 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Help strings for the command list, so showing it doesn't import every
+command module. Generated by tests/startup_time.py --update-cmd-help,
+don't edit.
+"""
+
+# Command -> (help string, hidden)
+CMD_HELP = {
+    'auto-config': ('Run an automatic configuration routine', False),
+    'config': ('Query or update configuration', False),
+    'deploy': ('Deploy a prefix', False),
+    'digraph': ('Write out package.dot digraph for graphviz', False),
+    'fetch': ('Download a packages source code into the current prefixes source directory.', False),
+    'refetch': ('Get a fresh download of a previously downloaded package', False),
+    'git': ('git tools', False),
+    'history': ('Show how long source packages took to build', False),
+    'install': ('Install listed packages', False),
+    'update': ('Update listed packages', False),
+    'doge': ('Doge', True),
+    'inv': ('Query or update inventory', False),
+    'lint': ('Lint a prefix or recipe', False),
+    'plan': ('Print the install plan for packages as JSON, without installing anything', False),
+    'prefix': ('Prefix commands', False),
+    'recipes': ('Manage recipe lists', False),
+    'rebuild': ('Rebuild an installed package', False),
+    'remove': ('Remove listed packages', False),
+    'run': ('Run a command within a PyBOMBS context', False),
+    'why': ('Show which installed packages depend on a package', False),
+    'help': ('Help', False),
+}
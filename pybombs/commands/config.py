@@ -90,7 +90,7 @@ class Config(CommandBase):
     def _run_config(self):
         " Handle `pybombs config' "
         if self.args.config_only:
-            cfg_data = PBConfigFile(self.cfg_file).get('config')
+            cfg_data = PBConfigFile(self.cfg_file, read_only=True).get('config')
         else:
             cfg_data = self.cfg
         keys = [self.args.key]
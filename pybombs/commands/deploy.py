@@ -228,6 +228,7 @@ class Deploy(CommandBase):
 
     def run(self):
         """ Go, go, go! """
+        self.lock_prefix(exclusive=True)
         ### Identify deployment target type
         deployer = choose_deployer(self.args.ttype, self.args.target)
         self.log.debug("Using deployer: {0}".format(deployer))
@@ -71,6 +71,7 @@ class Fetch(CommandBase):
         """ Go, go, go! """
         from pybombs.fetcher import Fetcher
         from pybombs import recipe
+        self.lock_prefix()
         if self.args.all:
             self.log.debug("Loading all recipes!")
             self.args.packages = self.recipe_manager.list_all()
@@ -57,6 +57,6 @@ class Help(CommandBase):
             config_manager.parser.print_help()
             return
         from pybombs.commands.base import init_arg_parser
-        init_arg_parser(help_on)
+        init_arg_parser(help_on, setup_cmds=[])
 
 
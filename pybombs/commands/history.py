@@ -0,0 +1,151 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+""" PyBOMBS command: history """
+
+from __future__ import print_function
+import time
+from pybombs.commands import CommandBase
+from pybombs.build_history import format_duration
+from pybombs.utils import tables
+
+class History(CommandBase):
+    """ Show build time history """
+    cmds = {
+        'history': 'Show how long source packages took to build',
+    }
+
+    @staticmethod
+    def setup_subparser(parser, cmd=None):
+        """
+        Set up a subparser for 'history'
+        """
+        parser.add_argument(
+                'packages',
+                help="Show every build of these packages. If none are given, show the slowest packages.",
+                nargs='*',
+                metavar='PACKAGES'
+        )
+        parser.add_argument(
+                '-n', '--num',
+                help="Number of packages to show (default: 10, 0 means all)",
+                type=int,
+                default=10,
+        )
+
+    def __init__(self, cmd, args):
+        CommandBase.__init__(self,
+                cmd, args,
+                load_recipes=False,
+                require_prefix=True,
+        )
+        self.history = self.prefix.build_history
+
+    def run(self):
+        """ Go, go, go! """
+        if self.args.packages:
+            for pkg in self.args.packages:
+                self.print_builds(pkg)
+        else:
+            self.print_slowest()
+
+    def print_slowest(self):
+        """
+        Print the packages with the longest expected build times, and how
+        their last build compares to the ones before.
+        """
+        data = []
+        for pkg in self.history.get_packages():
+            builds = self.history.get_builds(pkg)
+            totals = [build['total'] for build in builds if build['success']]
+            trend = "-"
+            if len(totals) > 1:
+                previous = sum(totals[:-1]) / (len(totals) - 1)
+                if previous > 0:
+                    trend = "{0:+.0f}%".format(100. * (totals[-1] - previous) / previous)
+            data.append({
+                'pkg': pkg,
+                'builds': len(builds),
+                'failed': len(builds) - len(totals),
+                'estimate': self.history.estimate(pkg),
+                'last': totals[-1] if totals else None,
+                'min': min(totals) if totals else None,
+                'max': max(totals) if totals else None,
+                'trend': trend,
+            })
+        if not data:
+            self.log.info("No builds recorded in this prefix.")
+            return
+        data = sorted(data, key=lambda x: x['estimate'] or 0, reverse=True)
+        if self.args.num > 0:
+            data = data[:self.args.num]
+        for row in data:
+            for col_id in ('estimate', 'last', 'min', 'max'):
+                row[col_id] = format_duration(row[col_id])
+        tables.print_table(
+            {
+                'pkg': 'Package',
+                'builds': 'Builds',
+                'failed': 'Failed',
+                'estimate': 'Expected',
+                'last': 'Last',
+                'min': 'Min',
+                'max': 'Max',
+                'trend': 'Last vs. before',
+            },
+            data,
+            col_order=('pkg', 'builds', 'failed', 'estimate', 'last', 'min', 'max', 'trend'),
+        )
+
+    def print_builds(self, pkg):
+        """
+        Print all recorded builds of pkg, oldest first
+        """
+        builds = self.history.get_builds(pkg)
+        if not builds:
+            self.log.info("No builds recorded for package {0}.".format(pkg))
+            return
+        phase_names = []
+        for build in builds:
+            phase_names += [phase for phase, _ in build['phases'] if phase not in phase_names]
+        data = []
+        for build in builds:
+            row = {
+                'date': time.strftime('%Y-%m-%d %H:%M', time.localtime(build['time'])),
+                'makewidth': build['makewidth'] if build['makewidth'] is not None else '-',
+                'total': format_duration(build['total']),
+                'result': 'ok' if build['success'] else 'FAILED',
+            }
+            row.update({phase: '-' for phase in phase_names})
+            row.update({phase: format_duration(seconds) for phase, seconds in build['phases']})
+            data.append(row)
+        headers = {
+            'date': 'Date',
+            'makewidth': 'Makewidth',
+            'total': 'Total',
+            'result': 'Result',
+        }
+        headers.update({phase: phase.capitalize() for phase in phase_names})
+        print("Builds of package {0}:".format(pkg))
+        tables.print_table(
+            headers,
+            data,
+            col_order=['date', 'makewidth'] + phase_names + ['total', 'result'],
+        )
@@ -49,7 +49,7 @@ class Install(CommandBase):
         )
         group.add_argument(
                 '--print-tree',
-                help="Print dependency tree",
+                help="Print dependency tree, install levels and critical path",
                 action='store_true',
         )
         group.add_argument(
@@ -62,6 +62,18 @@ class Install(CommandBase):
                 help="Verify installs were successful",
                 action='store_true',
         )
+        group.add_argument(
+                '-j', '--jobs',
+                help="Number of source packages to build at the same time (default: `jobs' config option)",
+                type=int,
+                default=None,
+        )
+        group.add_argument(
+                '--fetch-failure',
+                help="What to do when fetching sources fails: abort, or skip all packages that depend on the failed one (default: `fetch_failure' config option)",
+                choices=('abort', 'skip'),
+                default=None,
+        )
         if cmd == 'install':
             group.add_argument(
                     '--static',
@@ -105,10 +117,15 @@ class Install(CommandBase):
         self.fail_if_not_exists = (cmd == 'update')
         if get_all_pkgs:
             self.args.packages = self.inventory.get_packages()
+        if self.args.jobs is not None:
+            self.cfg.set('jobs', self.args.jobs)
+        if self.args.fetch_failure is not None:
+            self.cfg.set('fetch_failure', self.args.fetch_failure)
         self.install_manager = install_manager.InstallManager()
 
     def run(self):
         """ Go, go, go! """
+        self.lock_prefix()
         # Return False (0) on success, as it gets sent to exit()
         return not self.install_manager.install(
                 self.args.packages,
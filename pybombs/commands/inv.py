@@ -46,9 +46,19 @@ class Inv(CommandBase):
             '-k', '--key',
             help="Set or query this key instead of the install state",
         )
+        parser.add_argument(
+            '--export', dest='export_file', metavar='FILE',
+            help="Write the inventory to a YAML file",
+        )
+        parser.add_argument(
+            '--import', dest='import_file', metavar='FILE',
+            help="Replace the inventory with the contents of a YAML file",
+        )
 
     def __init__(self, cmd, args):
         CommandBase.__init__(self, cmd, args, require_prefix=True)
+        if self.args.export_file or self.args.import_file:
+            return
         verb = "Showing" if self.args.value is None else "Setting"
         if self.args.key is None:
             print("{verb} package state:".format(verb=verb))
@@ -57,6 +67,15 @@ class Inv(CommandBase):
 
     def run(self):
         """ Go, go, go! """
+        if self.args.export_file:
+            self.inventory.export_yaml(self.args.export_file)
+            self.log.info("Wrote inventory to {0}".format(self.args.export_file))
+            return 0
+        if self.args.import_file:
+            self.lock_prefix(exclusive=True)
+            self.inventory.import_yaml(self.args.import_file)
+            self.log.info("Imported inventory from {0}".format(self.args.import_file))
+            return 0
         if self.args.pkg is None:
             return_value = 0
             for pkg in self.inventory.get_packages():
@@ -74,12 +93,14 @@ class Inv(CommandBase):
             else:
                 print(self.inventory.get_key(self.inventory.get_state(self.args.pkg), self.args.key))
         else:
-            if self.args.key is None:
-                self.inventory.set_state(self.args.pkg, self.args.value)
-                print(self.inventory.get_state_name(self.inventory.get_state(self.args.pkg)))
-            else:
-                self.inventory.set_key(self.args.pkg, self.args.key, self.args.value)
-                print(self.inventory.get_key(self.inventory.get_state(self.args.pkg), self.args.key))
-            self.inventory.save()
+            self.lock_prefix()
+            with self.prefix.lock.package(self.args.pkg):
+                if self.args.key is None:
+                    self.inventory.set_state(self.args.pkg, self.args.value)
+                    print(self.inventory.get_state_name(self.inventory.get_state(self.args.pkg)))
+                else:
+                    self.inventory.set_key(self.args.pkg, self.args.key, self.args.value)
+                    print(self.inventory.get_key(self.inventory.get_state(self.args.pkg), self.args.key))
+                self.inventory.save()
         return 0
 
@@ -93,7 +93,7 @@ class Lint(CommandBase):
         print("Linting recipe `{0}'".format(recipe_file))
         # Basic file checks
         try:
-            recipe_dict = PBConfigFile(recipe_file).get()
+            recipe_dict = PBConfigFile(recipe_file, read_only=True).get()
         except IOError:
             self.log.error("Can't open `{0}'".format(recipe_file))
             return -1
@@ -0,0 +1,108 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+""" PyBOMBS command: plan """
+
+from __future__ import print_function
+import json
+from pybombs.commands import CommandBase
+from pybombs import install_manager
+from pybombs.pb_exception import PBException
+
+class Plan(CommandBase):
+    """ Show what an install or update would do """
+    cmds = {
+        'plan': 'Print the install plan for packages as JSON, without installing anything',
+    }
+
+    @staticmethod
+    def setup_subparser(parser, cmd=None):
+        """
+        Set up a subparser for 'plan'
+        """
+        parser.add_argument(
+                'packages',
+                help="List of packages to plan the install for",
+                nargs='*',
+                metavar='PACKAGES'
+        )
+        parser.add_argument(
+                '--mode',
+                help="Plan an install (default) or an update",
+                choices=('install', 'update'),
+                default='install',
+        )
+        parser.add_argument(
+                '--no-deps',
+                help="Skip dependencies",
+                action='store_true',
+        )
+        parser.add_argument(
+                '--static',
+                help="Build package(s) statically (implies source build)",
+                action='store_true',
+        )
+        parser.add_argument(
+                '--deps-only',
+                help="Only install the dependencies, not the requested packages",
+                action='store_true',
+        )
+        parser.add_argument(
+                '-u', '--update',
+                help="If packages are already installed, update them instead.",
+                action='store_true',
+        )
+        parser.add_argument(
+                '-o', '--output',
+                help="Write the plan to this file instead of stdout",
+        )
+
+    def __init__(self, cmd, args):
+        CommandBase.__init__(self,
+                cmd, args,
+                load_recipes=True,
+                require_prefix=False,
+        )
+        if len(self.args.packages) == 0:
+            if self.args.mode != 'update' or self.prefix is None:
+                self.log.error("No packages specified.")
+                raise PBException("No packages specified.")
+            # Same as `pybombs update' without arguments
+            self.args.packages = self.inventory.get_packages()
+            self.args.no_deps = True
+
+    def run(self):
+        """ Go, go, go! """
+        plan = install_manager.InstallManager().make_plan(
+                self.args.packages,
+                mode=self.args.mode,
+                fail_if_not_exists=(self.args.mode == 'update'),
+                update_if_exists=(self.args.mode == 'update' or self.args.update),
+                deps_only=self.args.deps_only,
+                no_deps=self.args.no_deps,
+                static=self.args.static,
+        )
+        plan_json = json.dumps(plan, indent=2)
+        if self.args.output:
+            with open(self.args.output, 'w') as plan_file:
+                plan_file.write(plan_json + "\n")
+            self.log.info("Plan written to {0}".format(self.args.output))
+        else:
+            print(plan_json)
@@ -23,6 +23,7 @@
 from __future__ import print_function
 import os
 import os.path as op
+import time
 import shutil
 from six import iteritems
 
@@ -33,6 +34,7 @@ from pybombs.utils import subproc
 from pybombs.utils import confirm
 from pybombs.utils import sysutils
 from pybombs.pb_exception import PBException
+from pybombs.build_history import format_duration
 from pybombs import fetcher
 
 #############################################################################
@@ -53,6 +55,13 @@ def setup_subsubparser_update(parser):
     )
 
 
+def setup_subsubparser_envcache(parser):
+    " Parser for pybombs prefix env-cache "
+    parser.add_argument(
+        '--rebuild', action='store_true',
+        help="Source the setup_env script again and update the cached environment",
+    )
+
 def setup_subsubparser_init(parser):
     " Parser for pybombs prefix init "
     parser.add_argument(
@@ -113,6 +122,11 @@ class Prefix(SubCommandBase):
             'subparser': lambda p: None,
             'run': lambda x: x.run_print_prefix_env,
         },
+        'env-cache': {
+            'help': 'Inspect or rebuild the cached environment of the setup_env script.',
+            'subparser': setup_subsubparser_envcache,
+            'run': lambda x: x.run_env_cache,
+        },
         'write-env': {
             'help': 'Write "setup_env.sh" into the prefix.',
             'subparser': lambda p: None,
@@ -193,6 +207,40 @@ class Prefix(SubCommandBase):
         for k, v in iteritems(self.prefix.env):
             print("{0}={1}".format(k, v))
 
+    def run_env_cache(self):
+        """
+        pybombs prefix env-cache
+        """
+        if self.prefix.setup_env is None:
+            self.log.info("This prefix has no setup_env script, so there's no cached environment.")
+            return
+        if self.args.rebuild:
+            self.prefix.load_env(refresh=True)
+        env_cache = self.prefix.env_cache
+        setup_env_file = self.prefix.get_setup_env_file()
+        print("Setup script: {0}".format(setup_env_file))
+        print("Cache file:   {0}".format(env_cache.cache_file))
+        info = env_cache.get_info()
+        if info is None:
+            print("Status:       Nothing cached")
+            return
+        changes = env_cache.get_changes(env_cache.get_key(setup_env_file, os.environ))
+        print("Status:       {0}".format("Stale" if changes else "Valid"))
+        for change in changes:
+            print("  - {0}".format(change))
+        print("Sourced:      {0} (took {1})".format(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['time'])),
+            format_duration(info['duration']),
+        ))
+        print("Tracked files:")
+        for filename, file_hash in info['key']['files']:
+            print("  {0}  {1}".format((file_hash or "(unreadable)")[:12].ljust(12), filename))
+        print("Tracked variables: {0}".format(", ".join(sorted(info['key']['env']))))
+        print("Variables set by the script:")
+        for k, v in sorted(info['changed'].items()):
+            print("  {0}={1}".format(k, v))
+        print("Variables unset by the script: {0}".format(", ".join(info['removed']) or "-"))
+
     def run_write_env(self):
         """
         pybombs "setup_env.sh" generator
@@ -204,6 +252,7 @@ class Prefix(SubCommandBase):
         """
         pybombs prefix install-sdk
         """
+        self.lock_prefix(exclusive=True)
         if not self._install_sdk_to_prefix(self.args.sdkname[0]):
             return -1
 
@@ -325,6 +374,7 @@ class Prefix(SubCommandBase):
             return False
         self.cfg.load(select_prefix=path)
         self.prefix = self.cfg.get_active_prefix()
+        self.lock_prefix()
         create_subdirs_and_files(path, prefix_recipe.dirs, prefix_recipe.files)
         if alias is not None:
             register_alias(alias, path)
@@ -393,7 +443,7 @@ class Prefix(SubCommandBase):
         ### Update the prefix-local config file
         self.log.debug("Updating config file with SDK recipe info.")
         try:
-            old_cfg_data = PBConfigFile(cfg_file).get()
+            old_cfg_data = PBConfigFile(cfg_file, read_only=True).get()
         except IOError:
             self.log.debug("There doesn't seem to be a config file yet for this prefix.")
             old_cfg_data = {}
@@ -24,6 +24,7 @@ from pybombs.commands import CommandBase
 from pybombs import packagers
 from pybombs import dep_manager
 from pybombs import recipe
+from pybombs.build_scheduler import BuildScheduler, recipe_makewidth
 
 class Rebuild(CommandBase):
     """ Rebuild a previously installed source package """
@@ -45,7 +46,7 @@ class Rebuild(CommandBase):
         )
         parser.add_argument(
                 '--print-tree',
-                help="Print dependency tree",
+                help="Print dependency tree, install levels and critical path",
                 action='store_true',
         )
         parser.add_argument(
@@ -53,6 +54,11 @@ class Rebuild(CommandBase):
                 help="Also rebuild dependencies",
                 action='store_true',
         )
+        parser.add_argument(
+                '-D', '--dependees',
+                help="Also rebuild all installed packages that depend on the listed packages",
+                action='store_true',
+        )
         parser.add_argument(
                 '-c', '--clean',
                 help="Run a `make clean' (or equivalent) command before rebuilding from source.",
@@ -63,6 +69,12 @@ class Rebuild(CommandBase):
                 help="Keep build directory before rebuilding from source (default is to nuke it).",
                 action='store_true',
         )
+        parser.add_argument(
+                '-j', '--jobs',
+                help="Number of packages to rebuild at the same time (default: `jobs' config option)",
+                type=int,
+                default=None,
+        )
 
     def __init__(self, cmd, args):
         CommandBase.__init__(self,
@@ -70,6 +82,8 @@ class Rebuild(CommandBase):
                 load_recipes=True,
                 require_prefix=True,
         )
+        if self.args.jobs is not None:
+            self.cfg.set('jobs', self.args.jobs)
         self.pm = packagers.source.Source()
         self.args.packages = args.packages[0]
         if len(self.args.packages) == 0:
@@ -90,11 +104,20 @@ class Rebuild(CommandBase):
 
     def run(self):
         """ Go, go, go! """
+        self.lock_prefix()
         ### Sanity checks
         for pkg in self.args.packages:
             if not self.is_installed(pkg):
                 self.log.error("Package {0} is not installed into current prefix. Aborting.".format(pkg))
                 return -1
+        if self.args.dependees:
+            index = dep_manager.DepManager().make_reverse_dep_index(
+                set(self.inventory.get_packages()).union(self.args.packages)
+            )
+            self.args.packages += [
+                x for x in index.get_all_dependees(self.args.packages)
+                if x not in self.args.packages and self.is_installed(x)
+            ]
         ### Make install tree
         rb_tree = dep_manager.DepManager().make_dep_tree(
             self.args.packages,
@@ -106,19 +129,23 @@ class Rebuild(CommandBase):
         if self.log.getEffectiveLevel() <= 10 or self.args.print_tree:
             print("Rebuild tree:")
             rb_tree.pretty_print()
+            if self.args.print_tree:
+                rb_tree.print_plan()
         ### Recursively rebuild, starting at the leaf nodes
-        node_cache = []
-        while not rb_tree.empty():
-            pkg = rb_tree.pop_leaf_node()
-            if pkg in node_cache:
-                continue
+        scheduler = BuildScheduler(rb_tree)
+        def _rebuild_pkg(pkg, makewidth):
+            " Rebuild a single package "
             rec = recipe.get_recipe(pkg)
             self.log.info("Rebuilding package: {0}".format(pkg))
-            if not self.pm.rebuild(
-                    rec,
-                    make_clean=self.args.clean,
-                    nuke_builddir=not (self.args.keep_build or bool(self.cfg.get('keep_builddir', False)))
-            ):
-                self.log.error("Error rebuilding package {0}. Aborting.".format(pkg))
-                return 1
-            self.log.info("Rebuild successful.")
+            with recipe_makewidth(rec, makewidth if scheduler.jobs > 1 else None):
+                if not self.pm.rebuild(
+                        rec,
+                        make_clean=self.args.clean,
+                        nuke_builddir=not (self.args.keep_build or bool(self.cfg.get('keep_builddir', False)))
+                ):
+                    self.log.error("Error rebuilding package {0}. Aborting.".format(pkg))
+                    return False
+            self.log.info("Rebuild successful: {0}".format(pkg))
+            return True
+        if not scheduler.run(_rebuild_pkg):
+            return 1
@@ -23,9 +23,17 @@
 from __future__ import print_function
 import re
 import os
+import json
 import shutil
 import sys
+import threading
+from collections import OrderedDict, deque
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # Py3k
 from six import iteritems
+from pybombs import pb_logging
 from pybombs.utils import confirm
 from pybombs.commands import SubCommandBase
 from pybombs.config_file import PBConfigFile
@@ -33,7 +41,9 @@ from pybombs.fetcher import Fetcher
 from pybombs.package_manager import PackageManager
 from pybombs.recipe_manager import RecipeListManager
 from pybombs import recipe
+from pybombs import recipe_search
 from pybombs.utils import tables
+from pybombs.utils.sysutils import get_file_fingerprint
 from pybombs.pb_exception import PBException
 
 DEFAULT_RECIPES = {
@@ -71,6 +81,16 @@ def setup_subsubparser_update(parser):
         help="Name of recipe location to update",
         nargs='*',
     )
+    add_jobs_arg(parser)
+def setup_subsubparser_add_defaults(parser):
+    add_jobs_arg(parser)
+def add_jobs_arg(parser):
+    parser.add_argument(
+        '-j', '--jobs',
+        help="Number of recipe locations to fetch concurrently (default: config option fetch_jobs)",
+        type=int,
+        default=None,
+    )
 def setup_subsubparser_list(parser):
     parser.add_argument(
         '-l', '--list',
@@ -97,6 +117,81 @@ def setup_subsubparser_list(parser):
         help="Column to sort output by",
         default='id',
     )
+    parser.add_argument(
+        '--json',
+        help="Print a JSON list of packages instead of a table",
+        action='store_true',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        help="Number of packages to query concurrently (default: config option query_jobs)",
+        type=int,
+        default=None,
+    )
+
+def setup_subsubparser_search(parser):
+    parser.add_argument(
+        'terms',
+        help="Search terms. Recipes must match all of them; terms match words that start with them.",
+        nargs='+',
+    )
+    parser.add_argument(
+        '-n', '--num',
+        help="Maximum number of results (default: 0, i.e. all)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        '--json',
+        help="Print a JSON list of results instead of a table",
+        action='store_true',
+    )
+
+#############################################################################
+# Helpers
+#############################################################################
+def run_concurrently(func, items, jobs, error_result=None):
+    """
+    Call func(item) for all items, in up to `jobs' threads. Returns an
+    OrderedDict item -> return value, in the order of items. If func(item)
+    raises, that's logged, and the return value for item is error_result.
+    """
+    todo = deque(items)
+    todo_lock = threading.Lock()
+    results = {}
+    def _worker():
+        " Process items until there are none left "
+        while True:
+            with todo_lock:
+                if not todo:
+                    return
+                item = todo.popleft()
+            try:
+                results[item] = func(item)
+            except (PBException, Exception) as ex: # PBException isn't an Exception
+                pb_logging.logger.error("Error processing `{0}': {1}".format(item, str(ex)))
+                results[item] = error_result
+    workers = [threading.Thread(target=_worker) for _ in range(max(1, min(jobs, len(todo))))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return OrderedDict((item, results.get(item)) for item in items)
+
+def get_dir_fingerprint(dirname):
+    """
+    Return a dict filename -> fingerprint for every file in dirname and its
+    subdirectories (except .git). Comparing the return values from before
+    and after an update tells if anything changed.
+    """
+    fingerprints = {}
+    for path, dirs, files in os.walk(dirname):
+        dirs[:] = [d for d in dirs if d != '.git']
+        for filename in files:
+            filename = os.path.join(path, filename)
+            fingerprints[filename] = get_file_fingerprint(filename)
+    return fingerprints
 
 #############################################################################
 # Command class
@@ -116,7 +211,7 @@ class Recipes(SubCommandBase):
         },
         'add-defaults': {
             'help': 'Add default recipe locations.',
-            'subparser': None,
+            'subparser': setup_subsubparser_add_defaults,
             'run': lambda x: x.run_add_defaults,
         },
         'remove': {
@@ -134,6 +229,11 @@ class Recipes(SubCommandBase):
             'subparser': setup_subsubparser_list,
             'run': lambda x: x.run_list,
         },
+        'search': {
+            'help': 'Search recipe names, descriptions, categories, sources and dependencies.',
+            'subparser': setup_subsubparser_search,
+            'run': lambda x: x.run_search,
+        },
         'list-repos': {
             'help': 'List recipes repositories.',
             'subparser': None,
@@ -175,10 +275,34 @@ class Recipes(SubCommandBase):
     def run_add_defaults(self):
         """
         pybombs recipes add-defaults
+
+        All locations are checked (and confirmed, if necessary) before
+        anything is deleted or fetched, so answering 'no' for one location
+        leaves all of them untouched. The locations are then fetched
+        concurrently; each one's old cache directory is only deleted right
+        before it is fetched.
         """
-        for alias, uri in iteritems(DEFAULT_RECIPES):
-            if not self.add_recipe_dir(alias, uri):
+        prepared = OrderedDict()
+        for alias, uri in sorted(iteritems(DEFAULT_RECIPES)):
+            target = self.prepare_recipe_dir(alias, uri)
+            if target is None:
                 return -1
+            prepared[alias] = (uri, target)
+        fetched = run_concurrently(
+            lambda alias: self.fetch_recipe_dir(alias, prepared[alias][0], prepared[alias][1][1]),
+            list(prepared.keys()),
+            self._get_fetch_jobs(),
+            error_result=False,
+        )
+        for alias, success in iteritems(fetched):
+            if success:
+                uri, (cfg_file, _) = prepared[alias]
+                self.cfg.update_cfg_file({'recipes': {alias: uri}}, cfg_file=cfg_file)
+        self.print_repo_summary(OrderedDict(
+            (alias, 'added' if success else 'failed') for alias, success in iteritems(fetched)
+        ))
+        if not all(fetched.values()):
+            return -1
 
     def run_remove(self):
         """
@@ -192,64 +316,229 @@ class Recipes(SubCommandBase):
         pybombs recipes update [alias]
         """
         # TODO allow directories
-        aliases_to_update = self.args.alias or self.cfg.get_named_recipe_sources().keys()
-        if not all([self.update_recipe_repo(x) for x in aliases_to_update]):
+        aliases_to_update = self.args.alias or list(self.cfg.get_named_recipe_sources().keys())
+        results = run_concurrently(
+            self.update_recipe_repo, aliases_to_update, self._get_fetch_jobs(), error_result='failed'
+        )
+        if len(results) > 1:
+            self.print_repo_summary(results)
+        if any(result == 'failed' for result in results.values()):
             return -1
 
     def run_list(self):
         """
         Print a list of recipes.
+
+        Only the columns that are printed (or needed for filtering and
+        sorting) are evaluated. Packagers are only queried if that includes
+        'installed_by' or 'available_from'; those queries run concurrently.
+        If the output is sorted by id or path, rows are printed as soon as
+        they're ready.
         """
-        pkgmgr = PackageManager()
         recmgr = RecipeListManager()
-        self.log.debug("Loading all package names")
-        all_recipes = recmgr.list_all()
-        if self.args.list is not None:
-            all_recipes = [x for x in all_recipes if re.search(self.args.list, x)]
-        not_installed_string = '-'
-        format_pkg_list = lambda x: [not_installed_string] if not x else x
-        rows = []
         row_titles = {
             'id': "Package Name",
             'path': "Recipe Filename",
             'installed_by': "Installed By",
             'available_from': "Available From",
         }
-        self.args.format = [x for x in self.args.format.split(",") if len(x)]
-        if any((x not in row_titles for x in self.args.format)):
+        columns = [x for x in self.args.format.split(",") if len(x)]
+        if any((x not in row_titles for x in columns)):
             self.log.error("Invalid column formatting: {0}".format(self.args.format))
             return -1
-        print("Loading package information...", end="")
-        sys.stdout.flush()
+        if self.args.sort_by not in row_titles:
+            self.log.error("Invalid sort column: {0}".format(self.args.sort_by))
+            return -1
+        needed_columns = set(columns + [self.args.sort_by])
+        if self.args.installed or self.args.in_prefix:
+            needed_columns.add('installed_by')
+        self.log.debug("Loading all package names")
+        all_recipes = sorted(recmgr.list_all())
+        if self.args.list is not None:
+            all_recipes = [x for x in all_recipes if re.search(self.args.list, x)]
         home_dir = os.path.expanduser("~")
+        packages = []
         for pkg in all_recipes:
             rec = recipe.get_recipe(pkg, target=None, fail_easy=True)
             if rec is None:
-                print()
                 self.log.warn("Recipe for `{0}' is invalid.".format(pkg))
                 continue
             if rec.target != 'package':
                 continue
-            print(".", end="")
-            sys.stdout.flush()
-            row = {
+            packages.append({
                 'id': pkg,
                 'path': recmgr.get_recipe_filename(pkg).replace(home_dir, "~"),
-                'installed_by': format_pkg_list(pkgmgr.installed(pkg, return_pkgr_name=True)),
-                'available_from': ",".join(format_pkg_list(pkgmgr.exists(pkg, return_pkgr_name=True))),
-            }
-            if self.args.in_prefix and 'source' not in row['installed_by']:
+            })
+        pkgmgr = None
+        if needed_columns.intersection(('installed_by', 'available_from')):
+            pkgmgr = PackageManager()
+            # One bulk query per packager instead of one per package:
+            pkgmgr.prefetch([row['id'] for row in packages])
+        stream = self.args.sort_by in ('id', 'path')
+        if stream:
+            packages = sorted(packages, key=lambda row: row[self.args.sort_by])
+        rows = self._get_list_rows(packages, needed_columns, pkgmgr)
+        if self.args.json:
+            self._print_list_json(rows, columns, stream)
+        else:
+            self._print_list_table(rows, columns, row_titles, packages, pkgmgr, stream)
+
+    def _get_list_rows(self, packages, needed_columns, pkgmgr):
+        """
+        Generator for the rows of `recipes list'. Packager queries run in
+        up to --jobs threads (the package manager, packager and packager
+        cache lock their caches); rows are yielded in the order of packages.
+        Rows that are filtered out by -i or -x are yielded as None.
+        """
+        def get_row(row):
+            " Fill in the packager columns of row "
+            if 'installed_by' in needed_columns:
+                row['installed_by'] = pkgmgr.installed(row['id'], return_pkgr_name=True) or []
+                if self.args.in_prefix and 'source' not in row['installed_by']:
+                    return None
+                if not row['installed_by'] and (self.args.installed or self.args.in_prefix):
+                    return None
+            if 'available_from' in needed_columns:
+                row['available_from'] = pkgmgr.exists(row['id'], return_pkgr_name=True) or []
+            return row
+        if pkgmgr is None:
+            for row in packages:
+                yield row
+            return
+        todo = deque(enumerate(packages))
+        todo_lock = threading.Lock()
+        results = Queue()
+        def _worker():
+            " Query packages until there are none left "
+            while True:
+                with todo_lock:
+                    if not todo:
+                        return
+                    idx, row = todo.popleft()
+                try:
+                    results.put((idx, get_row(row)))
+                except Exception as ex:
+                    self.log.warn("Could not query package {0}: {1}".format(row['id'], str(ex)))
+                    results.put((idx, None))
+        jobs = self.args.jobs if self.args.jobs is not None else int(self.cfg.get('query_jobs', 8))
+        for _ in range(max(1, min(jobs, len(packages)))):
+            worker = threading.Thread(target=_worker)
+            worker.daemon = True
+            worker.start()
+        done = {}
+        for next_idx in range(len(packages)):
+            while next_idx not in done:
+                idx, row = results.get()
+                done[idx] = row
+            yield done.pop(next_idx)
+
+    def _print_list_json(self, rows, columns, stream):
+        """
+        Print rows as a JSON list of objects. If stream is True, every row
+        is printed as soon as it's ready.
+        """
+        def _format(row):
+            " Return JSON for row "
+            return json.dumps(OrderedDict((col_id, row[col_id]) for col_id in columns))
+        if not stream:
+            rows = sorted((row for row in rows if row is not None), key=lambda row: row[self.args.sort_by])
+        print("[")
+        first = True
+        for row in rows:
+            if row is None:
                 continue
-            if row['installed_by'] == [not_installed_string] and (self.args.installed or self.args.in_prefix):
+            print(("  " if first else ", ") + _format(row))
+            sys.stdout.flush()
+            first = False
+        print("]")
+
+    def _print_list_table(self, rows, columns, row_titles, packages, pkgmgr, stream):
+        """
+        Print rows as a table. If stream is True, the column widths are
+        estimated up front, and every row is printed as soon as it's ready.
+        """
+        not_installed_string = '-'
+        def _format(row):
+            " Turn the packager columns into strings "
+            for col_id in ('installed_by', 'available_from'):
+                if col_id in row:
+                    row[col_id] = ",".join(row[col_id]) or not_installed_string
+            return row
+        if not stream:
+            print("Loading package information...")
+            tables.print_table(
+                row_titles,
+                [_format(row) for row in rows if row is not None],
+                columns,
+                sort_by=self.args.sort_by,
+            )
+            return
+        max_widths = tables.get_column_widths(row_titles, packages, ('id', 'path'))
+        if pkgmgr is not None:
+            # Cells list packagers, so the widest one lists all of them
+            pkgr_names = [pkgr.name for pkgr in [pkgmgr.src] + pkgmgr.binary_pkgrs]
+            for col_id in ('installed_by', 'available_from'):
+                max_widths[col_id] = max(
+                    len(row_titles[col_id]), len('force-installed'), len(",".join(pkgr_names))
+                )
+        tables.print_header(row_titles, columns, max_widths)
+        for row in rows:
+            if row is None:
                 continue
-            row['installed_by'] = ",".join(row['installed_by'])
-            rows.append(row)
+            tables.print_row(_format(row), columns, max_widths)
+            sys.stdout.flush()
         print("")
+
+    def run_search(self):
+        """
+        pybombs recipes search TERM [TERM ...]
+        """
+        recmgr = RecipeListManager()
+        query_terms = set()
+        for term in self.args.terms:
+            query_terms.update(recipe_search.get_terms(term))
+        if not query_terms:
+            self.log.error("No valid search terms given.")
+            return -1
+        results = {}
+        for location in recmgr.get_locations():
+            if not os.path.isdir(location):
+                continue
+            search_index = recipe_search.get_search_index(location)
+            search_index.update()
+            for name, score in iteritems(search_index.search(query_terms)):
+                # Only list recipes that aren't shadowed by another location
+                if name in results or \
+                        recmgr.get_recipe_filename(name) != os.path.join(location, name + '.lwr'):
+                    continue
+                summary = search_index.get_summary(name)
+                results[name] = {
+                    'id': name,
+                    'score': score,
+                    'category': summary.get('category', ''),
+                    'description': summary.get('description', ''),
+                    'path': recmgr.get_recipe_filename(name),
+                }
+        rows = sorted(results.values(), key=lambda row: (-row['score'], row['id']))
+        if self.args.num > 0:
+            rows = rows[:self.args.num]
+        if self.args.json:
+            print(json.dumps(
+                [OrderedDict((k, row[k]) for k in ('id', 'category', 'description', 'path')) for row in rows],
+                indent=2,
+            ))
+            return
+        if not rows:
+            self.log.info("No recipes found.")
+            return
+        for row in rows:
+            row['description'] = " ".join(row['description'].split())
+            if len(row['description']) > 60:
+                row['description'] = row['description'][:57] + "..."
         tables.print_table(
-            row_titles,
+            {'id': "Package Name", 'category': "Category", 'description': "Description"},
             rows,
-            self.args.format,
-            sort_by=self.args.sort_by,
+            col_order=('id', 'category', 'description'),
         )
 
     def run_list_recipe_repos(self):
@@ -303,19 +592,35 @@ class Recipes(SubCommandBase):
         - Otherwise, use local config file
         - Check alias is not already used
         """
+        target = self.prepare_recipe_dir(alias, uri)
+        if target is None:
+            return False
+        cfg_file, recipe_cache_top_level = target
+        if not self.fetch_recipe_dir(alias, uri, recipe_cache_top_level):
+            return False
+        # Write this to config file
+        self.cfg.update_cfg_file({'recipes': {alias: uri}}, cfg_file=cfg_file)
+        return True
+
+    def prepare_recipe_dir(self, alias, uri):
+        """
+        Run the checks for adding a recipe location, and create the top
+        level cache directory. Nothing is deleted here. Returns a tuple (cfg_file, recipe_cache_top_level), or
+        None if the location can't (or shouldn't) be added.
+        """
         self.log.debug("Preparing to add recipe location {name} -> {uri}".format(
             name=alias, uri=uri
         ))
         # Check recipe location alias is valid:
         if re.match(r'[a-z][a-z0-9_]*', alias) is None:
             self.log.error("Invalid recipe alias: {alias}".format(alias=alias))
-            return False
+            return None
         if alias in self.cfg.get_named_recipe_dirs():
             if getattr(self.args, 'force', False):
                 self.log.info("Overwriting existing recipe alias `{0}'".format(alias))
             elif not confirm("Alias `{0}' already exists, overwrite?".format(alias)):
                 self.log.warn('Aborting.')
-                return False
+                return None
         store_to_prefix = self.prefix is not None and self.prefix.prefix_src in ("cli", "cwd")
         cfg_file = None
         recipe_cache = None
@@ -334,7 +639,16 @@ class Recipes(SubCommandBase):
         assert os.path.isdir(recipe_cache_top_level)
         assert recipe_cache is not None
         assert alias
+        return (cfg_file, recipe_cache_top_level)
+
+    def fetch_recipe_dir(self, alias, uri, recipe_cache_top_level):
+        """
+        Download a remote recipe location into its cache directory (does
+        nothing for local directories). An existing cache directory for
+        alias is deleted first. Returns True on success.
+        """
         # Now make sure we don't already have a cache dir
+        recipe_cache = os.path.join(recipe_cache_top_level, alias)
         if os.path.isdir(recipe_cache):
             self.log.warn("Cache dir {cdir} for remote recipe location {alias} already exists! Deleting.".format(
                 cdir=recipe_cache, alias=alias
@@ -348,8 +662,6 @@ class Recipes(SubCommandBase):
             except PBException as ex:
                 self.log.error("Could not fetch recipes: {s}".format(s=str(ex)))
                 return False
-        # Write this to config file
-        self.cfg.update_cfg_file({'recipes': {alias: uri}}, cfg_file=cfg_file)
         return True
 
     def remove_recipe_dir(self, alias):
@@ -380,25 +692,54 @@ class Recipes(SubCommandBase):
 
     def update_recipe_repo(self, alias):
         """
-        Update a remote recipe location by its alias name.
+        Update a remote recipe location by its alias name. Returns one of
+        'updated', 'unchanged', 'skipped' (not a remote location) or
+        'failed'. Only updated locations get their search index refreshed.
         """
         try:
             uri = self.cfg.get_named_recipe_sources()[alias]
             recipes_dir = self.cfg.get_named_recipe_dirs()[alias]
         except KeyError:
             self.log.error("Error looking up recipe alias '{alias}'".format(alias=alias))
-            return False
+            return 'failed'
         if os.path.isdir(uri):
             self.log.debug("`{0}' is a directory, can't run an update operation.".format(uri))
-            return True
+            return 'skipped'
         if not os.path.isdir(recipes_dir):
             self.log.error("Recipe location does not exist. Run `recipes add --force' to add recipes.")
-            return False
+            return 'failed'
         cache_dir_top_level, cache_dir = os.path.split(os.path.normpath(recipes_dir))
         # Do actual update
         self.log.info("Updating recipe location `{alias}'...".format(alias=alias))
-        if not Fetcher().update_src(uri, cache_dir_top_level, cache_dir, {}):
-            self.log.error("Failed to update recipe location `{alias}'...".format(alias=alias))
-            return False
-        return True
+        fingerprint = get_dir_fingerprint(recipes_dir)
+        try:
+            if not Fetcher().update_src(uri, cache_dir_top_level, cache_dir, {}):
+                self.log.error("Failed to update recipe location `{alias}'...".format(alias=alias))
+                return 'failed'
+        except PBException as ex:
+            self.log.error("Failed to update recipe location `{alias}': {err}".format(alias=alias, err=str(ex)))
+            return 'failed'
+        if get_dir_fingerprint(recipes_dir) == fingerprint:
+            return 'unchanged'
+        reindexed = recipe_search.get_search_index(recipes_dir).update()
+        self.log.debug("Updated search index for {0} recipe(s).".format(reindexed))
+        return 'updated'
+
+    def print_repo_summary(self, results):
+        """
+        Print a table of recipe locations and what happened to them.
+        results is a dict alias -> result.
+        """
+        named_sources = self.cfg.get_named_recipe_sources()
+        tables.print_table(
+            {'alias': "Name", 'result': "Result", 'source': "Source"},
+            [{'alias': alias, 'result': result, 'source': named_sources.get(alias, DEFAULT_RECIPES.get(alias, '-'))}
+             for alias, result in iteritems(results)],
+            col_order=('alias', 'result', 'source'),
+        )
 
+    def _get_fetch_jobs(self):
+        " Return the number of recipe locations to fetch concurrently "
+        if self.args.jobs is not None:
+            return max(1, self.args.jobs)
+        return max(1, int(self.cfg.get('fetch_jobs', 4)))
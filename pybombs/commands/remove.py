@@ -23,7 +23,6 @@
 from __future__ import print_function
 from pybombs.commands import CommandBase
 from pybombs import package_manager
-from pybombs import recipe
 from pybombs import dep_manager
 from pybombs.pb_exception import PBException
 
@@ -82,6 +81,7 @@ class Remove(CommandBase):
 
     def run(self):
         """ Go, go, go! """
+        self.lock_prefix()
         ### Sanity checks
         for pkg in self.args.packages:
             if not self.is_installed(pkg):
@@ -94,36 +94,23 @@ class Remove(CommandBase):
         ### Remove packages
         for pkg in reversed(dep_tree.serialize()):
             self.log.info("Removing package {0}.".format(pkg))
-            # Uninstall:
-            self.log.debug("Uninstalling.")
-            if not self.pm.uninstall(pkg):
-                self.log.warn("Could not uninstall {0} from prefix.".format(pkg))
-            # Remove entry from inventory:
-            self.log.debug("Removing package from inventory.")
-            self.inventory.remove(pkg)
-            self.inventory.save()
+            with self.prefix.lock.package(pkg):
+                # Uninstall:
+                self.log.debug("Uninstalling.")
+                if not self.pm.uninstall(pkg):
+                    self.log.warn("Could not uninstall {0} from prefix.".format(pkg))
+                # Remove entry from inventory:
+                self.log.debug("Removing package from inventory.")
+                self.inventory.remove(pkg)
+                self.inventory.save()
 
     def get_dependees(self, pkgs):
         """
-        From a list of pkgs, return a list that also includes packages
-        which depend on them.
+        From a list of pkgs, return a list that also includes installed
+        packages which depend on them, directly or indirectly.
         """
         self.log.debug("Resolving dependency list for clean removal.")
-        other_installed_pkgs = [x for x in self.inventory.get_packages() if not x in pkgs]
-        new_pkgs = []
-        for other_installed_pkg in other_installed_pkgs:
-            self.log.trace("Checking if {0} is a dependee...".format(other_installed_pkg))
-            try:
-                deps = recipe.get_recipe(other_installed_pkg).depends or []
-            except PBException:
-                continue
-            for pkg in pkgs:
-                if pkg in deps:
-                    self.log.trace("Yup, it is.")
-                    new_pkgs.append(other_installed_pkg)
-                    break
-        if len(new_pkgs) > 0:
-            pkgs = pkgs + new_pkgs
-            return self.get_dependees(pkgs)
-        return pkgs
-
+        index = dep_manager.DepManager().make_reverse_dep_index(
+            set(self.inventory.get_packages()).union(pkgs)
+        )
+        return pkgs + [x for x in index.get_all_dependees(pkgs) if x not in pkgs]
@@ -0,0 +1,68 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+""" PyBOMBS command: why """
+
+from __future__ import print_function
+from pybombs.commands import CommandBase
+from pybombs import dep_manager
+
+class Why(CommandBase):
+    """ Explain why a package is needed """
+    cmds = {
+        'why': 'Show which installed packages depend on a package',
+    }
+
+    @staticmethod
+    def setup_subparser(parser, cmd=None):
+        """
+        Set up a subparser for 'why'
+        """
+        parser.add_argument(
+                'packages',
+                help="List of packages to explain",
+                nargs='+',
+                metavar='PACKAGES'
+        )
+
+    def __init__(self, cmd, args):
+        CommandBase.__init__(self,
+                cmd, args,
+                load_recipes=True,
+                require_prefix=True,
+        )
+
+    def run(self):
+        """ Go, go, go! """
+        index = dep_manager.DepManager().make_reverse_dep_index(
+            set(self.inventory.get_packages()).union(self.args.packages)
+        )
+        for pkg in self.args.packages:
+            direct = index.get_dependees(pkg)
+            indirect = [x for x in index.get_all_dependees([pkg]) if x not in direct]
+            if not direct:
+                print("Nothing in this prefix depends on {0}.".format(pkg))
+                continue
+            print("Packages that depend on {0}:".format(pkg))
+            print("  Directly:   {0}".format(", ".join(direct)))
+            print("  Indirectly: {0}".format(", ".join(indirect) or "-"))
+            print("Dependency chains:")
+            for path in index.get_dependee_paths(pkg).values():
+                print("  {0}".format(" -> ".join(path)))
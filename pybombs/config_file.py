@@ -21,8 +21,10 @@
 """ Abstraction for config files """
 
 import os
+import re
 from collections import OrderedDict
 from ruamel import yaml
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
 from pybombs.utils import dict_merge
 from pybombs.pb_exception import PBException
 from pybombs.utils import sysutils
@@ -63,22 +65,189 @@ class AbstractYaml(object):
 
 
 
+class OrderedSafeConstructorMixin(object):
+    """
+    Mixin for safe constructors (ruamel.yaml or PyYAML) that turns mappings
+    into plain OrderedDicts, so the order of the file is kept on all
+    Python versions.
+    """
+    def construct_yaml_map(self, node):
+        " Mappings, including merge keys "
+        data = OrderedDict()
+        yield data
+        self.flatten_mapping(node)
+        data.update(self.construct_pairs(node))
+
+    def construct_yaml_omap(self, node):
+        " Files written by older versions of PyBOMBS are !!omaps "
+        data = OrderedDict()
+        yield data
+        for subnode in node.value:
+            data.update(self.construct_pairs(subnode))
+
+def _make_ruamel_loader():
+    """
+    Return a load function that uses ruamel.yaml's safe loader. This uses
+    libyaml if ruamel.yaml was built with it.
+    """
+    from ruamel.yaml.constructor import SafeConstructor
+    class OrderedSafeConstructor(OrderedSafeConstructorMixin, SafeConstructor):
+        " ruamel.yaml flavour "
+        pass
+    OrderedSafeConstructor.add_constructor(
+        u'tag:yaml.org,2002:map', OrderedSafeConstructor.construct_yaml_map)
+    OrderedSafeConstructor.add_constructor(
+        u'tag:yaml.org,2002:omap', OrderedSafeConstructor.construct_yaml_omap)
+    ruamel_yaml = yaml.YAML(typ='safe')
+    ruamel_yaml.Constructor = OrderedSafeConstructor
+    return ruamel_yaml.load
+
+def _make_libyaml_loader():
+    """
+    Return a load function that uses PyYAML's libyaml bindings. PyYAML does
+    YAML 1.1, so the resolvers for bools, ints and floats are replaced by the
+    YAML 1.2 ones that ruamel.yaml uses ('yes' is a string, '0777' is 777).
+    """
+    from yaml.cyaml import CParser
+    from yaml.constructor import SafeConstructor
+    from yaml.resolver import Resolver
+    class OrderedSafeConstructor(OrderedSafeConstructorMixin, SafeConstructor):
+        " PyYAML flavour "
+        def construct_yaml_int(self, node):
+            " YAML 1.2 ints "
+            value = self.construct_scalar(node).replace('_', '')
+            sign = -1 if value[0] == '-' else +1
+            value = value.lstrip('+-')
+            for prefix, base in (('0b', 2), ('0o', 8), ('0x', 16)):
+                if value.startswith(prefix):
+                    return sign * int(value[2:], base)
+            return sign * int(value)
+    for tag, constructor in (
+            (u'tag:yaml.org,2002:map', OrderedSafeConstructor.construct_yaml_map),
+            (u'tag:yaml.org,2002:omap', OrderedSafeConstructor.construct_yaml_omap),
+            (u'tag:yaml.org,2002:int', OrderedSafeConstructor.construct_yaml_int),
+        ):
+        OrderedSafeConstructor.add_constructor(tag, constructor)
+    class Yaml12Resolver(Resolver):
+        " Resolver for the YAML 1.2 core schema "
+        pass
+    yaml11_tags = (
+        u'tag:yaml.org,2002:bool',
+        u'tag:yaml.org,2002:int',
+        u'tag:yaml.org,2002:float',
+        u'tag:yaml.org,2002:value',
+    )
+    Yaml12Resolver.yaml_implicit_resolvers = {
+        first: [(tag, regexp) for tag, regexp in resolvers if tag not in yaml11_tags]
+        for first, resolvers in Resolver.yaml_implicit_resolvers.items()
+    }
+    Yaml12Resolver.add_implicit_resolver(
+        u'tag:yaml.org,2002:bool',
+        re.compile(u'''^(?:true|True|TRUE|false|False|FALSE)$''', re.X),
+        list(u'tTfF'))
+    Yaml12Resolver.add_implicit_resolver(
+        u'tag:yaml.org,2002:float',
+        re.compile(u'''^(?:
+         [-+]?(?:[0-9][0-9_]*)\\.[0-9_]*(?:[eE][-+]?[0-9]+)?
+        |[-+]?(?:[0-9][0-9_]*)(?:[eE][-+]?[0-9]+)
+        |[-+]?\\.[0-9_]+(?:[eE][-+][0-9]+)?
+        |[-+]?\\.(?:inf|Inf|INF)
+        |\\.(?:nan|NaN|NAN))$''', re.X),
+        list(u'-+0123456789.'))
+    Yaml12Resolver.add_implicit_resolver(
+        u'tag:yaml.org,2002:int',
+        re.compile(u'''^(?:[-+]?0b[0-1_]+
+        |[-+]?0o?[0-7_]+
+        |[-+]?[0-9_]+
+        |[-+]?0x[0-9a-fA-F_]+)$''', re.X),
+        list(u'-+0123456789'))
+    class FastLoader(CParser, OrderedSafeConstructor, Yaml12Resolver):
+        " Like yaml.CSafeLoader, but YAML 1.2 and ordered "
+        def __init__(self, stream):
+            CParser.__init__(self, stream)
+            OrderedSafeConstructor.__init__(self)
+            Yaml12Resolver.__init__(self)
+    def load(stream):
+        " Load a single document "
+        loader = FastLoader(stream)
+        try:
+            return loader.get_single_data()
+        finally:
+            loader.dispose()
+    return load
+
+_FAST_LOADER = None
+def get_fast_loader():
+    """
+    Return (name, load function) of the fastest available safe YAML loader.
+    In order of preference, that's ruamel.yaml with libyaml, PyYAML with
+    libyaml, and ruamel.yaml's pure Python safe loader.
+    """
+    global _FAST_LOADER
+    if _FAST_LOADER is None:
+        try:
+            from _ruamel_yaml import CParser # pylint: disable=unused-variable
+            _FAST_LOADER = ('ruamel.yaml (libyaml)', _make_ruamel_loader())
+        except ImportError:
+            try:
+                _FAST_LOADER = ('PyYAML (libyaml)', _make_libyaml_loader())
+            except ImportError:
+                _FAST_LOADER = ('ruamel.yaml (pure Python)', _make_ruamel_loader())
+    return _FAST_LOADER
+
+def to_round_trip(data):
+    """
+    Turn plain dicts and lists into the types ruamel.yaml's round-trip dumper
+    writes as plain YAML (it would write an OrderedDict as !!omap). Data that
+    came from the round-trip loader keeps its comments.
+    """
+    if isinstance(data, CommentedMap):
+        for key, value in data.items():
+            data[key] = to_round_trip(value)
+        return data
+    if isinstance(data, CommentedSeq):
+        for idx, value in enumerate(data):
+            data[idx] = to_round_trip(value)
+        return data
+    if isinstance(data, dict):
+        return CommentedMap((key, to_round_trip(value)) for key, value in data.items())
+    if isinstance(data, (list, tuple)):
+        return CommentedSeq(to_round_trip(value) for value in data)
+    return data
+
+
 class PBConfigFile(object):
     """
     Abstraction layer for our config and other files
+
+    If read_only is True, the file is loaded with the fastest available safe
+    loader and data only contains plain types (OrderedDicts, lists, ...).
+    Missing files are not created. Calling save() or update() switches to
+    round-trip mode; the file gets written, but comments in the original file
+    are lost. Files that users edit by hand should not be opened read-only if
+    they're going to be written.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, read_only=False):
         # Store normalized path, in case someone chdirs after calling the ctor
         self._filename = os.path.abspath(os.path.expanduser(os.path.normpath(filename)))
+        self.read_only = read_only
         self.data = None
-        self.yaml = AbstractYaml()
-        touch_file(filename)
+        self.yaml = None
+        if read_only:
+            if not os.path.isfile(self._filename):
+                self.data = OrderedDict()
+                return
+            _, load = get_fast_loader()
+        else:
+            self.yaml = AbstractYaml()
+            touch_file(filename)
+            load = self.yaml.load
         with open(filename) as fn:
             try:
                 # TODO: Recursively turn this into an OrderedDict, not just at
                 # top level. In a nested dict, some key elements will still be
                 # ruamel.ordereddict.
-                self.data = OrderedDict(self.yaml.load(fn.read()) or {})
+                self.data = OrderedDict(load(fn.read()) or {})
             except (IOError, OSError):
                 self.data = OrderedDict()
             except Exception as e:
@@ -97,6 +266,9 @@ class PBConfigFile(object):
 
     def save(self, newdata=None):
         " Write the contents of the data cache to the file. "
+        if self.read_only:
+            self.read_only = False
+            self.yaml = AbstractYaml()
         if newdata is not None:
             assert isinstance(newdata, dict)
             self.data = newdata
@@ -104,10 +276,38 @@ class PBConfigFile(object):
         if len(fpath):
             sysutils.mkdirp_writable(fpath)
         with open(self._filename, 'w') as fn:
-            self.yaml.dump(self.data, fn)
+            self.yaml.dump(to_round_trip(self.data), fn)
 
     def update(self, newdata):
         " Overwrite the data with newdata recursively. Updates the file. "
         self.data = dict_merge(self.data, newdata)
         self.save()
         return self.data
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    # Benchmark: Load all YAML files in the given directories (e.g. a large
+    # recipe repository) in round-trip and read-only mode.
+    files = [
+        os.path.join(dirname, f)
+        for dirname in sys.argv[1:]
+        for f in sorted(os.listdir(dirname))
+        if os.path.splitext(f)[1] in ('.lwr', '.lwt', '.yml')
+    ]
+    if not files:
+        print("Usage: python -m pybombs.config_file DIR [DIR ...]")
+        sys.exit(1)
+    print("Fast loader: {0}".format(get_fast_loader()[0]))
+    results = {}
+    for mode, read_only in (('round-trip', False), ('read-only', True)):
+        start = time.time()
+        results[mode] = [PBConfigFile(f, read_only=read_only).get() for f in files]
+        print("{0:>10}: {1} files in {2:.3f}s".format(mode, len(files), time.time() - start))
+    mismatches = [
+        f for f, rt_data, ro_data in zip(files, results['round-trip'], results['read-only'])
+        if rt_data != ro_data
+    ]
+    for f in mismatches:
+        print("Different data: {0}".format(f))
@@ -26,8 +26,13 @@ Used as a central cache for all kinds of settings.
 
 import os
 import re
+import time
 import argparse
 from collections import OrderedDict
+try:
+    from types import MappingProxyType
+except ImportError:
+    MappingProxyType = dict # Py2 has no read-only dict views
 from six import iteritems
 
 from pybombs import pb_logging
@@ -35,7 +40,11 @@ from pybombs.pb_exception import PBException
 from pybombs.utils import dict_merge
 from pybombs.utils import sysutils
 from pybombs.config_file import PBConfigFile
+from pybombs.config_snapshot import ConfigSnapshot
+from pybombs.env_cache import SetupEnvCache
+from pybombs.prefix_lock import PrefixLock
 from pybombs import inventory
+from pybombs import build_history
 from pybombs import __version__
 
 def npath(path):
@@ -53,6 +62,8 @@ class PrefixInfo(object):
     env_prefix_var = 'PYBOMBS_PREFIX'
     env_srcdir_var = 'PYBOMBS_PREFIX_SRC'
     inv_file_name = 'inventory.yml'
+    build_history_file_name = 'build_history.json'
+    env_cache_file_name = 'setup_env_cache.json'
     setup_env_key = 'setup_env'
     default_config_info = {
         'prefix_aliases': {},
@@ -75,7 +86,7 @@ class PrefixInfo(object):
     }
 
 
-    def __init__(self, args, cfg_list, select_prefix=None):
+    def __init__(self, args, cfg_list, select_prefix=None, config_snapshot=None):
         self.log = pb_logging.logger.getChild("ConfigManager.PrefixInfo")
         self.prefix_dir = None
         self.prefix_cfg_dir = None
@@ -85,11 +96,16 @@ class PrefixInfo(object):
         self.cfg_file = None
         self.inv_file = None
         self.inventory = None
+        self.lock = None
+        self.build_history = None
         self.recipe_dir = None
         self.target_dir = None
+        self.setup_env = None
+        self.env_cache = None
         self.env = os.environ.copy()
         self.is_virtualenv = False
         self._cfg_info = OrderedDict(self.default_config_info)
+        self._config_snapshot = config_snapshot or ConfigSnapshot(None)
         if select_prefix is not None:
             args.prefix = select_prefix
         # 1) Load the config info
@@ -130,7 +146,7 @@ class PrefixInfo(object):
                 "Prefix configuration file not found: {0}, assuming empty."
                 .format(self.cfg_file))
         else:
-            config_section = PBConfigFile(self.cfg_file).get('config')
+            config_section = self._config_snapshot.get(self.cfg_file, 'config')
             self._cfg_info = self._merge_config_info_from_file(self.cfg_file, self._cfg_info)
         # 4) Find the src dir
         self.src_dir = npath(
@@ -143,6 +159,9 @@ class PrefixInfo(object):
         if not os.path.isfile(self.inv_file):
             self.log.debug("Prefix inventory file not found: {0}".format(self.inv_file))
         self.inventory = inventory.Inventory(inventory_file=self.inv_file)
+        self.lock = PrefixLock(self.prefix_dir, self.prefix_cfg_dir, self.inventory)
+        self.build_history = build_history.BuildHistory(
+            os.path.join(self.prefix_cfg_dir, self.build_history_file_name))
         # 6) Prefix-specific recipes. There's two places for these:
         # - A 'recipes/' subdirectory
         # - Anything declared in the config.yml file inside the prefix
@@ -156,14 +175,24 @@ class PrefixInfo(object):
         self._detect_python_version()
         self._detect_python_path()
         # 8) Load environment
-        # If there's a setup_env option in the current config file, we use that
-        if self.setup_env_key in config_section:
-            self.log.debug(
-                'Loading environment from shell script: {0}'
-                .format(config_section[self.setup_env_key]))
-            self.env = self._load_environ_from_script(config_section[self.setup_env_key])
+        self.setup_env = config_section.get(self.setup_env_key)
+        self.env_cache = SetupEnvCache(os.path.join(self.prefix_cfg_dir, self.env_cache_file_name))
+        self.load_env(refresh=args.refresh)
+        # 9) Keep relevant config sections as attributes
+        self._set_attrs()
+
+    def load_env(self, refresh=False):
+        """
+        Set up the prefix environment (self.env). If there's a setup_env option
+        in the current config file, we use the environment that script creates.
+        That gets cached, so the script is only sourced again if it (or the
+        environment it depends on) changes, or if refresh is True.
+        """
+        if self.setup_env is not None:
+            self.log.debug('Loading environment from shell script: {0}'.format(self.setup_env))
+            self.env = self._load_environ_from_script(self.setup_env, refresh)
         else:
-            self.env = self._load_default_env(self.env)
+            self.env = self._load_default_env(os.environ.copy())
         # Set env vars that we always need
         self.env[self.env_prefix_var] = self.prefix_dir
         self.env[self.env_srcdir_var] = self.src_dir
@@ -173,8 +202,6 @@ class PrefixInfo(object):
         for k, v in iteritems(self._cfg_info['env']):
             self.env[k.upper()] = os.path.expandvars(v.strip())
         os.environ = old_env
-        # 9) Keep relevant config sections as attributes
-        self._set_attrs()
 
     def _set_attrs(self):
         """ Map the _cfg_info dict onto attributes. """
@@ -190,7 +217,7 @@ class PrefixInfo(object):
         """
         try:
             self.log.debug('Inspecting config file: {0}'.format(cfg_file))
-            cfg_data_new = PBConfigFile(cfg_file).get()
+            cfg_data_new = self._config_snapshot.get(cfg_file)
         except Exception:
             self.log.debug('Well, looks like that failed.')
             return cfg_data
@@ -281,16 +308,35 @@ class PrefixInfo(object):
             for x in conservative_guess
         ])
 
-    def _load_environ_from_script(self, setup_env_file):
+    def get_setup_env_file(self, setup_env=None):
         """
-        Run setup_env_file, return the new env
-        FIXME make this portable!
+        Return the path of the setup_env script (default: the one from the
+        prefix config file), with $PYBOMBS_PREFIX replaced.
         """
-        self.log.debug('Loading environment from shell script: {0}'.format(setup_env_file))
+        if setup_env is None:
+            setup_env = self.setup_env
         # It would be nice if we could do os.path.expandvars() with a custom
         # env, wouldn't it
-        setup_env_file = setup_env_file.replace('${0}'.format(self.env_prefix_var), self.prefix_dir)
-        setup_env_file = setup_env_file.replace('${{{0}}}'.format(self.env_prefix_var), self.prefix_dir)
+        setup_env = setup_env.replace('${0}'.format(self.env_prefix_var), self.prefix_dir)
+        setup_env = setup_env.replace('${{{0}}}'.format(self.env_prefix_var), self.prefix_dir)
+        return setup_env
+
+    def _load_environ_from_script(self, setup_env_file, refresh=False):
+        """
+        Run setup_env_file, return the new env. Uses the cached env, if it's
+        still valid and refresh is False.
+        FIXME make this portable!
+        """
+        setup_env_file = self.get_setup_env_file(setup_env_file)
+        env_key = self.env_cache.get_key(setup_env_file, os.environ)
+        if not refresh:
+            env = self.env_cache.get_env(env_key, os.environ)
+            if env is not None:
+                self.log.debug("Using cached environment of {0}".format(setup_env_file))
+                return env
+            self.log.debug("Sourcing {0} ({1})".format(
+                setup_env_file, "; ".join(self.env_cache.get_changes(env_key))))
+        start_time = time.time()
         # TODO add some checks this is a legit script
         # Damn, I hate just running stuff :/
         # TODO unportable command:
@@ -312,6 +358,7 @@ class PrefixInfo(object):
                 continue
             k, v = env_line.split('=', 1)
             env[k] = v
+        self.env_cache.store(env_key, os.environ, env, time.time() - start_time)
         return env
 
     def _load_default_env(self, env):
@@ -346,6 +393,7 @@ class ConfigManager(object):
     """
     global_base_dir = "/etc/pybombs" # TODO we may want to change this
     cfg_file_name = "config.yml"
+    snapshot_file_name = "config_snapshot"
     pybombs_dir = ".pybombs"
     recipe_cache_dir = 'recipes'
 
@@ -358,6 +406,11 @@ class ConfigManager(object):
         ),
         'builddocs': ('ON', 'Build doxygen while compiling packages? options are: ON, OFF'),
         'makewidth': ('4', 'Concurrent make threads [1,2,4,8...]'),
+        'jobs': ('1', 'Number of source packages to build concurrently (splits the makewidth budget)'),
+        'fetch_jobs': ('4', 'Number of source packages to fetch in the background while building (0 disables this)'),
+        'query_jobs': ('8', 'Number of packages to query concurrently (e.g. for `recipes list`)'),
+        'fetch_failure': ('abort', "What to do when fetching sources fails: 'abort', or 'skip' all packages that depend on it"),
+        'lock_timeout': ('0', 'Seconds to wait for a prefix or package another PyBOMBS process has locked (0 waits forever)'),
         # The following line must always list *all* available packagers in order of priority:
         'packagers': ('apt,yumdnf,port,brew,zypper,pacman,portage,pymod,pip,pkgconfig,cmd', 'Priority of non-source package managers'),
         'keep_builddir': ('', 'When rebuilding, default to keeping the build directory'),
@@ -375,17 +428,35 @@ class ConfigManager(object):
     def __init__(self, select_prefix=None):
         ## Get location of module
         self.module_dir = os.path.dirname(pb_logging.__file__)
-        self.load(select_prefix)
+        self._select_prefix = select_prefix
+        self._config_snapshot = None
+        # All layers of cfg_cascade merged into one dict, see get()
+        self._cfg_flat = None
+        # Goes up every time a config value may have changed
+        self.generation = 0
+        self._load_pending = True
+
+    def __getattr__(self, name):
+        """
+        Only called for attributes that don't exist. Until load() was called,
+        that's most of them: The configuration is loaded on first use, so
+        e.g. `pybombs --help` doesn't have to read any config files.
+        """
+        if name.startswith('__') or not self.__dict__.get('_load_pending'):
+            raise AttributeError(name)
+        self.load(self._select_prefix)
         pb_logging.logger.info("PyBOMBS Version %s", __version__)
+        return getattr(self, name)
 
     def load(self, select_prefix=None):
         """
         Load the actual configuration. We put this outside the ctor so we can
         reload on the same object. In that case, anything unsaved is reset!
         """
+        self._load_pending = False
         ## Get command line args:
         parser = argparse.ArgumentParser(add_help=False)
-        self.setup_parser(parser)
+        self.add_global_args(parser)
         args = parser.parse_known_args()[0]
         cfg_files = []
         ## Set verbosity level:
@@ -395,8 +466,24 @@ class ConfigManager(object):
             verb_level = pb_logging.TRACE
         pb_logging.logger.setLevel(verb_level)
         self.yes = args.yes
+        self.refresh = args.refresh
         ## Set up logger:
         self.log = pb_logging.logger.getChild("ConfigManager")
+        # Home directory:
+        self.local_cfg_dir = self.get_pybombs_dir()
+        if not os.path.isdir(self.local_cfg_dir):
+            try:
+                self.log.debug("Creating local config dir {0}".format(self.local_cfg_dir))
+                os.mkdir(self.local_cfg_dir)
+            except (IOError, OSError):
+                self.log.debug("Failed.")
+        self.local_cfg = os.path.join(self.local_cfg_dir, self.cfg_file_name)
+        # Parsed config files are cached here, and reused by later calls to load():
+        if self._config_snapshot is None:
+            self._config_snapshot = ConfigSnapshot(
+                os.path.join(self.local_cfg_dir, self.snapshot_file_name),
+                refresh=self.refresh,
+            )
         ## Setup cfg_cascade:
         # self.cfg_cascade is a list of dicts. The higher the index,
         # the more important the dict.
@@ -407,14 +494,6 @@ class ConfigManager(object):
         if self._append_cfg_from_file(global_cfg):
             cfg_files.insert(0, global_cfg)
         # Home directory:
-        self.local_cfg_dir = self.get_pybombs_dir()
-        if not os.path.isdir(self.local_cfg_dir):
-            try:
-                self.log.debug("Creating local config dir {0}".format(self.local_cfg_dir))
-                os.mkdir(self.local_cfg_dir)
-            except (IOError, OSError):
-                self.log.debug("Failed.")
-        self.local_cfg = os.path.join(self.local_cfg_dir, self.cfg_file_name)
         if self._append_cfg_from_file(self.local_cfg):
             cfg_files.insert(0, self.local_cfg)
         # Current prefix (don't know that yet -- so skip for now)
@@ -436,12 +515,15 @@ class ConfigManager(object):
         self.cfg_cascade.append({})
         # After this, no more dicts should be appended to cfg_cascade.
         assert len(self.cfg_cascade) == self.LAYER_VOLATILE + 1
+        self._invalidate()
         # Find recipe templates:
         self._template_dir = os.path.join(self.module_dir, 'templates')
         self.log.debug("Template directory: {0}".format(self._template_dir))
         ## Init prefix:
-        self._prefix_info = PrefixInfo(args, cfg_files, select_prefix)
+        self._prefix_info = PrefixInfo(args, cfg_files, select_prefix, self._config_snapshot)
         self._config_reference = 'prefix'
+        # (pkgname, categoryname) -> package flags, see get_package_flags()
+        self._package_flags = {}
         # Add the prefix config file (if it exists)
         prefix_config = self._prefix_info.cfg_file
         if prefix_config is not None and os.path.exists(prefix_config):
@@ -469,7 +551,7 @@ class ConfigManager(object):
             self._recipe_locations.append(self._prefix_info.recipe_dir)
         # From config files (from here, recipe locations are named):
         for cfg_file in cfg_files:
-            recipe_locations = PBConfigFile(cfg_file).get('recipes')
+            recipe_locations = self._config_snapshot.get(cfg_file, 'recipes')
             for name, uri in reversed(recipe_locations.items()):
                 local_recipe_dir = self.resolve_recipe_uri(
                     uri, name, os.path.join(os.path.split(cfg_file)[0], 'recipes')
@@ -488,6 +570,7 @@ class ConfigManager(object):
         # version.)
         self.log.info("Prefix Python version is: %s",
                       self._prefix_info.python_ver)
+        self._config_snapshot.save()
 
     def _append_cfg_from_file(self, cfg_filename, index=None):
         """
@@ -498,7 +581,7 @@ class ConfigManager(object):
         """
         self.log.debug("Reading config info from file: {0}".format(cfg_filename))
         try:
-            cfg_data = PBConfigFile(cfg_filename).get()
+            cfg_data = self._config_snapshot.get(cfg_filename)
         except Exception as e:
             self.log.debug("Parsing config file failed ({cfgf}).".format(cfgf=cfg_filename))
             self.cfg_cascade.append({})
@@ -509,8 +592,16 @@ class ConfigManager(object):
             self.cfg_cascade.append(config_items)
         else:
             self.cfg_cascade[index] = config_items
+        self._invalidate()
         return True
 
+    def _invalidate(self):
+        """
+        Call this whenever a layer of cfg_cascade was replaced or modified.
+        """
+        self._cfg_flat = None
+        self.generation += 1
+
     def get_pybombs_dir(self, prefix_dir=None):
         """
         Return the PyBOMBS config directory.
@@ -523,20 +614,16 @@ class ConfigManager(object):
 
     def get(self, key, default=None):
         """ Return the value for a given key. """
-        for set_of_vals in reversed(self.cfg_cascade):
-            if key in set_of_vals.keys():
-                return set_of_vals[key]
+        cfg_flat = self._get_flat()
+        if key in cfg_flat:
+            return cfg_flat[key]
         if default is not None:
             return default
         raise PBException("Invalid configuration key: {0}".format(key))
 
     def keys(self):
         """ Return all currently active config keys """
-        all_keys = set()
-        for set_of_vals in self.cfg_cascade:
-            for key in set_of_vals.keys():
-                all_keys.add(key)
-        return tuple(all_keys)
+        return tuple(self._get_flat().keys())
 
     def set(self, key, value):
         """
@@ -545,6 +632,26 @@ class ConfigManager(object):
         settings.
         """
         self.cfg_cascade[self.LAYER_VOLATILE][key] = value
+        cfg_flat = self._cfg_flat
+        if cfg_flat is not None:
+            # The volatile layer is the top one, so we can patch the merged
+            # view instead of rebuilding it:
+            cfg_flat[key] = value
+        self.generation += 1
+
+    def _get_flat(self):
+        """
+        Return all layers of cfg_cascade merged into one dict (the higher the
+        layer, the more important), so looking up a key doesn't have to walk
+        the cascade. It's rebuilt after _invalidate() was called.
+        """
+        cfg_flat = self._cfg_flat
+        if cfg_flat is None:
+            cfg_flat = {}
+            for set_of_vals in self.cfg_cascade:
+                cfg_flat.update(set_of_vals)
+            self._cfg_flat = cfg_flat
+        return cfg_flat
 
     def get_help(self, key):
         """
@@ -628,11 +735,17 @@ class ConfigManager(object):
 
         If categoryname is provided, it will load the category flags first
         and then merge the package flags on top of it.
+
+        The flags are only merged once per package and category after the
+        config was loaded. The returned dictionary is shared and read-only.
         """
-        return dict_merge(
-            getattr(self._prefix_info, 'categories', {}).get(categoryname, {}),
-            getattr(self._prefix_info, 'packages', {}).get(pkgname, {})
-        )
+        key = (pkgname, categoryname)
+        if key not in self._package_flags:
+            self._package_flags[key] = MappingProxyType(dict_merge(
+                getattr(self._prefix_info, 'categories', {}).get(categoryname, {}),
+                getattr(self._prefix_info, 'packages', {}).get(pkgname, {})
+            ))
+        return self._package_flags[key]
 
     def get_python_version(self):
         """
@@ -683,6 +796,14 @@ class ConfigManager(object):
         Initialize an ArgParser with all the args required for this
         class to operate.
         """
+        self.add_global_args(parser)
+        self.parser = parser
+        return parser
+
+    def add_global_args(self, parser):
+        """
+        Add the global command line options to parser.
+        """
         group = parser.add_argument_group(
             title='General Options',
         )
@@ -737,8 +858,11 @@ class ConfigManager(object):
             help="Answer all questions with 'yes'.",
             action='store_true',
         )
-        self.parser = parser
-        return parser
+        group.add_argument(
+            '--refresh',
+            help="Don't use cached results of packager queries, query the system again.",
+            action='store_true',
+        )
 
 
 # This is what you want to use. Don't instantiate ConfigManager() yourself.
@@ -0,0 +1,139 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Config snapshot: Caches the parsed contents of all config files that go
+into the configuration, so loading the config doesn't have to parse YAML.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from pybombs import pb_logging
+from pybombs.config_file import PBConfigFile
+from pybombs.utils.sysutils import get_file_fingerprint
+
+SNAPSHOT_VERSION = 1
+PICKLE_PROTOCOL = 2 # Readable by Python 2 and 3
+
+class ConfigSnapshot(object):
+    """
+    Parsed contents of config files, stored in a single file. Every entry is
+    keyed by the absolute path of the config file, and is only valid as long
+    as the file's mtime and size don't change.
+
+    If snapshot_file is None, the snapshot is only kept in memory.
+    """
+    def __init__(self, snapshot_file, refresh=False):
+        self.log = pb_logging.logger.getChild("ConfigSnapshot")
+        self.snapshot_file = snapshot_file
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._files = None
+        self._dirty = False
+
+    def get(self, filename, key=None):
+        """
+        Return the contents of config file filename, or only its section key.
+        Works like PBConfigFile(filename, read_only=True).get(key), and also
+        raises the same exceptions if filename can't be parsed. Every call
+        returns a new copy, so the caller may modify it.
+        """
+        filename = os.path.abspath(filename)
+        fingerprint = get_file_fingerprint(filename)
+        data = None
+        if fingerprint is not None:
+            with self._lock:
+                self._load()
+                entry = self._files.get(filename)
+            if entry is not None and entry[0] == fingerprint:
+                data = pickle.loads(entry[1])
+        if data is None:
+            data = PBConfigFile(filename, read_only=True).get()
+            if fingerprint is not None:
+                self._store(filename, fingerprint, data)
+        if key is None:
+            return data
+        return OrderedDict(data.get(key, OrderedDict()))
+
+    def save(self):
+        """
+        Write the snapshot to disk, if anything changed.
+        """
+        with self._lock:
+            if not self._dirty or self.snapshot_file is None:
+                return
+            tmp_filename = "{0}.{1}.tmp".format(self.snapshot_file, os.getpid())
+            try:
+                with open(tmp_filename, 'wb') as snapshot_file:
+                    pickle.dump(
+                        {'version': SNAPSHOT_VERSION, 'files': self._files},
+                        snapshot_file,
+                        PICKLE_PROTOCOL
+                    )
+                os.rename(tmp_filename, self.snapshot_file)
+                self._dirty = False
+            except (IOError, OSError) as ex:
+                self.log.debug("Could not write config snapshot {0}: {1}".format(self.snapshot_file, str(ex)))
+
+    def _store(self, filename, fingerprint, data):
+        " Add the parsed contents of filename "
+        try:
+            pickled_data = pickle.dumps(data, PICKLE_PROTOCOL)
+        except Exception as ex:
+            self.log.debug("Can't store {0} in config snapshot: {1}".format(filename, str(ex)))
+            return
+        with self._lock:
+            self._load()
+            self._files[filename] = (fingerprint, pickled_data)
+            self._dirty = True
+
+    def _load(self):
+        " Load snapshot from disk, unless it's already loaded. Lock must be held. "
+        if self._files is not None:
+            return
+        self._files = {}
+        if self.refresh or self.snapshot_file is None or not os.path.isfile(self.snapshot_file):
+            return
+        try:
+            with open(self.snapshot_file, 'rb') as snapshot_file:
+                data = pickle.load(snapshot_file)
+            if data.get('version') == SNAPSHOT_VERSION:
+                self._files = data['files']
+        except Exception as ex:
+            self.log.debug("Ignoring invalid config snapshot {0}: {1}".format(self.snapshot_file, str(ex)))
+
+# Some test code:
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+    snapshot_filename = os.path.join(tempfile.mkdtemp(), 'config_snapshot')
+    for attempt in ('cold', 'warm'):
+        start = time.time()
+        snapshot = ConfigSnapshot(snapshot_filename)
+        for cfg_filename in sys.argv[1:]:
+            snapshot.get(cfg_filename)
+        snapshot.save()
+        print("{0}: {1:.1f} ms".format(attempt, 1000 * (time.time() - start)))
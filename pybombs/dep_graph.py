@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+" A simple dependency graph object "
+
+from __future__ import print_function
+from collections import OrderedDict, deque
+from pybombs.pb_exception import PBException
+
+class DepGraph(object):
+    """
+    Directed acyclic graph of packages. Every package is stored exactly once,
+    no matter how many other packages depend on it.
+
+    Edges point from a package to its dependencies. Adjacency lists are
+    ordered dicts (used as ordered sets) so that traversals are
+    deterministic.
+    """
+    def __init__(self):
+        # pkg -> OrderedDict of packages that pkg depends on
+        self._deps = OrderedDict()
+        # pkg -> OrderedDict of packages that depend on pkg
+        self._dependees = OrderedDict()
+
+    def __contains__(self, pkg):
+        " Returns True if pkg is in the graph "
+        return pkg in self._deps
+
+    def __len__(self):
+        " Return number of packages in the graph "
+        return len(self._deps)
+
+    def __iter__(self):
+        return iter(self._deps)
+
+    def __str__(self):
+        return "<DepGraph: {0} nodes>".format(len(self))
+
+    def empty(self):
+        " Returns True if this graph has no nodes "
+        return len(self._deps) == 0
+
+    def add_node(self, pkg):
+        " Add pkg to the graph. Does nothing if it's already there. "
+        if pkg not in self._deps:
+            self._deps[pkg] = OrderedDict()
+            self._dependees[pkg] = OrderedDict()
+
+    def add_edge(self, pkg, dep):
+        " Declare that pkg depends on dep. Adds both nodes if necessary. "
+        self.add_node(pkg)
+        self.add_node(dep)
+        self._deps[pkg][dep] = None
+        self._dependees[dep][pkg] = None
+
+    def remove_node(self, pkg):
+        " Remove pkg and all edges to and from it. "
+        for dep in self._deps.pop(pkg):
+            self._dependees[dep].pop(pkg, None)
+        for dependee in self._dependees.pop(pkg):
+            self._deps[dependee].pop(pkg, None)
+
+    def get_deps(self, pkg):
+        " Return the direct dependencies of pkg as a list "
+        return list(self._deps[pkg])
+
+    def get_dependees(self, pkg):
+        " Return the packages that directly depend on pkg as a list "
+        return list(self._dependees[pkg])
+
+    def get_all_dependees(self, pkgs):
+        """
+        Return a list of all packages that directly or indirectly depend on
+        any of the packages in pkgs (not including pkgs themselves), in the
+        order they are found. Packages that are not in the graph are ignored.
+        """
+        visited = set(pkgs)
+        dependees = []
+        to_visit = deque([pkg for pkg in pkgs if pkg in self._dependees])
+        while to_visit:
+            for dependee in self._dependees[to_visit.popleft()]:
+                if dependee not in visited:
+                    visited.add(dependee)
+                    dependees.append(dependee)
+                    to_visit.append(dependee)
+        return dependees
+
+    def get_dependee_paths(self, pkg):
+        """
+        Explain why pkg is needed: Returns a dictionary that maps every
+        package which depends on pkg, and which nothing else depends on, to
+        the shortest dependency chain from there to pkg, e.g.
+        {'gr-foo': ['gr-foo', 'gnuradio', 'boost']} for pkg == 'boost'.
+        """
+        if pkg not in self._dependees:
+            return OrderedDict()
+        parent = {pkg: None}
+        to_visit = deque([pkg])
+        tops = []
+        while to_visit:
+            this_pkg = to_visit.popleft()
+            if not self._dependees[this_pkg] and this_pkg != pkg:
+                tops.append(this_pkg)
+            for dependee in self._dependees[this_pkg]:
+                if dependee not in parent:
+                    parent[dependee] = this_pkg
+                    to_visit.append(dependee)
+        paths = OrderedDict()
+        for top in tops:
+            paths[top] = [top]
+            while parent[paths[top][-1]] is not None:
+                paths[top].append(parent[paths[top][-1]])
+        return paths
+
+    def get_roots(self):
+        " Return all packages nothing else in the graph depends on "
+        return [pkg for pkg, dependees in self._dependees.items() if not dependees]
+
+    def get_values(self):
+        " Return all node values as a list "
+        return list(self._deps)
+
+    def pretty_print(self, lead=''):
+        " Pretty-prints the graph to stdout, as a tree starting at the roots. "
+        def _print_children(children, lead):
+            " Print one level of the tree "
+            lead_char = '|'
+            for idx, child in enumerate(children):
+                if idx == len(children) - 1:
+                    lead_char = ' '
+                print(lead + '|')
+                print("{0}{1}- {2}".format(lead, '\\' if idx == len(children)-1 else '+', str(child)))
+                _print_children(self.get_deps(child), lead + lead_char + '  ')
+        _print_children(self.get_roots(), lead)
+
+    def print_plan(self, lead=''):
+        " Prints the topological levels and the critical path to stdout. "
+        print("{0}Install levels (packages within a level are independent):".format(lead))
+        for idx, level in enumerate(self.get_levels()):
+            print("{0}  Level {1}: {2}".format(lead, idx, ", ".join(level)))
+        critical_path, length = self.get_critical_path()
+        print("{0}Critical path ({1} packages): {2}".format(lead, length, " -> ".join(critical_path)))
+
+    def find_cycle(self):
+        """
+        Returns a list of packages that depend on each other in a circle,
+        starting and ending with the same package (e.g. ['a', 'b', 'a'] if
+        a depends on b and b depends on a), or None if there is no cycle.
+        """
+        unvisited, in_progress, done = 0, 1, 2
+        state = {pkg: unvisited for pkg in self._deps}
+        for start in self._deps:
+            if state[start] != unvisited:
+                continue
+            state[start] = in_progress
+            path = [start]
+            iter_stack = [iter(self._deps[start])]
+            while iter_stack:
+                for dep in iter_stack[-1]:
+                    if state[dep] == in_progress:
+                        return path[path.index(dep):] + [dep]
+                    if state[dep] == unvisited:
+                        state[dep] = in_progress
+                        path.append(dep)
+                        iter_stack.append(iter(self._deps[dep]))
+                        break
+                else:
+                    state[path.pop()] = done
+                    iter_stack.pop()
+        return None
+
+    def assert_acyclic(self):
+        " Raises a PBException naming the offending packages if there's a cycle. "
+        cycle = self.find_cycle()
+        if cycle is not None:
+            raise PBException("Circular dependency: {0}".format(" -> ".join(cycle)))
+
+    def get_levels(self):
+        """
+        Returns the packages grouped into topological levels, as a list of
+        lists. Level 0 holds all packages that have no dependencies inside
+        the graph, and every package in level n depends on at least one
+        package in level n-1. Packages within one level can be built at the
+        same time.
+        """
+        level = {}
+        levels = []
+        for pkg in self.serialize():
+            level[pkg] = 1 + max([level[dep] for dep in self._deps[pkg]] or [-1])
+            if level[pkg] == len(levels):
+                levels.append([])
+            levels[level[pkg]].append(pkg)
+        return levels
+
+    def get_critical_path(self, weight=None):
+        """
+        Returns the longest dependency chain in the graph, which is the lower
+        limit for the total build time no matter how many packages are built
+        in parallel.
+
+        - weight: Function that returns the cost of a package (e.g. its
+          build time). Defaults to 1 for every package.
+
+        Returns a tuple (path, length), where path is a list of packages
+        starting at the leaf, and length is the sum of their weights.
+        """
+        weight = weight or (lambda pkg: 1)
+        order = self.serialize()
+        cost = {}
+        prev = {}
+        for pkg in order:
+            prev[pkg] = None
+            for dep in self._deps[pkg]:
+                if prev[pkg] is None or cost[dep] > cost[prev[pkg]]:
+                    prev[pkg] = dep
+            cost[pkg] = weight(pkg) + (cost[prev[pkg]] if prev[pkg] is not None else 0)
+        if not order:
+            return [], 0
+        pkg = max(order, key=lambda x: cost[x])
+        length = cost[pkg]
+        path = []
+        while pkg is not None:
+            path.append(pkg)
+            pkg = prev[pkg]
+        return list(reversed(path)), length
+
+    def serialize(self):
+        """
+        Returns the packages in topological order, starting at the leaf
+        nodes (i.e., every package comes after all of its dependencies).
+
+        Runs in O(V+E). Raises a PBException naming the offending packages if
+        the graph has a cycle.
+        """
+        in_degree = {pkg: len(deps) for pkg, deps in self._deps.items()}
+        ready = deque(pkg for pkg, degree in in_degree.items() if degree == 0)
+        serialized_graph = []
+        while ready:
+            pkg = ready.popleft()
+            serialized_graph.append(pkg)
+            for dependee in self._dependees[pkg]:
+                in_degree[dependee] -= 1
+                if in_degree[dependee] == 0:
+                    ready.append(dependee)
+        if len(serialized_graph) != len(self._deps):
+            self.assert_acyclic()
+        return serialized_graph
+
+
+if __name__ == "__main__":
+    graph = DepGraph()
+    graph.add_node('foo')
+    print('foo' in graph)
+    graph.add_edge('foo', 'bar')
+    graph.add_edge('bar', 'bam')
+    graph.add_edge('foo', 'bam')
+    graph.add_node('baz')
+    print('baz' in graph)
+    print('boom' in graph)
+    print(graph.get_values())
+    print(len(graph))
+    graph.pretty_print()
+    print(graph.serialize())
+    graph.print_plan()
+    graph.add_edge('bam', 'foo')
+    print(graph.find_cycle())
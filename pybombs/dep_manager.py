@@ -20,14 +20,16 @@
 #
 """ PyBOMBS dependency manager """
 
-import copy
-from pybombs.tree_node import TreeNode
+from pybombs.dep_graph import DepGraph
 from pybombs import package_manager
 from pybombs import config_manager
 from pybombs import pb_logging
 from pybombs import recipe
 from pybombs.pb_exception import PBException
 
+# Reverse dependency indexes, by set of packages
+_REVERSE_DEP_INDEX_CACHE = {}
+
 class DepManager(object):
     """
     Dependency manager.
@@ -38,44 +40,85 @@ class DepManager(object):
 
     def make_dep_tree(self, pkg_list, filter_callback):
         """
+        Return a DepGraph with all the packages in pkg_list, and all of their
+        dependencies, that need to go into the tree.
+
         - pkg_list: List of package names.
         - filter_callback: Function that takes a package name
           and returns True if the package should go into the tree.
+          It is called at most once per package.
+        """
+        filter_cache = {}
+        def _cached_filter_callback(pkg):
+            " Only ask filter_callback once per package "
+            if pkg not in filter_cache:
+                filter_cache[pkg] = filter_callback(pkg)
+            return filter_cache[pkg]
+        dep_graph = DepGraph()
+        for pkg in pkg_list:
+            if pkg not in dep_graph and _cached_filter_callback(pkg):
+                self.make_tree_recursive(pkg, _cached_filter_callback, dep_graph)
+        cycle = dep_graph.find_cycle()
+        if cycle is not None:
+            self.log.error("Circular dependency: {0}".format(" -> ".join(cycle)))
+            raise PBException("Dependency graph has a cycle.")
+        return dep_graph
+
+    def make_reverse_dep_index(self, packages):
         """
-        # - all of pkg_list goes into a set P
-        # - init an empty dict D
-        # - for every element p of P:
-        #   - create a full dep tree T
-        #   - D[p] -> T
-        #   - for every element q of P\p:
-        #     - if q is in T, then P <- P\q and del(D[q]) if exists
-        # - merge all elements of D into T' and return that
-        pkg_set = set([pkg for pkg in pkg_list if filter_callback(pkg)])
-        new_pkg_set = copy.copy(pkg_set)
-        dep_trees = {}
-        for pkg in pkg_set:
-            dep_trees[pkg] = self.make_tree_recursive(pkg, filter_callback)
-            assert dep_trees[pkg] is not None
-            for other_pkg in new_pkg_set.difference([pkg]):
-                if other_pkg in dep_trees[pkg]:
-                    new_pkg_set.remove(other_pkg)
-        install_tree = TreeNode()
-        for pkg in new_pkg_set:
-            install_tree.add_child(dep_trees[pkg])
-        return install_tree
+        Return a DepGraph that contains all of packages, and has an edge for
+        every direct dependency between two of them. Use its dependee methods
+        (e.g. get_all_dependees()) to find out what depends on a package.
 
-    def make_tree_recursive(self, pkg, filter_callback):
+        Every recipe is loaded only once, and the index is only built once
+        per set of packages. Packages without a recipe are added without
+        edges. The index may contain cycles.
         """
-        Make a dependency tree for one package.
+        index_key = frozenset(packages)
+        if index_key in _REVERSE_DEP_INDEX_CACHE:
+            return _REVERSE_DEP_INDEX_CACHE[index_key]
+        self.log.debug("Building reverse dependency index for {0} packages.".format(len(index_key)))
+        index = DepGraph()
+        for pkg in sorted(index_key):
+            index.add_node(pkg)
+            rec = recipe.get_recipe(pkg, fail_easy=True)
+            if rec is None:
+                self.log.trace("No recipe for {0}, assuming no dependencies.".format(pkg))
+                continue
+            for dep in rec.depends or []:
+                if dep in index_key:
+                    index.add_edge(pkg, dep)
+        _REVERSE_DEP_INDEX_CACHE[index_key] = index
+        return index
+
+    def make_tree_recursive(self, pkg, filter_callback, dep_graph=None):
+        """
+        Add one package and its dependencies to a dependency graph, and
+        return that graph. If dep_graph is None, a new one is created.
 
         Assumption is that pkg actually needs to go into the tree, it will
-        not get checked by filter_callback again.
+        not get checked by filter_callback again. Packages that are already
+        in dep_graph are not expanded a second time.
+
+        Despite the name, this uses an explicit stack instead of recursion,
+        so deep dependency chains can't overflow the Python stack. The
+        resulting graph may contain cycles, see DepGraph.find_cycle().
         """
         assert pkg is not None
-        tree = TreeNode(pkg)
-        all_deps = recipe.get_recipe(pkg).depends or []
-        deps_to_install = set([dep for dep in all_deps if filter_callback(dep)])
-        for dep in deps_to_install:
-            tree.add_child(self.make_tree_recursive(dep, filter_callback))
-        return tree
-
+        if dep_graph is None:
+            dep_graph = DepGraph()
+        dep_graph.add_node(pkg)
+        # Stack of (package, iterator over its remaining dependencies)
+        stack = [(pkg, iter(recipe.get_recipe(pkg).depends or []))]
+        while stack:
+            this_pkg, deps_iter = stack[-1]
+            for dep in deps_iter:
+                if dep in dep_graph:
+                    dep_graph.add_edge(this_pkg, dep)
+                elif filter_callback(dep):
+                    dep_graph.add_edge(this_pkg, dep)
+                    stack.append((dep, iter(recipe.get_recipe(dep).depends or [])))
+                    break
+            else:
+                stack.pop()
+        return dep_graph
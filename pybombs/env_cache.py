@@ -0,0 +1,218 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Cache for the environment of setup_env scripts
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from pybombs import pb_logging
+
+ENV_CACHE_VERSION = 1
+# Parent environment variables that are always part of the cache key, on top
+# of the ones the scripts refer to
+KEY_ENV_VARS = ('HOME', 'PATH')
+MAX_SOURCE_DEPTH = 10
+
+SOURCE_RE = re.compile(r'''^\s*(?:source|\.)\s+(["']?)([^\s;&|"']+)\1''')
+ASSIGN_RE = re.compile(r'''^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)=(["']?)([^\s;&|"']*)\2\s*(?:;|$)''')
+ENV_VAR_RE = re.compile(r'\$\{?([A-Za-z_][A-Za-z0-9_]*)\}?')
+
+def get_file_hash(filename):
+    """
+    Return the SHA1 of the contents of filename, or None if it can't be read.
+    """
+    try:
+        with open(filename, 'rb') as script_file:
+            return hashlib.sha1(script_file.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+def get_script_deps(script_file, env):
+    """
+    Return (files, var_names): All the files that script_file sources, as far
+    as we can tell from looking at them (including script_file itself, and
+    anything those files source), and the names of all environment variables
+    they refer to.
+
+    Paths of sourced files are expanded using env, and simple variable
+    assignments (FOO=bar, export FOO=$BAR/baz) in the scripts.
+    """
+    env = dict(env)
+    def _expand(value):
+        " Like os.path.expandvars(), but with env "
+        return ENV_VAR_RE.sub(lambda m: env.get(m.group(1), m.group(0)), value)
+    files = []
+    var_names = set()
+    def _scan(filename, depth):
+        " Scan one script, in the order the shell would run it "
+        filename = os.path.abspath(os.path.expanduser(filename))
+        if filename in files:
+            return
+        files.append(filename)
+        try:
+            with open(filename) as script:
+                lines = script.readlines()
+        except (IOError, OSError, UnicodeDecodeError):
+            return
+        for line in lines:
+            var_names.update(ENV_VAR_RE.findall(line))
+            assignment = ASSIGN_RE.match(line)
+            if assignment:
+                env[assignment.group(1)] = _expand(assignment.group(3))
+                continue
+            source = SOURCE_RE.match(line)
+            if source and depth < MAX_SOURCE_DEPTH:
+                _scan(_expand(source.group(2)), depth + 1)
+    _scan(script_file, 0)
+    return files, var_names
+
+class SetupEnvCache(object):
+    """
+    Stores the environment a setup_env script creates, so it doesn't have to
+    be sourced every time PyBOMBS runs. We store what the script changes
+    (set and unset variables) rather than the full environment, and apply
+    that to the current environment.
+
+    The cache is valid as long as the key doesn't change. The key consists of
+    the hashes of the script and of every file it sources, and the values of
+    all the parent environment variables they refer to (see get_key()).
+    """
+    def __init__(self, cache_file):
+        self.log = pb_logging.logger.getChild("SetupEnvCache")
+        self.cache_file = cache_file
+        self._data = None
+
+    def get_key(self, script_file, parent_env):
+        """
+        Return the cache key for script_file, or None if it's not a file we
+        can read (then, it can't be cached).
+        """
+        if not os.path.isfile(script_file):
+            return None
+        files, var_names = get_script_deps(script_file, parent_env)
+        return {
+            'script': os.path.abspath(script_file),
+            'files': [[filename, get_file_hash(filename)] for filename in files],
+            'env': {k: parent_env.get(k) for k in sorted(var_names.union(KEY_ENV_VARS))},
+        }
+
+    def get_env(self, key, parent_env):
+        """
+        Return the environment for key, based on parent_env, or None if the
+        cache doesn't have it.
+        """
+        self._load()
+        if key is None or self._data.get('key') != key:
+            return None
+        env = dict(parent_env)
+        env.update(self._data['changed'])
+        for var_name in self._data['removed']:
+            env.pop(var_name, None)
+        return env
+
+    def store(self, key, parent_env, env, duration=None):
+        """
+        Store the environment env, which the script created from parent_env.
+        """
+        if key is None:
+            return
+        self._data = {
+            'version': ENV_CACHE_VERSION,
+            'key': key,
+            'time': time.time(),
+            'duration': duration,
+            'changed': {k: v for k, v in env.items() if parent_env.get(k) != v},
+            'removed': sorted(k for k in parent_env if k not in env),
+        }
+        tmp_filename = "{0}.{1}.tmp".format(self.cache_file, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.cache_file)):
+                os.makedirs(os.path.dirname(self.cache_file))
+            with open(tmp_filename, 'w') as cache_file:
+                json.dump(self._data, cache_file, indent=1, sort_keys=True)
+            os.rename(tmp_filename, self.cache_file)
+        except (IOError, OSError) as ex:
+            self.log.debug("Could not write environment cache {0}: {1}".format(self.cache_file, str(ex)))
+
+    def get_info(self):
+        """
+        Return the cache contents (key, time, duration, changed and removed
+        variables), or None if there's nothing cached.
+        """
+        self._load()
+        return self._data or None
+
+    def get_changes(self, key):
+        """
+        Return a list of reasons why key doesn't match the cached one (empty
+        if it does).
+        """
+        self._load()
+        if not self._data:
+            return ["Nothing cached"]
+        if key is None:
+            return ["Script can't be cached"]
+        old_key = self._data['key']
+        if old_key['script'] != key['script']:
+            return ["Script changed from {0}".format(old_key['script'])]
+        changes = []
+        old_files = dict(old_key['files'])
+        new_files = dict(key['files'])
+        for filename, file_hash in key['files']:
+            if filename not in old_files:
+                changes.append("New file: {0}".format(filename))
+            elif old_files[filename] != file_hash:
+                changes.append("File changed: {0}".format(filename))
+        changes += ["File not sourced anymore: {0}".format(f) for f in old_files if f not in new_files]
+        for var_name in sorted(set(key['env']).union(old_key['env'])):
+            if key['env'].get(var_name) != old_key['env'].get(var_name):
+                changes.append("Variable changed: {0}".format(var_name))
+        return changes
+
+    def _load(self):
+        " Load the cache file, unless it's already loaded. "
+        if self._data is not None:
+            return
+        self._data = {}
+        if not os.path.isfile(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as cache_file:
+                data = json.load(cache_file)
+            if data.get('version') == ENV_CACHE_VERSION:
+                self._data = data
+        except (IOError, OSError, ValueError, AttributeError) as ex:
+            self.log.debug("Ignoring invalid environment cache {0}: {1}".format(self.cache_file, str(ex)))
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    cache = SetupEnvCache(os.path.join(tempfile.mkdtemp(), 'setup_env_cache.json'))
+    cache_key = cache.get_key(sys.argv[1], os.environ)
+    print(json.dumps(cache_key, indent=1))
+    print(cache.get_changes(cache_key))
+    cache.store(cache_key, os.environ, dict(os.environ, FOO='bar'))
+    print(cache.get_changes(cache_key))
+    print(cache.get_env(cache_key, os.environ).get('FOO'))
@@ -0,0 +1,178 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+""" Fetches sources in the background while other packages are building """
+
+import threading
+from collections import deque
+from pybombs import pb_logging
+from pybombs import recipe
+from pybombs.config_manager import config_manager
+from pybombs.pb_exception import PBException
+
+POLL_INTERVAL = 0.5 # s
+
+# What to do when a fetch fails:
+POLICY_ABORT = 'abort' # Don't fetch anything else, the install fails
+POLICY_SKIP = 'skip' # Skip everything that depends on the failed package
+POLICIES = (POLICY_ABORT, POLICY_SKIP)
+
+# Fetch states
+FETCH_OK = 'ok'
+FETCH_FAILED = 'failed'
+FETCH_SKIPPED = 'skipped'
+FETCH_CANCELLED = 'cancelled'
+
+_background = threading.local()
+
+def in_background_fetch():
+    """
+    Return True if called from one of the FetchPipeline's fetch threads.
+    Fetchers use this to keep progress output from garbling the terminal.
+    """
+    return getattr(_background, 'active', False)
+
+class FetchPipeline(object):
+    """
+    Fetches the sources of a list of packages using up to `jobs' background
+    threads, so downloads are off the critical path of the build. Packages
+    are fetched in the order given, which should be the build order.
+
+    Builds call wait() to block on the fetch of their own package only.
+    """
+    def __init__(self, dep_graph, packages, jobs=None, policy=None):
+        self.log = pb_logging.logger.getChild("FetchPipeline")
+        self.dep_graph = dep_graph
+        self.jobs = int(config_manager.get('fetch_jobs', 4) if jobs is None else jobs)
+        self.policy = policy or config_manager.get('fetch_failure', POLICY_ABORT)
+        if self.policy not in POLICIES:
+            raise PBException("Invalid fetch failure policy: {0} (must be one of: {1})".format(
+                self.policy, ", ".join(POLICIES)
+            ))
+        if self.jobs < 1:
+            packages = []
+        self._lock = threading.Lock()
+        self._pending = deque(packages)
+        self._done = {pkg: threading.Event() for pkg in packages}
+        self._state = {}
+        self._stopped = False
+        self._workers = []
+        # pkg -> package whose failed fetch caused pkg to be skipped
+        self.skipped = {}
+        # Packages that failed to fetch, in the order they failed
+        self.failed = []
+
+    def start(self):
+        " Start the background fetches "
+        if not self._pending:
+            return
+        self.log.debug("Fetching {0} package(s) in the background".format(len(self._pending)))
+        for _ in range(min(self.jobs, len(self._pending))):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            self._workers.append(worker)
+            worker.start()
+
+    def stop(self):
+        """
+        Cancel all fetches that have not yet started, and wait for the
+        running ones to finish.
+        """
+        with self._lock:
+            self._stopped = True
+            while self._pending:
+                self._set_state(self._pending.popleft(), FETCH_CANCELLED)
+        for worker in self._workers:
+            worker.join()
+
+    def wait(self, pkg):
+        """
+        Block until pkg is fetched. Returns True if it was fetched, or if the
+        pipeline is not fetching pkg, in which case the build has to fetch it
+        itself. Returns False if the fetch failed, or if pkg is skipped
+        because one of its dependencies failed to fetch.
+        """
+        event = self._done.get(pkg)
+        if event is not None:
+            while not event.wait(POLL_INTERVAL):
+                pass
+        with self._lock:
+            if pkg in self.skipped:
+                return False
+            return self._state.get(pkg, FETCH_OK) == FETCH_OK
+
+    def _set_state(self, pkg, state):
+        " Record the final fetch state of pkg. Lock must be held. "
+        if pkg in self._state:
+            return
+        self._state[pkg] = state
+        self._done[pkg].set()
+
+    def _worker(self):
+        " Thread function: Fetch packages until there's nothing left to do "
+        _background.active = True
+        while True:
+            with self._lock:
+                if self._stopped or not self._pending:
+                    return
+                pkg = self._pending.popleft()
+                if pkg in self._state:
+                    continue
+            success = self._fetch(pkg)
+            with self._lock:
+                if success:
+                    self._set_state(pkg, FETCH_OK)
+                else:
+                    self.failed.append(pkg)
+                    self._handle_failure(pkg)
+                    self._set_state(pkg, FETCH_FAILED)
+
+    def _fetch(self, pkg):
+        " Fetch a single package, return True on success "
+        from pybombs.fetcher import Fetcher
+        self.log.info("Fetching package: {0}".format(pkg))
+        try:
+            Fetcher().fetch(recipe.get_recipe(pkg))
+            self.log.debug("Fetch successful: {0}".format(pkg))
+            return True
+        except PBException as ex:
+            self.log.error("Unable to fetch package {0}: {1}".format(pkg, str(ex)))
+        except Exception as ex:
+            self.log.error("Unexpected error while fetching {0}: {1}".format(pkg, str(ex)))
+        return False
+
+    def _handle_failure(self, pkg):
+        " Apply the failure policy after pkg failed to fetch. Lock must be held. "
+        if self.policy == POLICY_ABORT:
+            self._stopped = True
+            while self._pending:
+                self._set_state(self._pending.popleft(), FETCH_CANCELLED)
+            return
+        # POLICY_SKIP: Everything that depends on pkg is skipped
+        self.skipped[pkg] = pkg
+        to_visit = deque(self.dep_graph.get_dependees(pkg))
+        while to_visit:
+            dependee = to_visit.popleft()
+            if dependee in self.skipped:
+                continue
+            self.skipped[dependee] = pkg
+            if dependee in self._done:
+                self._set_state(dependee, FETCH_SKIPPED)
+            to_visit.extend(self.dep_graph.get_dependees(dependee))
@@ -65,14 +65,10 @@ class Fetcher(object):
         - args: Additional args to pass to the actual fetcher
         """
         (fetcher, url) = self.get_fetcher(src)
-        cwd = os.getcwd()
         if not os.path.isdir(dest):
             os.mkdir(dest)
-        os.chdir(dest)
         fetcher.assert_requirements()
-        result = fetcher.fetch_url(url, dest, dirname, args)
-        os.chdir(cwd)
-        return result
+        return fetcher.fetch_url(url, dest, dirname, args)
 
     def update_src(self, src, dest, dirname, args=None):
         """
@@ -82,56 +78,51 @@ class Fetcher(object):
         - args: Additional args to pass to the actual fetcher
         """
         (fetcher, url) = self.get_fetcher(src)
-        cwd = os.getcwd()
-        os.chdir(dest)
         fetcher.assert_requirements()
-        result = fetcher.update_src(url, dest, dirname, args)
-        os.chdir(cwd)
-        return result
+        return fetcher.update_src(url, dest, dirname, args)
 
     def fetch(self, recipe):
         """
         Fetch a package identified by its recipe into the current prefix.
         If a package was already fetched, do nothing.
 
+        Does not change the current working directory, so fetches of
+        different packages may run in parallel.
+
         Contract:
         - Will either raise PBException or the fetch was successful.
         """
-        self.log.debug("Fetching source for recipe: {0}".format(recipe.id))
-        if self.check_fetched(recipe):
-            self.log.info("Already fetched: {0}".format(recipe.id))
-            return True
-        # Jump to the src directory
-        cwd = os.getcwd()
-        self.log.debug("Switching to src directory: {0}".format(self.src_dir))
-        if not os.path.isdir(self.src_dir):
-            os.mkdir(self.src_dir)
-        os.chdir(self.src_dir)
-        if os.path.exists(os.path.join(self.src_dir, recipe.id)):
-            raise PBException(
-                "Directory {d} already exists!".format(d=os.path.join(self.src_dir, recipe.id))
-            )
-        # Do the fetch
-        for src in recipe.source:
-            src = recipe.var_replace_all(src)
-            self.log.trace("Trying to fetch {0}".format(src))
-            try:
-                if self.fetch_url(src, self.src_dir, recipe.id, recipe.get_dict()):
-                    self.log.trace("Success.")
-                    self.inventory.set_key(recipe.id, 'source', src)
-                    if self.inventory.get_state(recipe.id) < self.inventory.STATE_FETCHED:
-                        self.inventory.set_state(recipe.id, self.inventory.STATE_FETCHED)
-                    self.inventory.save()
-                    os.chdir(cwd)
-                    return True
-            except PBException as ex:
-                self.log.debug("That didn't work.")
-                self.log.debug(str(ex))
-            except Exception as ex:
-                self.log.error("Unexpected error while fetching {0}.".format(src))
-                self.log.error(ex)
-        # Ideally, we've left the function at this point.
-        raise PBException("Unable to fetch recipe {0}".format(recipe.id))
+        with self.prefix.lock.package(recipe.id):
+            self.log.debug("Fetching source for recipe: {0}".format(recipe.id))
+            if self.check_fetched(recipe):
+                self.log.info("Already fetched: {0}".format(recipe.id))
+                return True
+            if not os.path.isdir(self.src_dir):
+                os.mkdir(self.src_dir)
+            if os.path.exists(os.path.join(self.src_dir, recipe.id)):
+                raise PBException(
+                    "Directory {d} already exists!".format(d=os.path.join(self.src_dir, recipe.id))
+                )
+            # Do the fetch
+            for src in recipe.source:
+                src = recipe.var_replace_all(src)
+                self.log.trace("Trying to fetch {0}".format(src))
+                try:
+                    if self.fetch_url(src, self.src_dir, recipe.id, recipe.get_dict()):
+                        self.log.trace("Success.")
+                        self.inventory.set_key(recipe.id, 'source', src)
+                        if self.inventory.get_state(recipe.id) < self.inventory.STATE_FETCHED:
+                            self.inventory.set_state(recipe.id, self.inventory.STATE_FETCHED)
+                        self.inventory.save()
+                        return True
+                except PBException as ex:
+                    self.log.debug("That didn't work.")
+                    self.log.debug(str(ex))
+                except Exception as ex:
+                    self.log.error("Unexpected error while fetching {0}.".format(src))
+                    self.log.error(ex)
+            # Ideally, we've left the function at this point.
+            raise PBException("Unable to fetch recipe {0}".format(recipe.id))
 
     def refetch(self, recipe):
         """
@@ -139,63 +130,60 @@ class Fetcher(object):
         the dir and do a new fetch. Returns the fetch result.
         Note this usually nukes the build directory, too.
         """
-        dst_dir = os.path.join(self.src_dir, recipe.id)
-        if os.path.isdir(dst_dir):
-            self.log.debug("refetch(): Found existing directory {0}. Nuking that.".format(dst_dir))
-            shutil.rmtree(dst_dir, ignore_errors=True)
+        with self.prefix.lock.package(recipe.id):
+            dst_dir = os.path.join(self.src_dir, recipe.id)
             if os.path.isdir(dst_dir):
-                raise PBException("Can't nuke existing directory {0}".format(dst_dir))
-        res = self.fetch(recipe)
-        if res:
-            # Fetch may not set state to fetched, but here we have to.
-            self.inventory.set_state(recipe.id, self.inventory.STATE_FETCHED)
-            self.inventory.save()
-        return res
+                self.log.debug("refetch(): Found existing directory {0}. Nuking that.".format(dst_dir))
+                shutil.rmtree(dst_dir, ignore_errors=True)
+                if os.path.isdir(dst_dir):
+                    raise PBException("Can't nuke existing directory {0}".format(dst_dir))
+            res = self.fetch(recipe)
+            if res:
+                # Fetch may not set state to fetched, but here we have to.
+                self.inventory.set_state(recipe.id, self.inventory.STATE_FETCHED)
+                self.inventory.save()
+            return res
 
     def update(self, recipe):
         """
         Try to softly update the source directory.
         This means the build dir might actually survive.
         """
-        self.log.debug("Updating source for recipe: {0}".format(recipe.id))
-        if not self.check_fetched(recipe):
-            self.log.error("Cannot update recipe {r}, it is not yet fetched.".format(r=recipe.id))
-            return False
-        # Jump to the src directory
-        cwd = os.getcwd()
-        self.log.debug("Switching to src directory: {0}".format(self.src_dir))
-        os.chdir(self.src_dir)
-        if not os.path.isdir(os.path.join(self.src_dir, recipe.id)):
-            raise PBException("Source directory {d} does not exist!!".format(
-                d=os.path.join(self.src_dir, recipe.id)
-            ))
-        # Figure out which source was used before
-        src = self.inventory.get_key(recipe.id, 'source')
-        if not src:
-            raise PBException("Cannot establish prior source for package {p}".format(p=recipe.id))
-        # Do the update
-        self.log.trace("Trying to update from {0}".format(src))
-        try:
-            if self.update_src(src, self.src_dir, recipe.id, recipe.get_dict()):
-                self.log.trace("Update successful.")
-                if self.inventory.get_state(recipe.id) >= self.inventory.STATE_CONFIGURED:
-                    self.log.trace("Setting package state to 'configured'.")
-                    self.inventory.set_state(recipe.id, self.inventory.STATE_CONFIGURED)
-                else:
-                    self.log.trace("Setting package state to 'fetched'.")
-                    self.inventory.set_state(recipe.id, self.inventory.STATE_FETCHED)
-                self.inventory.save()
-                os.chdir(cwd)
-                self.log.trace("Update completed.")
-                return True
-        except PBException as ex:
-            self.log.debug("That didn't work.")
-            self.log.debug(str(ex))
-        except Exception as ex:
-            self.log.error("Unexpected error while fetching {0}.".format(src))
-            self.log.error(ex)
-        # Ideally, we've left the function at this point.
-        raise PBException("Unable to update recipe {0}".format(recipe.id))
+        with self.prefix.lock.package(recipe.id):
+            self.log.debug("Updating source for recipe: {0}".format(recipe.id))
+            if not self.check_fetched(recipe):
+                self.log.error("Cannot update recipe {r}, it is not yet fetched.".format(r=recipe.id))
+                return False
+            if not os.path.isdir(os.path.join(self.src_dir, recipe.id)):
+                raise PBException("Source directory {d} does not exist!!".format(
+                    d=os.path.join(self.src_dir, recipe.id)
+                ))
+            # Figure out which source was used before
+            src = self.inventory.get_key(recipe.id, 'source')
+            if not src:
+                raise PBException("Cannot establish prior source for package {p}".format(p=recipe.id))
+            # Do the update
+            self.log.trace("Trying to update from {0}".format(src))
+            try:
+                if self.update_src(src, self.src_dir, recipe.id, recipe.get_dict()):
+                    self.log.trace("Update successful.")
+                    if self.inventory.get_state(recipe.id) >= self.inventory.STATE_CONFIGURED:
+                        self.log.trace("Setting package state to 'configured'.")
+                        self.inventory.set_state(recipe.id, self.inventory.STATE_CONFIGURED)
+                    else:
+                        self.log.trace("Setting package state to 'fetched'.")
+                        self.inventory.set_state(recipe.id, self.inventory.STATE_FETCHED)
+                    self.inventory.save()
+                    self.log.trace("Update completed.")
+                    return True
+            except PBException as ex:
+                self.log.debug("That didn't work.")
+                self.log.debug(str(ex))
+            except Exception as ex:
+                self.log.error("Unexpected error while fetching {0}.".format(src))
+                self.log.error(ex)
+            # Ideally, we've left the function at this point.
+            raise PBException("Unable to update recipe {0}".format(recipe.id))
 
     def check_fetched(self, recipe):
         """
@@ -43,17 +43,21 @@ class File(FetcherBase):
         - dirname: Put the result into a dir with this name, it'll be a subdir of dest
         - args: Additional args to pass to the actual fetcher
         """
+        args = args or {}
+        if not os.path.isabs(url):
+            # Relative paths are relative to the source dir
+            url = os.path.join(dest, url)
         if not os.path.isfile(url):
             self.log.error("File not found: {0}".format(url))
             return False
-        filename = os.path.split(url)[-1]
+        filename = os.path.join(dest, os.path.split(url)[-1])
         self.log.debug("Looking for file: {0}".format(filename))
         if os.path.isfile(filename):
             self.log.info("File already exists in source dir: {0}".format(filename))
         else:
             self.log.debug("Symlinking file to source dir.")
-            os.symlink(url, os.path.join(os.getcwd(), filename))
-        if args.has_key("md5"):
+            os.symlink(os.path.abspath(url), filename)
+        if "md5" in args:
             self.log.debug("Calculating MD5 sum for {0}...".format(filename))
             actual_md5 = utils.md5sum(filename)
             if actual_md5 != args["md5"]:
@@ -62,7 +66,7 @@ class File(FetcherBase):
         if utils.is_archive(filename):
             self.log.debug("Unpacking {ar}".format(ar=filename))
             # Move to the correct source location.
-            utils.extract_to(filename, dirname)
+            utils.extract_to(filename, os.path.join(dest, dirname))
             # Remove the archive once it has been extracted
             os.remove(filename)
         return True
@@ -74,7 +78,7 @@ class File(FetcherBase):
         - dirname: Put the result into a dir with this name, it'll be a subdir of dest
         - args: Additional args to pass to the actual fetcher
         """
-        filename = os.path.split(url)[-1]
+        filename = os.path.join(dest, os.path.split(url)[-1])
         if os.path.isfile(filename):
             os.remove(filename)
         return self.fetch_url(url, dest, dirname, args)
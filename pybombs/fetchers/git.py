@@ -87,9 +87,10 @@ class Git(FetcherBase):
                 git_cmd.append(arg)
         if self.cfg.get("git-cache", False):
             from pybombs import gitcache_manager
-            gcm = gitcache_manager.GitCacheManager(self.cfg.get("git-cache"))
-            self.log.debug("Adding remote into git ref")
-            gcm.add_remote(dirname, url, True)
+            with gitcache_manager.CACHE_LOCK:
+                gcm = gitcache_manager.GitCacheManager(self.cfg.get("git-cache"))
+                self.log.debug("Adding remote into git ref")
+                gcm.add_remote(dirname, url, True)
             git_cmd.append(
                 '--reference-if-able'
                 if vcompare(">=", git_version, "2.11") else '--reference'
@@ -102,23 +103,20 @@ class Git(FetcherBase):
         subproc.monitor_process(
             args=git_cmd,
             o_proc=o_proc,
+            cwd=dest,
             throw_ex=True,
             throw=True,
         )
         # If we have a specific revision, checkout that
         if args.get('gitrev'):
-            cwd = os.getcwd()
             src_dir = os.path.join(dest, dirname)
-            self.log.trace("Switching cwd to: {0}".format(src_dir))
-            os.chdir(src_dir)
             git_co_cmd = ["git", "checkout", "--force", args.get('gitrev')]
             subproc.monitor_process(
                 args=git_co_cmd,
                 o_proc=o_proc,
+                cwd=src_dir,
                 throw_ex=True,
             )
-            self.log.trace("Switching cwd to: {0}".format(cwd))
-            os.chdir(cwd)
         return True
 
     def update_src(self, url, dest, dirname, args=None):
@@ -127,10 +125,8 @@ class Git(FetcherBase):
         """
         args = args or {}
         self.log.debug("Using url {0}".format(url))
-        cwd = os.getcwd()
         src_dir = os.path.join(dest, dirname)
-        self.log.trace("Switching cwd to: {0}".format(src_dir))
-        os.chdir(src_dir)
+        self.log.trace("Updating in: {0}".format(src_dir))
         if args.get('gitrev'):
             # If we have a rev or tag specified, fetch, then checkout.
             git_cmds = [
@@ -154,13 +150,11 @@ class Git(FetcherBase):
         o_proc = None
         for cmd in git_cmds:
             try:
-                if subproc.monitor_process(args=cmd, o_proc=o_proc, throw_ex=True) != 0:
+                if subproc.monitor_process(args=cmd, o_proc=o_proc, cwd=src_dir, throw_ex=True) != 0:
                     self.log.error("Could not run command `{0}`".format(" ".join(cmd)))
                     return False
             except Exception:
                 self.log.error("Could not run command `{0}`".format(" ".join(cmd)))
                 raise PBException("git commands failed.")
-        self.log.trace("Switching cwd back to: {0}".format(cwd))
-        os.chdir(cwd)
         return True
 
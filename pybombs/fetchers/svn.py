@@ -54,6 +54,7 @@ class Svn(FetcherBase):
         subproc.monitor_process(
             args=svn_cmd,
             #o_proc=foo, # FIXME
+            cwd=dest,
             throw_ex=True,
         )
         return True
@@ -67,20 +68,17 @@ class Svn(FetcherBase):
         """
         args = args or {}
         self.log.debug("Using url {0}".format(url))
-        cwd = os.getcwd()
         src_dir = os.path.join(dest, dirname)
-        self.log.trace("Switching cwd to: {0}".format(src_dir))
-        os.chdir(src_dir)
+        self.log.trace("Updating in: {0}".format(src_dir))
         svn_cmd = ['svn', 'up', '--force']
         if args.get('svnrev'):
             svn_cmd.append('--revision')
             svn_cmd.append(args.get('svnrev'))
         subproc.monitor_process(
             args=svn_cmd,
+            cwd=src_dir,
             throw_ex=True,
             #o_proc=foo #FIXME
         )
-        self.log.trace("Switching cwd back to: {0}".format(cwd))
-        os.chdir(cwd)
         return True
 
@@ -31,15 +31,18 @@ from pybombs.fetchers.base import FetcherBase
 from pybombs.pb_exception import PBException
 
 
-def _download_with_requests(url, filesize=None, range_start=None, hash_md5=None, partial_retry_count=None):
+def _download_with_requests(url, dest, filesize=None, range_start=None, hash_md5=None, partial_retry_count=None):
     """
-    Do a wget: Download the file specified in url to the cwd.
+    Do a wget: Download the file specified in url to the directory dest.
     Return the filename and the MD5 hash as hexdigest string.
+    When fetching in the background, no progress is shown.
     """
     import requests
     import hashlib
+    from pybombs.fetch_pipeline import in_background_fetch
+    show_progress = not in_background_fetch()
     MAX_RETRY_COUNT = 10
-    filename = os.path.split(url)[1]
+    filename = os.path.join(dest, os.path.split(url)[1])
     req_headers = {'User-Agent': 'PyBOMBS'}
     if range_start is not None:
         req_headers['Range'] = "bytes={0}-".format(range_start)
@@ -69,18 +72,20 @@ def _download_with_requests(url, filesize=None, range_start=None, hash_md5=None,
                         int(math.ceil(filesize_dl/1000.)),
                 )
             status += chr(8)*(len(status)+1)
-            sys.stdout.write(status)
+            if show_progress:
+                sys.stdout.write(status)
     if filesize != 0 and filesize_dl != filesize:
         partial_retry_count = partial_retry_count or 0
         if partial_retry_count < MAX_RETRY_COUNT:
-            return _download_with_requests(url, filesize, filesize_dl, hash_md5, partial_retry_count+1)
+            return _download_with_requests(url, dest, filesize, filesize_dl, hash_md5, partial_retry_count+1)
         else:
             raise IOError("Downloaded file size does not match specified file size.")
-    sys.stdout.write("\n")
+    if show_progress:
+        sys.stdout.write("\n")
     return filename, hash_md5.hexdigest()
 
-def _download_with_wget(url):
-    " Use the wget tool itself "
+def _download_with_wget(url, dest):
+    " Use the wget tool itself, download into dest "
     def get_md5(filename):
         " Return MD5 sum of filename using the md5sum tool "
         md5_exe = sysutils.which('md5sum')
@@ -89,11 +94,14 @@ def _download_with_wget(url):
         return None
     from pybombs.utils import sysutils
     from pybombs.utils import subproc
+    from pybombs.utils import output_proc
+    from pybombs.fetch_pipeline import in_background_fetch
     wget = sysutils.which('wget')
     if wget is None:
         raise PBException("wget executable not found")
-    filename = os.path.split(url)[1]
-    retval = subproc.monitor_process([wget, url], throw=True)
+    filename = os.path.join(dest, os.path.split(url)[1])
+    o_proc = output_proc.OutputProcessorSilent() if in_background_fetch() else None
+    retval = subproc.monitor_process([wget, url], cwd=dest, throw=True, o_proc=o_proc)
     if retval:
         raise PBException("wget failed to wget")
     return filename, get_md5(filename)
@@ -119,24 +127,24 @@ class Wget(FetcherBase):
         """
         try:
             self.log.debug("Downloading file: {0}".format(url))
-            filename, md5_hash = _download_with_requests(url)
+            filename, md5_hash = _download_with_requests(url, dest)
         except IOError as ex:
             self.log.error("Download using requests failed: " + str(ex))
             try:
                 self.log.warn("Attempting to download using wget...")
-                filename, md5_hash = _download_with_wget(url)
+                filename, md5_hash = _download_with_wget(url, dest)
             except PBException as ex:
                 self.log.warn(str(ex))
                 return False
         self.log.debug("MD5: {0}".format(md5_hash))
-        if 'md5' in args and args['md5'] != md5_hash:
+        if 'md5' in (args or {}) and args['md5'] != md5_hash:
             self.log.error("While downloading {fname}: MD5 hashes to not match. Expected {exp}, got {actual}.".format(
                 fname=filename, exp=args['md5'], actual=md5_hash
             ))
             return False
         if utils.is_archive(filename):
             # Move archive contents to the correct source location:
-            utils.extract_to(filename, dirname)
+            utils.extract_to(filename, os.path.join(dest, dirname))
             # Remove the archive once it has been extracted:
             os.remove(filename)
         return True
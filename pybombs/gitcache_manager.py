@@ -21,12 +21,15 @@
 """ Git cache manager """
 
 from __future__ import print_function
-import os
+import threading
 from six import iteritems
 from pybombs import pb_logging
 from pybombs.utils import sysutils
 from pybombs.utils import subproc
 
+# Hold this while modifying the cache, fetches may run in parallel
+CACHE_LOCK = threading.RLock()
+
 class GitCacheManager(object):
     " Git cache manager "
     def __init__(self, path):
@@ -36,13 +39,9 @@ class GitCacheManager(object):
         self.remotes = self.get_existing_remotes()
 
     def run_git_command(self, args):
-        " Run a git command in path, return to previous cwd, return output "
+        " Run a git command in path, return output "
         git_cmd = ['git'] + args
-        cwd = os.getcwd()
-        os.chdir(self.path)
-        output = subproc.check_output(git_cmd)
-        os.chdir(cwd)
-        return output
+        return subproc.check_output(git_cmd, cwd=self.path)
 
     def ensure_repo_exists(self, path):
         " Guarantee that path is a writable git repo. "
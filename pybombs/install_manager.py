@@ -21,9 +21,16 @@
 """ Handles installing multiple packets """
 
 from __future__ import print_function
+from collections import OrderedDict
 from pybombs import pb_logging
 from pybombs import package_manager
 from pybombs import dep_manager
+from pybombs import dep_graph
+from pybombs import recipe
+from pybombs.build_scheduler import BuildScheduler, recipe_makewidth
+from pybombs.fetch_pipeline import FetchPipeline, POLICY_SKIP
+from pybombs.config_manager import config_manager
+from pybombs.requirer import Requirer
 from pybombs.pb_exception import PBException
 
 class InstallManager(object):
@@ -46,50 +53,21 @@ class InstallManager(object):
             no_deps=False,
             verify=False,
             static=False,
-            install_type=None
+            install_type=None,
+            jobs=None,
         ):
         """
         Install packages.
+
+        Binary packages are installed first. All binary packages that are
+        required are collected, and installed using one transaction per
+        packager. Then the install tree is created; at this point, the
+        binary installs are verified, and if they failed, they are retried
+        one by one before falling back to a source build.
+
+        - jobs: Number of source packages to build concurrently. Defaults to
+          the 'jobs' config option.
         """
-        def _check_if_pkg_goes_into_tree(pkg):
-            " Return True if pkg has a legitimate right to be in the tree. "
-            self.log.trace("Checking if package `{pkg}' goes into tree...".format(pkg=pkg))
-            if fail_if_not_exists and not bool(self.pm.installed(pkg)):
-                self.log.trace("Only installed packages need to into tree, and this one is not.")
-                return False
-            if no_deps and pkg not in packages:
-                self.log.trace("Not installing, because it's not in the list.")
-                return False
-            if not self.pm.exists(pkg):
-                self.log.error("Package has no install method: {0}".format(pkg))
-                raise PBException("Unresolved install path.")
-            if not self.pm.installed(pkg):
-                # If it's not installed, we'll try a binary install...
-                self.log.debug("Testing binary install for package {pkg}.".format(pkg=pkg))
-                if self.pm.install(pkg, install_type="binary",
-                                   static=static, verify=verify,
-                                   fail_silently=True):
-                    self.log.trace("Binary install successful, so we don't put it into tree.")
-                    # ...and if that worked, it doesn't have to go into the tree.
-                    return False
-                self.log.trace("Not installed: It goes into tree.")
-                # Now it's still not installed, so it has to go into the tree:
-                return True
-            else:
-                # If a package is already installed, but not flagged for
-                # updating, it does not go into the tree:
-                if not update_if_exists or pkg not in packages:
-                    self.log.trace("Installed, but no update requested. Does not go into tree.")
-                    return False
-                # OK, so it needs updating. But only if it's a source package:
-                if self.pm.installed(pkg, install_type="source"):
-                    self.log.trace("Package was source-installed, and needs update.")
-                    return True
-                # Otherwise, we should give it a shot:
-                self.log.trace("Doesn't go into tree, but we'll try a packager update.")
-                self.pm.update(pkg, install_type="binary")
-                return False
-            assert False # Should never reach this line
         _checker_cache = {}
         def _cached_check_if_pkg_goes_into_tree(pkg, check_callback):
             if pkg in _checker_cache:
@@ -98,6 +76,14 @@ class InstallManager(object):
             _checker_cache[pkg] = ret_val
             return ret_val
         ####### install() starts here #########
+        opts = {
+            'packages': packages,
+            'fail_if_not_exists': fail_if_not_exists,
+            'update_if_exists': update_if_exists,
+            'no_deps': no_deps,
+            'verify': verify,
+            'static': static,
+        }
         ### Sanity checks
         if fail_if_not_exists:
             for pkg in packages:
@@ -107,9 +93,21 @@ class InstallManager(object):
         extra_info_logger = self.log.info if not quiet else self.log.debug
         ### Make install tree and install binary packages
         extra_info_logger("Phase 1: Creating install tree and installing binary packages:")
+        self._prefetch(packages, no_deps)
+        binary_plans = OrderedDict()
+        dep_manager.DepManager().make_dep_tree(
+            packages,
+            lambda pkg: self._check_if_pkg_goes_into_tree(pkg, opts, binary_plans)
+        )
+        if binary_plans:
+            self.pm.install_batch(binary_plans)
+        # Now do it for real. Binary packages that were batch-installed are
+        # now installed; the ones that failed are retried individually.
         install_tree = dep_manager.DepManager().make_dep_tree(
             packages,
-            lambda pkg: _cached_check_if_pkg_goes_into_tree(pkg, _check_if_pkg_goes_into_tree)
+            lambda pkg: _cached_check_if_pkg_goes_into_tree(
+                pkg, lambda pkg: self._check_if_pkg_goes_into_tree(pkg, opts)
+            )
         )
         if len(install_tree) == 0 and not quiet:
             extra_info_logger("No packages to install.")
@@ -117,28 +115,244 @@ class InstallManager(object):
         if (self.log.getEffectiveLevel() <= 20 or print_tree) and not quiet:
             print("Install tree:")
             install_tree.pretty_print()
+            if print_tree:
+                install_tree.print_plan()
         if len(install_tree) > 0 and install_type == "binary":
             self.log.error("Install method was `binary', but source packages are left over!")
             return False
         extra_info_logger("Phase 1 complete: All binary dependencies installed.")
-        ### Recursively install/update source packages, starting at the leaf nodes
+        ### Install/update source packages, starting at the leaf nodes
         extra_info_logger("Phase 2: Recursively installing source packages to prefix:")
+        scheduler = BuildScheduler(install_tree, jobs=jobs)
+        skip_deps_only = lambda pkg: mode == 'install' and deps_only and pkg in packages
+        inventory = config_manager.get_active_prefix().inventory
+        fetch_pipeline = FetchPipeline(
+            install_tree,
+            [pkg for pkg in install_tree.serialize()
+             if not skip_deps_only(pkg)
+             and not self.pm.installed(pkg)
+             and (inventory.get_state(pkg) or 0) < inventory.STATE_FETCHED],
+        )
+        def _install_source_pkg(pkg, makewidth):
+            " Install or update a single source package. "
+            if skip_deps_only(pkg):
+                self.log.debug("Skipping `{0}' because only deps are requested.".format(pkg))
+                return True
+            if not fetch_pipeline.wait(pkg):
+                if fetch_pipeline.policy == POLICY_SKIP:
+                    self.log.warn("Skipping package {0}, because fetching {1} failed.".format(
+                        pkg, fetch_pipeline.skipped[pkg]
+                    ))
+                    return True
+                if pkg in fetch_pipeline.failed:
+                    self.log.error("Error fetching package {0}. Aborting.".format(pkg))
+                else:
+                    self.log.error("Not installing package {0}, because fetching {1} failed. Aborting.".format(
+                        pkg, ", ".join(fetch_pipeline.failed)
+                    ))
+                return False
+            with recipe_makewidth(recipe.get_recipe(pkg), makewidth if scheduler.jobs > 1 else None):
+                if self.pm.installed(pkg):
+                    self.log.info("Updating package: {0}".format(pkg))
+                    if not self.pm.update(pkg, install_type="source", verify=verify):
+                        self.log.error("Error updating package {0}. Aborting.".format(pkg))
+                        return False
+                    self.log.info("Update successful: {0}".format(pkg))
+                else:
+                    self.log.info("Installing package: {0}".format(pkg))
+                    if not self.pm.install(pkg, install_type="source", static=static, verify=verify):
+                        self.log.error("Error installing package {0}. Aborting.".format(pkg))
+                        return False
+                    self.log.info("Installation successful: {0}".format(pkg))
+            return True
+        if scheduler.jobs > 1:
+            # Check this once up front, not from every build thread:
+            Requirer().assert_requirements(['build-essential'])
+        fetch_pipeline.start()
+        try:
+            if not scheduler.run(_install_source_pkg):
+                return False
+        finally:
+            fetch_pipeline.stop()
+        if fetch_pipeline.skipped:
+            self.log.error("The following packages were not installed, because fetching failed: {0}".format(
+                ", ".join(fetch_pipeline.skipped.keys())
+            ))
+            return False
+        extra_info_logger("Phase 2 complete: All source packages installed.")
+        return True
+
+    def make_plan(
+            self,
+            packages,
+            mode='install',
+            fail_if_not_exists=False,
+            update_if_exists=False,
+            deps_only=False,
+            no_deps=False,
+            static=False,
+        ):
+        """
+        Figure out what install() would do when called with the same
+        arguments, without installing or fetching anything.
+
+        Returns the plan as a dictionary that can be serialized to JSON:
+        - binary: For every packager, the recipes it would install and the
+          packager-specific package names, i.e., one install transaction
+        - binary_update: Installed packages that would get a packager update
+        - installed: Packages that are already installed
+        - source: The source packages, in build order
+        - levels, critical_path: See DepGraph
+        - estimate: How much work the source builds are. Times are in
+          seconds, based on the build history, or None if there is none.
+        """
+        opts = {
+            'packages': packages,
+            'fail_if_not_exists': fail_if_not_exists,
+            'update_if_exists': update_if_exists,
+            'no_deps': no_deps,
+            'verify': False,
+            'static': static,
+        }
+        if fail_if_not_exists:
+            for pkg in packages:
+                if not self.pm.installed(pkg):
+                    self.log.error("Package {0} is not installed. Aborting.".format(pkg))
+                    raise PBException("Package {0} is not installed.".format(pkg))
+        self._prefetch(packages, no_deps)
+        binary_plans = OrderedDict()
+        decisions = OrderedDict()
+        install_tree = dep_manager.DepManager().make_dep_tree(
+            packages,
+            lambda pkg: self._check_if_pkg_goes_into_tree(pkg, opts, binary_plans, decisions)
+        )
+        binary = OrderedDict()
+        for pkg, (pkgr, pkg_names) in binary_plans.items():
+            transaction = binary.setdefault(pkgr.name, {'recipes': [], 'packages': []})
+            transaction['recipes'].append(pkg)
+            transaction['packages'] += [x for x in pkg_names if x not in transaction['packages']]
+        inventory = config_manager.get_active_prefix().inventory
+        history = config_manager.get_active_prefix().build_history
+        estimates = history.estimate_all(install_tree.get_values()) if history is not None else None
+        levels = install_tree.get_levels()
+        level_of = {pkg: idx for idx, level in enumerate(levels) for pkg in level}
+        source = []
         for pkg in install_tree.serialize():
             if mode == 'install' and deps_only and pkg in packages:
-                self.log.debug("Skipping `{0}' because only deps are requested.")
                 continue
-            if self.pm.installed(pkg):
-                self.log.info("Updating package: {0}".format(pkg))
-                if not self.pm.update(pkg, install_type="source", verify=verify):
-                    self.log.error("Error updating package {0}. Aborting.".format(pkg))
-                    return False
-                self.log.info("Update successful.")
-            else:
-                self.log.info("Installing package: {0}".format(pkg))
-                if not self.pm.install(pkg, install_type="source", static=static, verify=verify):
-                    self.log.error("Error installing package {0}. Aborting.".format(pkg))
-                    return False
-                self.log.info("Installation successful.")
-        extra_info_logger("Phase 2 complete: All source packages installed.")
-        return True
+            installed = bool(self.pm.installed(pkg))
+            fetched = inventory is not None and \
+                    (inventory.get_state(pkg) or 0) >= inventory.STATE_FETCHED
+            source.append(OrderedDict((
+                ('name', pkg),
+                ('action', 'update' if installed else 'install'),
+                ('level', level_of[pkg]),
+                ('depends', install_tree.get_deps(pkg)),
+                ('fetch', not installed and not fetched),
+                ('sources', getattr(recipe.get_recipe(pkg), 'source', [])),
+                ('build_time', round(estimates[pkg], 1) if estimates else None),
+            )))
+        critical_path, critical_path_length = install_tree.get_critical_path()
+        critical_path_time = None
+        if estimates:
+            critical_path_time = round(install_tree.get_critical_path(lambda pkg: estimates[pkg])[1], 1)
+        return OrderedDict((
+            ('packages', list(packages)),
+            ('mode', mode),
+            ('prefix', config_manager.get_active_prefix().prefix_dir),
+            ('binary', binary),
+            ('binary_update', [pkg for pkg, what in decisions.items() if what == 'binary-update']),
+            ('installed', [pkg for pkg, what in decisions.items() if what == 'installed']),
+            ('source', source),
+            ('levels', levels),
+            ('critical_path', critical_path),
+            ('estimate', OrderedDict((
+                ('binary_transactions', len([x for x in binary.values() if x['packages']])),
+                ('binary_packages', sum([len(x['packages']) for x in binary.values()])),
+                ('fetches', len([x for x in source if x['fetch']])),
+                ('builds', len(source)),
+                ('critical_path_builds', critical_path_length),
+                ('build_time', round(sum([x['build_time'] for x in source]), 1) if estimates else None),
+                ('critical_path_time', critical_path_time),
+            ))),
+        ))
 
+    def _prefetch(self, packages, no_deps):
+        " Query the packagers for all packages we might need in one go. "
+        try:
+            # Only the set of packages matters here, so don't check for cycles yet
+            closure = dep_graph.DepGraph()
+            for pkg in ([] if no_deps else packages):
+                if pkg not in closure:
+                    dep_manager.DepManager().make_tree_recursive(pkg, lambda pkg: True, closure)
+            self.pm.prefetch(packages if no_deps else closure.get_values())
+        except PBException as ex:
+            self.log.debug("Unable to prefetch package information: {0}".format(str(ex)))
+
+    def _check_if_pkg_goes_into_tree(self, pkg, opts, binary_plans=None, decisions=None):
+        """
+        Return True if pkg has a legitimate right to be in the tree.
+
+        - opts: Dictionary with the arguments of install() that affect
+          the tree (see install())
+        - binary_plans: If this is a dict, packages are not installed but
+          the binary install plans are stored in there.
+        - decisions: If this is a dict, store what happens to pkg in there
+          (see make_plan()). Only used if binary_plans is given.
+        """
+        packages = opts['packages']
+        if decisions is None:
+            decisions = {}
+        self.log.trace("Checking if package `{pkg}' goes into tree...".format(pkg=pkg))
+        if opts['fail_if_not_exists'] and not bool(self.pm.installed(pkg)):
+            self.log.trace("Only installed packages need to into tree, and this one is not.")
+            decisions[pkg] = 'skip'
+            return False
+        if opts['no_deps'] and pkg not in packages:
+            self.log.trace("Not installing, because it's not in the list.")
+            decisions[pkg] = 'skip'
+            return False
+        if not self.pm.exists(pkg):
+            self.log.error("Package has no install method: {0}".format(pkg))
+            raise PBException("Unresolved install path.")
+        if not self.pm.installed(pkg):
+            if binary_plans is not None:
+                plan = None if opts['static'] else self.pm.get_binary_install_plan(pkg)
+                if plan is not None:
+                    self.log.trace("Binary install possible, so we don't put it into tree.")
+                    binary_plans[pkg] = plan
+                    decisions[pkg] = 'binary'
+                    return False
+                decisions[pkg] = 'source'
+                return True
+            # If it's not installed, we'll try a binary install...
+            self.log.debug("Testing binary install for package {pkg}.".format(pkg=pkg))
+            if self.pm.install(pkg, install_type="binary",
+                               static=opts['static'], verify=opts['verify'],
+                               fail_silently=True):
+                self.log.trace("Binary install successful, so we don't put it into tree.")
+                # ...and if that worked, it doesn't have to go into the tree.
+                return False
+            self.log.trace("Not installed: It goes into tree.")
+            # Now it's still not installed, so it has to go into the tree:
+            return True
+        else:
+            # If a package is already installed, but not flagged for
+            # updating, it does not go into the tree:
+            if not opts['update_if_exists'] or pkg not in packages:
+                self.log.trace("Installed, but no update requested. Does not go into tree.")
+                decisions[pkg] = 'installed'
+                return False
+            # OK, so it needs updating. But only if it's a source package:
+            if self.pm.installed(pkg, install_type="source"):
+                self.log.trace("Package was source-installed, and needs update.")
+                decisions[pkg] = 'source'
+                return True
+            # Otherwise, we should give it a shot:
+            self.log.trace("Doesn't go into tree, but we'll try a packager update.")
+            if binary_plans is not None:
+                decisions[pkg] = 'binary-update'
+                return False
+            self.pm.update(pkg, install_type="binary")
+            return False
+        assert False # Should never reach this line
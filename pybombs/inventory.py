@@ -23,9 +23,34 @@ Inventory Manager
 """
 
 import os
+import json
+import atexit
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
 from pybombs import pb_logging
 from pybombs.pb_exception import PBException
 from pybombs.config_file import PBConfigFile
+from pybombs.prefix_lock import FileLock, get_lock_timeout
+from pybombs.utils.sysutils import get_file_fingerprint
+
+# When the journal has more entries than this, it's merged into the
+# inventory file on the next save()
+JOURNAL_COMPACT_SIZE = 500
+
+def _write_yaml_atomic(filename, data):
+    """
+    Write data to the YAML file filename. We write to a temporary file first
+    and then rename it, so filename is either complete or untouched.
+    """
+    tmp_filename = "{0}.{1}.tmp".format(filename, os.getpid())
+    PBConfigFile(tmp_filename, read_only=True).save(data)
+    fd = os.open(tmp_filename, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.rename(tmp_filename, filename)
 
 class Inventory(object):
     """
@@ -34,8 +59,24 @@ class Inventory(object):
     Every prefix has an inventory, a list of packages that are
     installed and in which state they current are.
 
-    Except for save(), none of the methods actually writes to the
-    inventory file.
+    Except for save(), import_yaml() and export_yaml(), none of the methods
+    actually writes to disk. Changes are collected in memory (later changes
+    to the same key replace earlier ones), and save() appends them to a
+    journal file next to the inventory file. This is cheap, and a crash
+    can at most leave an incomplete journal entry behind, which is then
+    ignored.
+    The journal is merged into the inventory file when the inventory is
+    loaded, when it gets long, and when PyBOMBS exits. The inventory file
+    itself is only ever replaced atomically, and stays in the same YAML
+    format.
+
+    All methods that modify the inventory are serialized through a lock,
+    so packages may be built from multiple threads at the same time.
+
+    Several processes may also use the same inventory: Reading and writing
+    the files happens under a file lock (inventory.yml.lock), and because
+    the journal only contains changes, nobody overwrites anyone else's
+    changes. refresh() picks up what other processes saved.
     """
     _states = {
         'none':       (0,  'Package is not installed or fetched',),
@@ -50,48 +91,170 @@ class Inventory(object):
             inventory_file=None,
         ):
         self._filename = inventory_file
+        self._journal_filename = inventory_file + '.journal'
+        self._lock = threading.RLock()
         self.log = pb_logging.logger.getChild("Inventory")
         self._state_names = {}
         for state in self._states.keys():
             setattr(self, "STATE_{0}".format(state.upper()), self._states[state][0])
             self._state_names[self._states[state][0]] = state
+        self._data = OrderedDict()
+        # (pkg, key) -> value of all changes since the last save(); a key of
+        # None means pkg was removed
+        self._pending = OrderedDict()
+        self._journal_size = 0
+        self._atexit_registered = False
+        self._file_lock = None
+        # Fingerprint of the files when _data was last in sync with them
+        self._disk_fingerprint = None
         self.load()
 
     def load(self):
         """
-        Load the inventory file.
+        Load the inventory file, and apply the journal.
         If the file does not exist, initialize the internal content
         with an empty dictionary.
         This will override any internal state.
         """
         self.log.debug("Trying to load inventory file {0}...".format(self._filename))
-        self._invfile = PBConfigFile(self._filename)
+        with self._lock:
+            self._pending = OrderedDict()
+            self._journal_size = 0
+            if os.path.exists(self._journal_filename):
+                self.compact()
+            with self._files_locked(exclusive=False):
+                self._data = self._read_files()
+                self._disk_fingerprint = self._get_disk_fingerprint()
+
+    def refresh(self):
+        """
+        Re-read the inventory if another process changed it since we last
+        looked. Changes that weren't saved yet are kept.
+        """
+        with self._lock:
+            if self._get_disk_fingerprint() == self._disk_fingerprint:
+                return
+            self.log.debug("Inventory file {0} changed, reloading...".format(self._filename))
+            with self._files_locked(exclusive=False):
+                data = self._read_files()
+                self._disk_fingerprint = self._get_disk_fingerprint()
+            for (pkg, key), value in self._pending.items():
+                if key is None:
+                    data.pop(pkg, None)
+                else:
+                    data.setdefault(pkg, OrderedDict())[key] = value
+            self._data = data
 
     def save(self):
         """
-        Save current state of inventory to the inventory file.
-        This will overwrite any existing file with the same name
-        and without warning. If the file didn't exist, it will be
-        created.
+        Write all changes since the last save() to the journal. If the
+        directory of the inventory file doesn't exist, it will be created.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            self.log.debug("Saving inventory to file {0}...".format(self._filename))
+            if not os.path.isdir(os.path.split(self._filename)[0]):
+                os.mkdir(os.path.split(self._filename)[0])
+            lines = []
+            for (pkg, key), value in self._pending.items():
+                if key is None:
+                    entry = {'pkg': pkg, 'remove': True}
+                else:
+                    entry = {'pkg': pkg, 'key': key, 'value': value}
+                lines.append(json.dumps(entry, default=str) + '\n')
+            with self._files_locked():
+                in_sync = self._get_disk_fingerprint() == self._disk_fingerprint
+                if not self._journal_ends_with_newline():
+                    # Don't append to the incomplete entry of a crashed writer
+                    lines.insert(0, '\n')
+                with open(self._journal_filename, 'a') as journal:
+                    journal.write(''.join(lines))
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                if in_sync:
+                    self._disk_fingerprint = self._get_disk_fingerprint()
+            self._pending = OrderedDict()
+            self._journal_size += len(lines)
+            if self._journal_size > JOURNAL_COMPACT_SIZE:
+                self.compact()
+            elif not self._atexit_registered:
+                self._atexit_registered = True
+                atexit.register(self.compact)
+
+    def compact(self):
+        """
+        Merge the journal into the inventory file. Changes that weren't
+        saved yet are saved first.
+        """
+        with self._lock:
+            with self._files_locked():
+                self.save()
+                if not os.path.exists(self._journal_filename):
+                    return
+                self.log.debug("Writing inventory file {0}...".format(self._filename))
+                in_sync = self._get_disk_fingerprint() == self._disk_fingerprint
+                try:
+                    # Use what's on disk, not self._data, in case another
+                    # process wrote to the journal, too:
+                    _write_yaml_atomic(self._filename, self._read_files())
+                    os.remove(self._journal_filename)
+                except (IOError, OSError) as ex:
+                    self.log.warn("Could not write inventory file {0}: {1}".format(self._filename, str(ex)))
+                    return
+                if in_sync:
+                    self._disk_fingerprint = self._get_disk_fingerprint()
+            self._journal_size = 0
+
+    def export_yaml(self, filename):
+        """
+        Write the inventory (including unsaved changes) to the YAML file
+        filename, in the same format as the inventory file.
+        """
+        with self._lock:
+            _write_yaml_atomic(filename, self._data)
+
+    def import_yaml(self, filename):
+        """
+        Replace the inventory with the contents of YAML file filename (e.g.
+        one written by export_yaml()), and write the inventory file.
         """
-        self.log.debug("Saving inventory to file {0}...".format(self._filename))
-        if not os.path.isdir(os.path.split(self._filename)[0]):
-            os.mkdir(os.path.split(self._filename)[0])
-        self._invfile.save()
+        data = PBConfigFile(filename, read_only=True).get()
+        with self._lock:
+            self._data = OrderedDict((pkg, OrderedDict(info or {})) for pkg, info in data.items())
+            self._pending = OrderedDict()
+            with self._files_locked():
+                _write_yaml_atomic(self._filename, self._data)
+                if os.path.exists(self._journal_filename):
+                    os.remove(self._journal_filename)
+                self._disk_fingerprint = self._get_disk_fingerprint()
+            self._journal_size = 0
+
+    def get_filename(self):
+        " Return the path to the inventory file "
+        return self._filename
+
+    def get_files(self):
+        " Return the paths of all files the inventory is stored in "
+        return [self._filename, self._journal_filename]
 
     def has(self, pkg):
         """
         Returns true if the package pkg is in the inventory.
         """
-        return pkg in self._invfile.data
+        return pkg in self._data
 
     def remove(self, pkg):
         """
         Remove package pkg from the inventory.
         """
-        if self.has(pkg):
-            del self._invfile.data[pkg]
-            self._invfile.save()
+        with self._lock:
+            if self.has(pkg):
+                del self._data[pkg]
+                for pending_pkg, key in list(self._pending.keys()):
+                    if pending_pkg == pkg:
+                        del self._pending[(pending_pkg, key)]
+                self._pending[(pkg, None)] = None
 
     def get_state(self, pkg):
         """
@@ -100,7 +263,7 @@ class Inventory(object):
         If pkg does not exist, returns None.
         """
         try:
-            return self._invfile.data[pkg]["state"]
+            return self._data[pkg]["state"]
         except KeyError:
             return self.STATE_NONE
 
@@ -119,10 +282,9 @@ class Inventory(object):
                     pass
         if not state in self.get_valid_states():
             raise ValueError("Invalid state: {0}".format(state))
-        if not self.has(pkg):
-            self._invfile.data[pkg] = {}
         self.log.debug("Setting state to `{0}'".format(self._state_names[state]))
-        self._invfile.update({pkg: {'state': state}})
+        with self._lock:
+            self._set(pkg, 'state', state)
 
     def get_version(self, pkg, default_version=None):
         """
@@ -133,7 +295,7 @@ class Inventory(object):
         if not self.has(pkg):
             raise PBException("Cannot get version for package {0} if it's not in the inventory!".format(pkg))
         try:
-            return self._invfile.data[pkg]["version"]
+            return self._data[pkg]["version"]
         except KeyError:
             return default_version
 
@@ -145,7 +307,8 @@ class Inventory(object):
         if not self.has(pkg):
             raise PBException("Cannot set version for package {0} if it's not in the inventory!".format(pkg))
         self.log.debug("Setting version to {0}".format(version))
-        self._invfile.data[pkg]["version"] = version
+        with self._lock:
+            self._set(pkg, 'version', version)
 
     def set_key(self, pkg, key, value):
         """
@@ -155,10 +318,9 @@ class Inventory(object):
             return self.set_state(pkg, value)
         if key == 'version':
             return self.set_version(pkg, value)
-        if not self.has(pkg):
-            self._invfile.data[pkg] = {}
         self.log.trace("Setting key {k} on package {p} to {v}.".format(k=key, p=pkg, v=value))
-        self._invfile.data[pkg][key] = value
+        with self._lock:
+            self._set(pkg, key, value)
 
     def get_key(self, pkg, key):
         """
@@ -168,7 +330,7 @@ class Inventory(object):
             return self.get_state(pkg)
         if key == 'version':
             return self.get_version(pkg)
-        return self._invfile.data[pkg].get(key)
+        return self._data[pkg].get(key)
 
     def get_valid_states(self):
         """
@@ -186,5 +348,92 @@ class Inventory(object):
         """
         Return a list of package names installed to this inventory.
         """
-        return self._invfile.data.keys()
+        with self._lock:
+            return list(self._data.keys())
+
+    def _set(self, pkg, key, value):
+        " Set key of pkg to value, and remember the change. Lock must be held. "
+        self._data.setdefault(pkg, OrderedDict())[key] = value
+        self._pending[(pkg, key)] = value
+
+    @contextmanager
+    def _files_locked(self, exclusive=True):
+        """
+        Context manager: Hold the file lock on the inventory files. Does
+        nothing if we're already holding it. self._lock must be held.
+        """
+        if self._file_lock is not None:
+            yield
+            return
+        self._file_lock = FileLock(
+            self._filename + '.lock',
+            exclusive=exclusive,
+            timeout=get_lock_timeout(),
+            description="lock on inventory {0}".format(self._filename),
+        )
+        try:
+            self._file_lock.acquire()
+            yield
+        finally:
+            self._file_lock.release()
+            self._file_lock = None
+
+    def _journal_ends_with_newline(self):
+        " Return False if the last journal entry is incomplete "
+        try:
+            with open(self._journal_filename, 'rb') as journal:
+                journal.seek(0, os.SEEK_END)
+                if journal.tell() == 0:
+                    return True
+                journal.seek(-1, os.SEEK_END)
+                return journal.read(1) == b'\n'
+        except (IOError, OSError):
+            return True
+
+    def _get_disk_fingerprint(self):
+        " Return something that changes when the inventory files change "
+        return (get_file_fingerprint(self._filename), get_file_fingerprint(self._journal_filename))
+
+    def _read_files(self):
+        """
+        Return the inventory as stored on disk: The inventory file, with the
+        changes from the journal applied. Incomplete entries (from a crash
+        while writing them) are skipped; save() starts a new line after them,
+        so the entries written after them still count.
+        """
+        data = OrderedDict(
+            (pkg, OrderedDict(info or {}))
+            for pkg, info in PBConfigFile(self._filename, read_only=True).get().items()
+        )
+        if not os.path.isfile(self._journal_filename):
+            return data
+        with open(self._journal_filename) as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if line.strip():
+                        self.log.warn("Ignoring incomplete entry in inventory journal {0}".format(self._journal_filename))
+                    continue
+                if entry.get('remove'):
+                    data.pop(entry['pkg'], None)
+                else:
+                    data.setdefault(entry['pkg'], OrderedDict())[entry['key']] = entry['value']
+        return data
 
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+    # Benchmark: Walk NUM_PKGS packages through all build states, saving
+    # after every state change (like a source build does).
+    num_pkgs = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    inv = Inventory(os.path.join(tempfile.mkdtemp(), 'inventory.yml'))
+    start = time.time()
+    for pkg_idx in range(num_pkgs):
+        for pkg_state in ('fetched', 'configured', 'built', 'installed'):
+            inv.set_state('pkg{0}'.format(pkg_idx), pkg_state)
+            inv.save()
+    inv.compact()
+    print("{0} packages, {1} saves: {2:.2f} s".format(num_pkgs, 4 * num_pkgs, time.time() - start))
+    print(len(Inventory(inv.get_filename()).get_packages()))
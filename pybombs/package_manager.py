@@ -22,24 +22,58 @@
 Package Manager: Manages packages (no shit)
 """
 
+import threading
+from collections import OrderedDict
 from pybombs import pb_logging
 from pybombs.pb_exception import PBException
 from pybombs.config_manager import config_manager
 from pybombs import recipe
 from pybombs import packagers
+from pybombs.packager_cache import packager_cache
 from pybombs.utils import utils
 
 INSTALL_TYPES = ("any", "source", "binary")
 
 class PackageManagerCache(object):
-    " Remember what's installed and installable "
+    """
+    Remember what's installed and installable. Package managers in several
+    threads may share this, so all access goes through the methods.
+    The getters return None if we don't know the status.
+    """
     def __init__(self):
+        self._lock = threading.Lock()
         # Dict: key == package name, value == boolean install status
         # If key doesn't exist, we don't know the install/installable status
         self.known_installable = {}
         # Dict install_type -> dict: package name -> install status
         self.known_installed = {k: {} for k in INSTALL_TYPES}
 
+    def get_installable(self, name):
+        " Return the installable status of name "
+        with self._lock:
+            return self.known_installable.get(name)
+
+    def set_installable(self, name, status):
+        " Store the installable status of name "
+        with self._lock:
+            self.known_installable[name] = status
+
+    def get_installed(self, install_type, name):
+        " Return the install status of name for install_type "
+        with self._lock:
+            return self.known_installed.get(install_type, {}).get(name)
+
+    def set_installed(self, install_type, name, status):
+        " Store the install status of name for install_type "
+        with self._lock:
+            self.known_installed[install_type][name] = status
+
+    def forget_installed(self, name):
+        " Forget the install status of name for all install types "
+        with self._lock:
+            for known_installed in self.known_installed.values():
+                known_installed.pop(name, None)
+
 PACKAGE_MANAGER_CACHE = PackageManagerCache()
 
 def _get_valid_install_type(install_type):
@@ -118,9 +152,10 @@ class PackageManager(object):
         If return_pkgr_name is True, it'll return a list of packagers that
         can install this package.
         """
-        if not return_pkgr_name and name in self.pmc.known_installable:
+        known_installable = self.pmc.get_installable(name)
+        if not return_pkgr_name and known_installable is not None:
             self.log.trace("{0} has cached installable-status: {1}".format(
-                name, self.pmc.known_installable.get(name)
+                name, known_installable
             ))
             return True
         self.log.debug("Checking if package {0} is installable...".format(name))
@@ -130,20 +165,20 @@ class PackageManager(object):
         r = recipe.get_recipe(name)
         pkgrs = []
         for pkgr in self.get_packagers(name):
-            pkg_version = pkgr.exists(r)
+            pkg_version = packager_cache.query(pkgr, 'exists', r)
             if pkg_version is None or not pkg_version:
                 continue
             else:
-                self.pmc.known_installable[name] = True
+                self.pmc.set_installable(name, True)
                 if return_pkgr_name:
                     pkgrs.append(pkgr.name)
                 else:
                     return pkg_version
         if return_pkgr_name and len(pkgrs):
-            self.pmc.known_installable[name] = True
+            self.pmc.set_installable(name, True)
             return pkgrs
         self.log.debug("Package {0} is not installable.".format(name))
-        self.pmc.known_installable[name] = False
+        self.pmc.set_installable(name, False)
         return False
 
     def installed(self, name, return_pkgr_name=False, install_type=None, ignore_pkg_flag=False):
@@ -157,11 +192,12 @@ class PackageManager(object):
         ignore_pkg_flag is passed to get_packagers().
         """
         install_type = _get_valid_install_type(install_type)
-        if not return_pkgr_name and name in self.pmc.known_installed.get(install_type, {}):
+        known_installed = self.pmc.get_installed(install_type, name)
+        if not return_pkgr_name and known_installed is not None:
             self.log.trace("{0} has cached installed-status: {1}".format(
-                name, self.pmc.known_installed.get(install_type, {}).get(name)
+                name, known_installed
             ))
-            return self.pmc.known_installed.get(install_type, {}).get(name)
+            return known_installed
         self.log.debug("Checking if package {0} is installed...".format(name))
         if self.check_package_flag(name, 'forceinstalled'):
             self.log.debug("Package {0} is forced to state 'installed'.".format(name))
@@ -170,18 +206,18 @@ class PackageManager(object):
         r = recipe.get_recipe(name)
         pkgrs = []
         for pkgr in self.get_packagers(name, install_type, ignore_pkg_flag):
-            pkg_version = pkgr.installed(r)
+            pkg_version = packager_cache.query(pkgr, 'installed', r)
             if pkg_version is None or not pkg_version:
                 continue
             else:
-                self.pmc.known_installed[install_type][name] = True
+                self.pmc.set_installed(install_type, name, True)
                 if return_pkgr_name:
                     pkgrs.append(pkgr.name)
                 else:
                     return pkg_version
         if return_pkgr_name and len(pkgrs):
             return pkgrs
-        self.pmc.known_installed[install_type][name] = False
+        self.pmc.set_installed(install_type, name, False)
         self.log.debug("Package {0} is not installed.".format(name))
         return False
 
@@ -245,11 +281,71 @@ class PackageManager(object):
             if install_type == "binary":
                 return False
             self.log.warn("Optional package {0} failed to install. Will pretend as if it had worked.".format(name))
-            self.pmc.known_installed[install_type][name] = True
+            self.pmc.set_installed(install_type, name, True)
             return True
-        self.pmc.known_installed[install_type][name] = bool(install_result)
+        self.pmc.set_installed(install_type, name, bool(install_result))
         return install_result
 
+    def prefetch(self, names):
+        """
+        Let all binary packagers query everything they need to know about
+        the packages in names at once, instead of running one query per
+        package later on.
+        """
+        recipes = [
+            recipe.get_recipe(name) for name in names
+            if not self.check_package_flag(name, 'forcebuild')
+        ]
+        for pkgr in self.binary_pkgrs:
+            pkgr.prefetch(recipes)
+
+    def get_binary_install_plan(self, name):
+        """
+        Figure out how package `name' would be installed from binaries,
+        without installing anything. Returns a tuple (packager, pkg_names),
+        where pkg_names are the packager-specific packages to install, or
+        None if no binary packager can install it.
+        """
+        r = recipe.get_recipe(name)
+        for pkgr in self.get_packagers(name, install_type="binary"):
+            pkg_names = pkgr.get_install_list(r)
+            if pkg_names is not None:
+                self.log.debug("Package {0} can be installed by {1}: {2}".format(
+                    name, pkgr.name, ", ".join(pkg_names) or "(already satisfied)"
+                ))
+                return (pkgr, pkg_names)
+        return None
+
+    def install_batch(self, plans):
+        """
+        Run the binary install plans for several packages, using a single
+        install transaction per packager.
+
+        - plans: Dictionary package name -> return value of
+                 get_binary_install_plan()
+
+        Nothing is verified here, and failures are not fatal: Call
+        installed() or install() on every package afterwards.
+        """
+        batches = OrderedDict()
+        for name, (pkgr, pkg_names) in plans.items():
+            batch = batches.setdefault(pkgr.name, (pkgr, []))[1]
+            batch.extend([x for x in pkg_names if x not in batch])
+        for pkgr, pkg_names in batches.values():
+            if not pkg_names:
+                continue
+            self.log.info("Installing binary packages using {0}: {1}".format(
+                pkgr.name, " ".join(pkg_names)
+            ))
+            try:
+                if not pkgr.install_batch(pkg_names):
+                    self.log.warn("Batch install using {0} failed.".format(pkgr.name))
+            except PBException as ex:
+                self.log.warn("Batch install using {0} failed: {1}".format(pkgr.name, str(ex).strip()))
+        # Installed status has changed:
+        for name in plans:
+            self.pmc.forget_installed(name)
+
     def update(self, name, verify=False, install_type=None):
         """
         Update the given package. Returns True if successful, False otherwise.
@@ -0,0 +1,160 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Persistent cache for packager queries (exists(), installed())
+"""
+
+import os
+import json
+import atexit
+import hashlib
+import threading
+from six import string_types
+from pybombs import pb_logging
+from pybombs.config_manager import config_manager
+
+CACHE_FILE_NAME = 'packager_cache.json'
+CACHE_VERSION = 1
+CACHEABLE_TYPES = string_types + (bool, int, float, type(None))
+
+def get_fingerprint(paths):
+    """
+    Return something that changes whenever any of the files or directories
+    in paths changes (for directories, this means files being added or
+    removed).
+    """
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            fingerprint.append([path, stat.st_mtime, stat.st_size])
+        except OSError:
+            fingerprint.append([path, None, None])
+    return fingerprint
+
+class PackagerCache(object):
+    """
+    Stores the results of packager queries on disk, so that consecutive
+    PyBOMBS runs don't have to query the system packagers again.
+
+    Results are stored per packager. Packagers that return files or
+    directories from get_db_files() are cached; when any of those change
+    (e.g. /var/lib/dpkg/status after installing a .deb), all of that
+    packager's results are discarded. Results are also keyed by a hash of
+    the recipe, so editing a recipe invalidates its results.
+    """
+    def __init__(self, filename=None):
+        self.log = pb_logging.logger.getChild("PackagerCache")
+        self.filename = filename or os.path.join(config_manager.local_cfg_dir, CACHE_FILE_NAME)
+        self._lock = threading.RLock()
+        # One lock per query that's currently running, so concurrent
+        # callers don't run the same query twice
+        self._query_locks = {}
+        self._data = None
+        self._dirty = False
+        self._recipe_digests = {}
+
+    def query(self, pkgr, query, recipe):
+        """
+        Return the result of pkgr.<query>(recipe), e.g. if query is
+        'installed', this returns pkgr.installed(recipe). Reads the result
+        from the cache if the packager's database hasn't changed.
+        """
+        db_files = pkgr.get_db_files()
+        if not db_files:
+            return getattr(pkgr, query)(recipe)
+        section_key = "{0}:{1}".format(pkgr.name, "|".join(db_files))
+        result_key = "{0}:{1}:{2}:{3}".format(
+            query, recipe.id, self._get_digest(recipe),
+            ",".join(config_manager.get_satisfier_tags()),
+        )
+        fingerprint = get_fingerprint(db_files)
+        with self._lock:
+            query_lock = self._query_locks.setdefault((section_key, result_key), threading.Lock())
+        with query_lock:
+            with self._lock:
+                self._load()
+                section = self._data.get(section_key)
+                if section is not None and section['fingerprint'] == fingerprint \
+                        and result_key in section['results']:
+                    self.log.trace("Cache hit: {0} {1}".format(section_key, result_key))
+                    return section['results'][result_key]
+            # The fingerprint was taken before running the query, so if the
+            # database changes in the meantime, this result won't be used.
+            result = getattr(pkgr, query)(recipe)
+            if not isinstance(result, CACHEABLE_TYPES):
+                return result
+            with self._lock:
+                section = self._data.get(section_key)
+                if section is None or section['fingerprint'] != fingerprint:
+                    section = {'fingerprint': fingerprint, 'results': {}}
+                    self._data[section_key] = section
+                section['results'][result_key] = result
+                if not self._dirty:
+                    self._dirty = True
+                    atexit.register(self.save)
+            return result
+
+    def save(self):
+        """
+        Write the cache to disk, if anything changed.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            # Other PyBOMBS processes may save at the same time:
+            tmp_filename = "{0}.{1}.tmp".format(self.filename, os.getpid())
+            try:
+                with open(tmp_filename, 'w') as cache_file:
+                    json.dump({'version': CACHE_VERSION, 'packagers': self._data}, cache_file)
+                os.rename(tmp_filename, self.filename)
+                self._dirty = False
+            except (IOError, OSError) as ex:
+                self.log.debug("Could not write packager cache {0}: {1}".format(self.filename, str(ex)))
+
+    def _load(self):
+        " Load cache from disk, unless it's already loaded. Lock must be held. "
+        if self._data is not None:
+            return
+        self._data = {}
+        if config_manager.refresh:
+            self.log.debug("Ignoring cached packager queries.")
+            return
+        try:
+            with open(self.filename) as cache_file:
+                data = json.load(cache_file)
+            if data.get('version') == CACHE_VERSION:
+                self._data = data.get('packagers', {})
+        except (IOError, OSError, ValueError, AttributeError):
+            self.log.debug("No valid packager cache found in {0}".format(self.filename))
+
+    def _get_digest(self, recipe):
+        " Return a hash of the recipe contents "
+        with self._lock:
+            if self._recipe_digests.get(recipe.id, (None,))[0] is not recipe:
+                recipe_hash = hashlib.md5(
+                    json.dumps(recipe.get_dict(), sort_keys=True, default=str).encode('utf-8')
+                ).hexdigest()
+                self._recipe_digests[recipe.id] = (recipe, recipe_hash)
+            return self._recipe_digests[recipe.id][1]
+
+# This is what you want to use:
+packager_cache = PackagerCache()
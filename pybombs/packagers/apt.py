@@ -23,6 +23,7 @@ Packager: apt
 """
 
 from __future__ import absolute_import
+import os
 import re
 import subprocess
 from pybombs.packagers.extern import ExternCmdPackagerBase, ExternPackager
@@ -30,10 +31,14 @@ from pybombs.utils import subproc
 from pybombs.utils import sysutils
 
 
+VERSION_RE = r'(?:\d+:)?(?P<ver>[0-9]+\.[0-9]+\.[0-9]+|[0-9]+\.[0-9]+|[0-9]+[a-z]+|[0-9]+)'
+
 class ExternalApt(ExternPackager):
     """
     Wrapper around apt(-get) and dpkg
     """
+    bulk_query = True
+
     def __init__(self, logger):
         ExternPackager.__init__(self, logger)
         # if sysutils.which('apt') is not None:
@@ -85,6 +90,37 @@ class ExternalApt(ExternPackager):
                 )
         return False
 
+    def get_available_versions(self, pkgnames):
+        """
+        Check which versions are available for all of pkgnames, using a
+        single `apt-cache policy' call.
+        """
+        if self.cache:
+            return {pkgname: self.get_available_version(pkgname) for pkgname in pkgnames}
+        self.log.trace("Checking {0} policy for {1} packages".format(self.searchcmd, len(pkgnames)))
+        # Output looks like this (one block per package):
+        # <pkgname>:
+        #   Installed: (none)
+        #   Candidate: <version>
+        #   ...
+        versions = {}
+        current_pkg = None
+        with open(os.devnull, 'w') as devnull:
+            out = subproc.get_output([self.searchcmd, "policy"] + list(pkgnames), stderr=devnull)
+        for line in out.split("\n"):
+            mobj = re.match(r'^(?P<pkg>\S+):$', line)
+            if mobj:
+                current_pkg = mobj.group('pkg')
+                continue
+            mobj = re.match(r'^\s+Candidate: (?P<cand>\S+)', line)
+            if mobj and current_pkg is not None:
+                ver = re.match(VERSION_RE, mobj.group('cand'))
+                versions[current_pkg] = ver.group('ver') if ver else False
+                if ver:
+                    self.log.debug("Package {0} has version {1} in repositories".format(current_pkg, ver.group('ver')))
+                current_pkg = None
+        return {pkgname: versions.get(pkgname, False) for pkgname in pkgnames}
+
     def get_installed_version(self, pkgname):
         """
         Use dpkg (or python-apt) to determine and return the currently installed version.
@@ -119,8 +155,14 @@ class ExternalApt(ExternPackager):
         """
         apt(-get) -y install pkgname
         """
+        return self.install_batch([pkgname])
+
+    def install_batch(self, pkgnames):
+        """
+        apt(-get) -y install pkgname1 pkgname2 ...
+        """
         try:
-            subproc.monitor_process([self.getcmd, "-y", "install", pkgname], elevate=True, throw=True)
+            subproc.monitor_process([self.getcmd, "-y", "install"] + list(pkgnames), elevate=True, throw=True)
             if self.cache:
                 self.cache.open()
             return True
@@ -170,3 +212,8 @@ class Apt(ExternCmdPackagerBase):
             and sysutils.which('apt-get') is not None)
         return has_dpkg and has_apt
 
+    def get_db_files(self):
+        """
+        dpkg's database, and apt's package lists (changed by apt-get update)
+        """
+        return ['/var/lib/dpkg/status', '/var/lib/apt/lists']
@@ -71,6 +71,41 @@ class PackagerBase(object):
         """
         raise NotImplementedError()
 
+    def get_db_files(self):
+        """
+        Return a list of files or directories that change whenever the
+        results of exists() or installed() may change (typically, the
+        packager's database). If this returns a non-empty list, the results
+        are cached on disk until one of these changes.
+        """
+        return []
+
+    def prefetch(self, recipes):
+        """
+        Optional: Query whatever information is required about the
+        recipes in one go, to speed up later calls.
+        """
+        pass
+
+    def get_install_list(self, recipe):
+        """
+        Return a list of packager-specific package names that need to be
+        installed to satisfy recipe, so that several recipes can be
+        installed in one go using install_batch(). An empty list means the
+        recipe is already satisfied.
+        Return None if this packager can't install recipe, or doesn't
+        support batch installs.
+        """
+        return None
+
+    def install_batch(self, pkg_names):
+        """
+        Install all the packager-specific packages in pkg_names (as returned
+        by get_install_list()) in a single transaction.
+        Return True on success.
+        """
+        raise NotImplementedError()
+
     def update(self, recipe):
         """
         Returns the updated version of package (identified by recipe)
@@ -92,10 +92,16 @@ class ExternalHomebrew(ExternPackager):
         """
         Call 'brew install pkgname' if we can satisfy the version requirements.
         """
+        return self.install_batch([pkgname])
+
+    def install_batch(self, pkgnames):
+        """
+        Call 'brew install pkgname1 pkgname2 ...'
+        """
         try:
             # Need to do some better checking here. Brew does not necessarily need sudo
             #sysutils.monitor_process(["sudo", "brew", "", "install", pkg_name])
-            subproc.monitor_process(["brew", "install", pkgname])
+            subproc.monitor_process(["brew", "install"] + list(pkgnames))
             return True
         except Exception as e:
             #self.log.trace(e)
@@ -22,15 +22,49 @@
 Packager: Base class for external packagers
 """
 
+import re
+import threading
 from pybombs.packagers.base import PackagerBase
 from pybombs.utils.vcompare import vcompare
 
+def parse_info_blocks(output):
+    """
+    Parse the output of commands like `dnf info', `zypper info' or
+    `pacman -Si', which print one block of `Key : Value' lines per package.
+    Returns a list of dicts, one per block.
+    """
+    blocks = []
+    current = {}
+    for line in output.split("\n"):
+        mobj = re.match(r'^(?P<key>[A-Za-z][^:]*?)\s*:\s*(?P<val>.*)$', line)
+        if mobj is None:
+            continue
+        key = mobj.group('key')
+        if key in current:
+            blocks.append(current)
+            current = {}
+        current[key] = mobj.group('val').strip()
+    if current:
+        blocks.append(current)
+    return blocks
+
 class ExternPackager(object):
     """
     Base class for wrappers around external packagers.
     """
+    # Set to True if get_available_versions() is faster than calling
+    # get_available_version() for every package
+    bulk_query = False
+
     def __init__(self, logger):
         self.log = logger
+        # pkgname -> result of get_available_version()
+        self._available_cache = {}
+        # Guards _available_cache and _available_locks. Lookups may run in
+        # several threads; there's one lock per package name, so every
+        # package is only queried once.
+        self._available_lock = threading.Lock()
+        self._available_locks = {}
 
     def get_available_version(self, pkgname):
         """
@@ -38,6 +72,50 @@ class ExternPackager(object):
         """
         raise NotImplementedError
 
+    def get_available_versions(self, pkgnames):
+        """
+        Return a dict pkgname -> get_available_version(pkgname) for all of
+        pkgnames. Packagers that can query many packages at once should
+        override this; the default is to query one at a time.
+        """
+        return {pkgname: self.get_available_version(pkgname) for pkgname in pkgnames}
+
+    def prefetch_available_versions(self, pkgnames):
+        """
+        Query the available versions of all of pkgnames that haven't been
+        queried yet, using a single call to get_available_versions().
+        Does nothing if this packager can't do bulk queries.
+        """
+        if not self.bulk_query:
+            return
+        with self._available_lock:
+            todo = sorted(set(x for x in pkgnames if x not in self._available_cache))
+        if not todo:
+            return
+        self.log.debug("Querying available versions of: {0}".format(", ".join(todo)))
+        results = self.get_available_versions(todo)
+        with self._available_lock:
+            for pkgname in todo:
+                self._available_cache.setdefault(pkgname, results.get(pkgname, False))
+
+    def lookup_available_version(self, pkgname):
+        """
+        Like get_available_version(), but uses prefetched results if possible.
+        """
+        with self._available_lock:
+            if pkgname in self._available_cache:
+                return self._available_cache[pkgname]
+            pkg_lock = self._available_locks.setdefault(pkgname, threading.Lock())
+        with pkg_lock:
+            with self._available_lock:
+                if pkgname in self._available_cache:
+                    return self._available_cache[pkgname]
+            version = self.get_available_version(pkgname)
+            with self._available_lock:
+                self._available_cache[pkgname] = version
+                self._available_locks.pop(pkgname, None)
+            return version
+
     def get_installed_version(self, pkgname):
         """
         Return the currently installed version. If pkgname is not installed,
@@ -51,6 +129,14 @@ class ExternPackager(object):
         """
         raise NotImplementedError
 
+    def install_batch(self, pkgnames):
+        """
+        Install all packages in the list pkgnames. Packagers that can do
+        this in a single transaction should override this; the default is
+        to install them one by one.
+        """
+        return all([self.install(pkgname) for pkgname in pkgnames])
+
     def update(self, pkgname):
         """
         Update pkgname using this packager.
@@ -72,6 +158,12 @@ class ExternReadOnlyPackager(ExternPackager):
         """
         return self.get_installed_version(pkgname)
 
+    def lookup_available_version(self, pkgname):
+        """
+        The installed version may change, so this is never cached.
+        """
+        return self.get_available_version(pkgname)
+
     def install(self, pkgname):
         """
         Can't install, by definition.
@@ -122,6 +214,46 @@ class ExternCmdPackagerBase(PackagerBase):
         self.log.trace("install({0}, static={1})".format(recipe.id, static))
         return self._packager_run_tree(recipe, self._package_install)
 
+    def prefetch(self, recipes):
+        """
+        Query the availability of all packages referenced in the satisfy
+        rules of recipes, in one go.
+        """
+        pkg_names = []
+        for recipe in recipes:
+            try:
+                satisfy_rule = recipe.get_package_reqs(self.pkgtype)
+            except KeyError:
+                continue
+            if satisfy_rule is None or satisfy_rule is True:
+                continue
+            pkg_names += satisfy_rule.get_names()
+        self.packager.prefetch_available_versions(pkg_names)
+
+    def get_install_list(self, recipe):
+        """
+        Return the list of packages that have to be installed through this
+        packager to satisfy recipe, or None if that's not possible.
+        Nothing is installed here.
+        """
+        self.log.trace("get_install_list({0})".format(recipe.id))
+        try:
+            satisfy_rule = recipe.get_package_reqs(self.pkgtype)
+        except KeyError:
+            return None
+        if satisfy_rule is None:
+            return None
+        if satisfy_rule is True:
+            return []
+        return satisfy_rule.select(self._package_install_list)
+
+    def install_batch(self, pkg_names):
+        """
+        Install all packages in pkg_names with a single packager call.
+        """
+        self.log.trace("install_batch({0})".format(pkg_names))
+        return self.packager.install_batch(pkg_names)
+
     def update(self, recipe):
         """
         Returns the updated version of package (identified by recipe)
@@ -167,6 +299,9 @@ class ExternCmdPackagerBase(PackagerBase):
                 )
             )
             return True
+        if satisfy_evaluator in (self._package_exists, self._package_install):
+            # Only these look at available versions
+            self.packager.prefetch_available_versions(satisfy_rule.get_names())
         self.log.trace("Calling ev for recursive satisfier rule evaluation")
         return satisfy_rule.ev(satisfy_evaluator)
 
@@ -175,7 +310,7 @@ class ExternCmdPackagerBase(PackagerBase):
         Check if `pkg_name` is installable through this packager.
         Return type same as 'exists()'.
         """
-        available_version = self.packager.get_available_version(pkg_name)
+        available_version = self.packager.lookup_available_version(pkg_name)
         if available_version is True:
             return True
         if available_version is False \
@@ -219,6 +354,17 @@ class ExternCmdPackagerBase(PackagerBase):
             return False
         return True
 
+    def _package_install_list(self, pkg_name, comparator=">=", required_version=None):
+        """
+        Return [] if `pkg_name` is already installed, [pkg_name] if it
+        can be installed, and None if it can't.
+        """
+        if self._package_installed(pkg_name, comparator, required_version):
+            return []
+        if self._package_exists(pkg_name, comparator, required_version):
+            return [pkg_name]
+        return None
+
     def _package_installed(self, pkg_name, comparator=">=", required_version=None):
         """
         Queries the current package manager to see if a package is installed.
@@ -22,8 +22,9 @@
 Packager: pacman
 """
 
+import re
 import subprocess
-from pybombs.packagers.extern import ExternCmdPackagerBase, ExternPackager
+from pybombs.packagers.extern import ExternCmdPackagerBase, ExternPackager, parse_info_blocks
 from pybombs.utils import subproc
 from pybombs.utils import sysutils
 
@@ -31,6 +32,8 @@ class ExternalPacman(ExternPackager):
     """
     Wrapper for pacman
     """
+    bulk_query = True
+
     def __init__(self, logger):
         ExternPackager.__init__(self, logger)
         self.command = None
@@ -60,6 +63,28 @@ class ExternalPacman(ExternPackager):
             self.log.error(str(ex))
         return False
 
+    def get_available_versions(self, pkgnames):
+        """
+        Return the available versions of all of pkgnames, using a single
+        `pacman -Si' call.
+        """
+        try:
+            out = subproc.get_output([self.command, "-Si"] + list(pkgnames), stderr=subprocess.STDOUT)
+        except Exception as ex:
+            self.log.error("Error running {0} -Si".format(self.command))
+            self.log.error(str(ex))
+            return {}
+        versions = {}
+        for block in parse_info_blocks(out):
+            name, ver = block.get('Name'), block.get('Version')
+            if not name or not ver:
+                continue
+            ver = re.match(r'[0-9,.]*', ver).group(0) or False
+            versions.setdefault(name, ver)
+            if ver:
+                self.log.debug("Package {0} has version {1} in {2}".format(name, ver, self.command))
+        return {pkgname: versions.get(pkgname, False) for pkgname in pkgnames}
+
     def get_installed_version(self, pkgname):
         """
         Return the currently installed version. If pkgname is not installed,
@@ -90,20 +115,26 @@ class ExternalPacman(ExternPackager):
         """
         pacman install pkgname
         """
-        return self._run_cmd(pkgname, '-S')
+        return self._run_cmd([pkgname], '-S')
+
+    def install_batch(self, pkgnames):
+        """
+        pacman install pkgname1 pkgname2 ...
+        """
+        return self._run_cmd(list(pkgnames), '-S')
 
     def update(self, pkgname):
         """
         pacman update pkgname
         """
-        return self._run_cmd(pkgname, '-S')
+        return self._run_cmd([pkgname], '-S')
 
-    def _run_cmd(self, pkgname, cmd):
+    def _run_cmd(self, pkgnames, cmd):
         """
         Call pacman with cmd.
         """
         try:
-            subproc.monitor_process([self.command, "--noconfirm", cmd, pkgname], elevate=True)
+            subproc.monitor_process([self.command, "--noconfirm", cmd] + pkgnames, elevate=True)
             return True
         except Exception as ex:
             self.log.error("Running `{0} {1}' failed.".format(self.command, cmd))
@@ -128,3 +159,8 @@ class Pacman(ExternCmdPackagerBase):
         """
         return self.packager.command is not None
 
+    def get_db_files(self):
+        """
+        pacman's local and sync databases
+        """
+        return ['/var/lib/pacman/local', '/var/lib/pacman/sync']
@@ -23,6 +23,8 @@ Packager: pip
 """
 
 import re
+import sys
+import site
 from pybombs.packagers.extern import ExternCmdPackagerBase, ExternPackager
 from pybombs.utils import sysutils
 from pybombs.utils import subproc
@@ -46,6 +48,18 @@ def detect_pip_exe():
         return 'pip'
     return None
 
+def get_site_packages_dirs():
+    """
+    Return all site-packages directories of the current Python interpreter.
+    """
+    dirs = [x for x in sys.path if x.endswith(('site-packages', 'dist-packages'))]
+    try:
+        dirs += site.getsitepackages() + [site.getusersitepackages()]
+    except AttributeError:
+        # Some virtualenvs ship a site.py without these
+        pass
+    return sorted(set(dirs))
+
 class ExternalPip(ExternPackager):
     """
     Wrapper for pip
@@ -115,6 +129,12 @@ class ExternalPip(ExternPackager):
         """
         return self._run_pip_install(pkgname)
 
+    def install_batch(self, pkgnames):
+        """
+        pip install pkgname1 pkgname2 ...
+        """
+        return self._run_pip_install(list(pkgnames))
+
     def update(self, pkgname):
         """
         pip install --upgrade pkgname
@@ -123,13 +143,16 @@ class ExternalPip(ExternPackager):
 
     def _run_pip_install(self, pkgname, update=False):
         """
-        Run pip install [--upgrade]
+        Run pip install [--upgrade]. pkgname may also be a list of packages.
         """
         try:
             command = [self.cmd, "install"]
             if update:
                 command.append('--upgrade')
-            command.append(pkgname)
+            if isinstance(pkgname, list):
+                command += pkgname
+            else:
+                command.append(pkgname)
             self.log.debug("Calling `{cmd}'".format(cmd=" ".join(command)))
             subproc.monitor_process(command, elevate=True)
             self.load_install_cache()
@@ -156,3 +179,9 @@ class Pip(ExternCmdPackagerBase):
         Return True if so.
         """
         return detect_pip_exe() is not None
+
+    def get_db_files(self):
+        """
+        The directories pip installs packages into
+        """
+        return get_site_packages_dirs()
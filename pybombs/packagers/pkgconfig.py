@@ -22,11 +22,30 @@
 Packager: pkg-config
 """
 
+import os
 import subprocess
 from pybombs.packagers.extern import ExternCmdPackagerBase, ExternReadOnlyPackager
 from pybombs.utils import sysutils
 from pybombs.utils import subproc
 
+PC_DIRS = None
+
+def get_pc_dirs():
+    """
+    Return the list of directories pkg-config looks for .pc files in.
+    """
+    global PC_DIRS
+    if PC_DIRS is None:
+        try:
+            default_dirs = subproc.check_output(
+                ["pkg-config", "--variable", "pc_path", "pkg-config"]
+            ).strip().split(os.pathsep)
+        except (OSError, subprocess.CalledProcessError):
+            default_dirs = []
+        env_dirs = os.environ.get('PKG_CONFIG_PATH', '').split(os.pathsep)
+        PC_DIRS = [x for x in env_dirs + default_dirs if x]
+    return PC_DIRS
+
 class ExternalPkgConfig(ExternReadOnlyPackager):
     """
     Wrapper around pkg-config
@@ -71,3 +90,8 @@ class PkgConfig(ExternCmdPackagerBase):
         """
         return sysutils.which('pkg-config') is not None
 
+    def get_db_files(self):
+        """
+        All directories pkg-config searches for .pc files
+        """
+        return get_pc_dirs()
@@ -72,8 +72,14 @@ class ExternalPort(ExternPackager):
         """
         Install package with 'port install'
         """
+        return self.install_batch([pkgname])
+
+    def install_batch(self, pkgnames):
+        """
+        Install all packages with a single 'port install'
+        """
         try:
-            subproc.monitor_process(["port", "install", pkgname], elevate=True, throw=True)
+            subproc.monitor_process(["port", "install"] + list(pkgnames), elevate=True, throw=True)
             return True
         except Exception as ex:
             self.log.error("Running port install failed.")
@@ -116,6 +116,13 @@ class ExternalPortage(ExternPackager):
         ver = self.get_available_version(pkgname)
         return self._run_cmd('='+pkgname+'-'+ver, '')
 
+    def install_batch(self, pkgnames):
+        """
+        emerge =pkgname1-ver1 =pkgname2-ver2 ...
+        """
+        atoms = ['='+pkgname+'-'+self.get_available_version(pkgname) for pkgname in pkgnames]
+        return self._run_cmd(atoms, '')
+
     def update(self, pkgname):
         """
         emerge --update =pkgname-ver
@@ -124,11 +131,13 @@ class ExternalPortage(ExternPackager):
         return self._run_cmd('='+pkgname+'-'+ver,'--update')
 
     def _run_cmd(self, pkgname, cmd):
+        " pkgname may be a single atom, or a list of atoms "
+        atoms = pkgname if isinstance(pkgname, list) else [pkgname]
         try:
             if cmd:
-                subproc.monitor_process(["emerge","--quiet-build","y","--ask","n",cmd,pkgname], elevate=True )
+                subproc.monitor_process(["emerge","--quiet-build","y","--ask","n",cmd] + atoms, elevate=True )
             else:
-                subproc.monitor_process(["emerge","--quiet-build","y","--ask","n",pkgname], elevate=True )
+                subproc.monitor_process(["emerge","--quiet-build","y","--ask","n"] + atoms, elevate=True )
             return True
         except Exception as e:
             self.log.error("Running `emerge {0}` failed.".format(cmd))
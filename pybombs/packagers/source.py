@@ -23,6 +23,7 @@ Packager: Source packages
 """
 
 import os
+import time
 import shutil
 from pybombs import pb_logging
 from pybombs.requirer import Requirer
@@ -52,6 +53,12 @@ class Source(PackagerBase):
         """
         return self.prefix.prefix_dir is not None
 
+    def get_db_files(self):
+        """
+        Everything we know about source packages is in the inventory
+        """
+        return self.inventory.get_files()
+
     def exists(self, recipe):
         """
         This will work whenever any sources are defined.
@@ -78,43 +85,43 @@ class Source(PackagerBase):
         May raise an exception if things go terribly wrong.
         Otherwise, return True on success and False if installing failed.
         """
-        if not os.path.isdir(self.prefix.src_dir):
-            os.makedirs(self.prefix.src_dir)
-        self.static = static
-        recipe.set_static(static)
-        cwd = os.getcwd()
-        get_state = lambda: (self.inventory.get_state(recipe.id) or 0)
-        set_state = lambda state: self.inventory.set_state(recipe.id, state) or self.inventory.save()
-        if not hasattr(recipe, 'source') or len(recipe.source) == 0:
-            self.log.warn("Cannot find a source URI for package {0}".format(recipe.id))
-            return False
-        from pybombs.fetcher import Fetcher
-        try:
-            if update:
-                if get_state() < self.inventory.STATE_CONFIGURED:
-                    raise PBException("Can't update package {0}, it's not yet configured.".format(recipe.id))
-                Fetcher().update(recipe)
-                set_state(self.inventory.STATE_CONFIGURED)
-            self.log.debug("State on package {0} is {1}".format(recipe.id, get_state()))
-            # First, make sure we have the sources
-            if not update and get_state() < self.inventory.STATE_FETCHED:
-                Fetcher().fetch(recipe)
-            else:
-                self.log.debug("Package {0} is already fetched.".format(recipe.id))
-            # If we know the package is fetched, we can attempt to build:
-            self.run_build(
-                recipe,
-                nuke_builddir=False,
-                warn_if_builddir_exists=not bool(update),
-                fail_if_builddir_missing=update,
-            )
-        except PBException as err:
-            os.chdir(cwd)
-            self.log.error("Problem occurred while building package {0}:\n{1}".format(recipe.id, str(err).strip()))
-            return False
-        ### Housekeeping
-        os.chdir(cwd)
-        return True
+        with self.prefix.lock.package(recipe.id):
+            if not os.path.isdir(self.prefix.src_dir):
+                os.makedirs(self.prefix.src_dir)
+            self.static = static
+            recipe.set_static(static)
+            get_state = lambda: (self.inventory.get_state(recipe.id) or 0)
+            set_state = lambda state: self.inventory.set_state(recipe.id, state) or self.inventory.save()
+            if not hasattr(recipe, 'source') or len(recipe.source) == 0:
+                self.log.warn("Cannot find a source URI for package {0}".format(recipe.id))
+                return False
+            if not update and get_state() >= self.inventory.STATE_INSTALLED:
+                # Another process installed it while we were waiting for the lock
+                self.log.info("Package {0} is already installed.".format(recipe.id))
+                return True
+            try:
+                if update:
+                    if get_state() < self.inventory.STATE_CONFIGURED:
+                        raise PBException("Can't update package {0}, it's not yet configured.".format(recipe.id))
+                    self.fetch(recipe, update=True)
+                    set_state(self.inventory.STATE_CONFIGURED)
+                self.log.debug("State on package {0} is {1}".format(recipe.id, get_state()))
+                # First, make sure we have the sources
+                if not update and get_state() < self.inventory.STATE_FETCHED:
+                    self.fetch(recipe)
+                else:
+                    self.log.debug("Package {0} is already fetched.".format(recipe.id))
+                # If we know the package is fetched, we can attempt to build:
+                self.run_build(
+                    recipe,
+                    nuke_builddir=False,
+                    warn_if_builddir_exists=not bool(update),
+                    fail_if_builddir_missing=update,
+                )
+            except PBException as err:
+                self.log.error("Problem occurred while building package {0}:\n{1}".format(recipe.id, str(err).strip()))
+                return False
+            return True
 
     def update(self, recipe):
         """
@@ -134,55 +141,51 @@ class Source(PackagerBase):
         """
         Remove a source-installed installation.
         """
-        cwd = os.getcwd()
-        pkg_src_dir = os.path.normpath(os.path.join(self.prefix.src_dir, recipe.id))
-        builddir = os.path.normpath(os.path.join(pkg_src_dir, recipe.installdir))
-        get_state = lambda: (self.inventory.get_state(recipe.id) or 0)
-        set_state = lambda state: self.inventory.set_state(recipe.id, state) or self.inventory.save()
-        if not os.path.isdir(pkg_src_dir):
-            set_state(0)
-            raise PBException("There should be a source dir in {0}, but there isn't.".format(pkg_src_dir))
-        if get_state() >= self.inventory.STATE_INSTALLED:
-            self.log.debug("Using build directory: {0}".format(builddir))
-            if not os.path.isdir(builddir):
-                self.log.warn("Package claims to be installed, but no build dir. Cannot do a proper uninstall.")
-            else:
-                try:
-                    os.chdir(builddir)
-                    self.make_clean(recipe)
-                    os.chdir(cwd)
-                except PBException as ex:
-                    self.log.warn("Uninstall failed: {0}.".format(str(ex)))
-                    return False
-            set_state(self.inventory.STATE_CONFIGURED)
-        if get_state() >= self.inventory.STATE_FETCHED:
-            self.log.debug("Removing directory {0}.".format(pkg_src_dir))
-            shutil.rmtree(pkg_src_dir)
-            self.inventory.remove(recipe.id)
-            self.inventory.save()
-        self.log.trace("Uninstall complete.")
-        return True
+        with self.prefix.lock.package(recipe.id):
+            pkg_src_dir = self.get_src_dir(recipe)
+            builddir = self.get_build_dir(recipe)
+            get_state = lambda: (self.inventory.get_state(recipe.id) or 0)
+            set_state = lambda state: self.inventory.set_state(recipe.id, state) or self.inventory.save()
+            if not os.path.isdir(pkg_src_dir):
+                set_state(0)
+                raise PBException("There should be a source dir in {0}, but there isn't.".format(pkg_src_dir))
+            if get_state() >= self.inventory.STATE_INSTALLED:
+                self.log.debug("Using build directory: {0}".format(builddir))
+                if not os.path.isdir(builddir):
+                    self.log.warn("Package claims to be installed, but no build dir. Cannot do a proper uninstall.")
+                else:
+                    try:
+                        self.make_clean(recipe)
+                    except PBException as ex:
+                        self.log.warn("Uninstall failed: {0}.".format(str(ex)))
+                        return False
+                set_state(self.inventory.STATE_CONFIGURED)
+            if get_state() >= self.inventory.STATE_FETCHED:
+                self.log.debug("Removing directory {0}.".format(pkg_src_dir))
+                shutil.rmtree(pkg_src_dir)
+                self.inventory.remove(recipe.id)
+                self.inventory.save()
+            self.log.trace("Uninstall complete.")
+            return True
 
     def rebuild(self, recipe, make_clean=False, nuke_builddir=False):
         """
         - Reset the state to 'fetched'
         - Trigger run_build
         """
-        self.inventory.set_state(recipe.id, self.inventory.STATE_FETCHED)
-        cwd = os.getcwd() # run_build() will change the directory
-        try:
-            self.run_build(
-                recipe,
-                make_clean=make_clean,
-                nuke_builddir=nuke_builddir,
-            )
-            os.chdir(cwd)
-            return True
-        except PBException as err:
-            self.log.error("Problem occurred while building package {0}:".format(recipe.id))
-            self.log.error(str(err).strip())
-        os.chdir(cwd)
-        return False
+        with self.prefix.lock.package(recipe.id):
+            self.inventory.set_state(recipe.id, self.inventory.STATE_FETCHED)
+            try:
+                self.run_build(
+                    recipe,
+                    make_clean=make_clean,
+                    nuke_builddir=nuke_builddir,
+                )
+                return True
+            except PBException as err:
+                self.log.error("Problem occurred while building package {0}:".format(recipe.id))
+                self.log.error(str(err).strip())
+            return False
 
     def run_build(self,
             recipe,
@@ -199,6 +202,8 @@ class Source(PackagerBase):
 
         Does not return a value, only raises PBException if something goes
         wrong ("net g'meckert isch lob genug").
+
+        The duration of every build phase is stored in the build history.
         """
         Requirer().assert_requirements(['build-essential'])
         if nuke_builddir:
@@ -206,8 +211,8 @@ class Source(PackagerBase):
         get_state = lambda: (self.inventory.get_state(recipe.id) or 0)
         set_state = lambda state: self.inventory.set_state(recipe.id, state) or self.inventory.save()
         # Set up the build dir
-        pkg_src_dir = os.path.normpath(os.path.join(self.prefix.src_dir, recipe.id))
-        builddir = os.path.normpath(os.path.join(pkg_src_dir, recipe.installdir))
+        pkg_src_dir = self.get_src_dir(recipe)
+        builddir = self.get_build_dir(recipe)
         self.log.debug("Using build directory: {0}".format(builddir))
         # The package source dir must exist, or something is wrong.
         if not os.path.isdir(pkg_src_dir):
@@ -231,26 +236,41 @@ class Source(PackagerBase):
                 if fail_if_builddir_missing:
                     raise PBException("Can't update package {0}, build directory seems to be missing.".format(recipe.id))
                 os.mkdir(builddir)
-        os.chdir(builddir)
         recipe.vars['builddir'] = builddir
+        makewidth = recipe.vars.get('makewidth', self.cfg.get('makewidth'))
+        phases = []
+        def _timed(phase, build_method):
+            " Run one build phase, and remember how long it took "
+            start_time = time.time()
+            try:
+                build_method(recipe)
+            finally:
+                phases.append((phase, time.time() - start_time))
         ### Run the build process
-        if get_state() < self.inventory.STATE_CONFIGURED:
-            self.configure(recipe)
-            set_state(self.inventory.STATE_CONFIGURED)
-        else:
-            self.log.debug("Package {0} is already configured.".format(recipe.id))
-        if get_state() < self.inventory.STATE_BUILT:
-            if make_clean:
-                self.make_clean(recipe)
-            self.make(recipe)
-            set_state(self.inventory.STATE_BUILT)
-        else:
-            self.log.debug("Package {0} is already built.".format(recipe.id))
-        if get_state() < self.inventory.STATE_INSTALLED:
-            self.make_install(recipe)
-            set_state(self.inventory.STATE_INSTALLED)
-        else:
-            self.log.debug("Package {0} is already installed.".format(recipe.id))
+        try:
+            if get_state() < self.inventory.STATE_CONFIGURED:
+                _timed('configure', self.configure)
+                set_state(self.inventory.STATE_CONFIGURED)
+            else:
+                self.log.debug("Package {0} is already configured.".format(recipe.id))
+            if get_state() < self.inventory.STATE_BUILT:
+                if make_clean:
+                    _timed('make_clean', self.make_clean)
+                _timed('make', self.make)
+                set_state(self.inventory.STATE_BUILT)
+            else:
+                self.log.debug("Package {0} is already built.".format(recipe.id))
+            if get_state() < self.inventory.STATE_INSTALLED:
+                _timed('install', self.make_install)
+                set_state(self.inventory.STATE_INSTALLED)
+            else:
+                self.log.debug("Package {0} is already installed.".format(recipe.id))
+        except PBException:
+            if phases:
+                self.prefix.build_history.record(recipe.id, phases, makewidth, success=False)
+            raise
+        if phases:
+            self.prefix.build_history.record(recipe.id, phases, makewidth)
 
     #########################################################################
     # Build methods: All of these must raise a PBException when something
@@ -264,13 +284,13 @@ class Source(PackagerBase):
         """
         self.log.debug("Configuring recipe {0}".format(recipe.id))
         self.log.debug("Using vars - {0}".format(recipe.vars))
-        self.log.debug("In cwd - {0}".format(os.getcwd()))
+        self.log.debug("In build dir - {0}".format(self.get_build_dir(recipe)))
         pre_cmd = recipe.var_replace_all(self.get_command('configure', recipe))
         cmd = self.filter_cmd(pre_cmd, recipe, 'config_filter')
         o_proc = None
         if self.log.getEffectiveLevel() >= pb_logging.DEBUG and not try_again:
-            o_proc = output_proc.OutputProcessorMake(preamble="Configuring: ")
-        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc) == 0:
+            o_proc = self.get_output_processor(preamble="Configuring: ")
+        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc, cwd=self.get_build_dir(recipe)) == 0:
             self.log.debug("Configure successful.")
             return True
         # OK, something went wrong.
@@ -286,13 +306,13 @@ class Source(PackagerBase):
         Run 'make clean' or whatever clears a build before recompiling
         """
         self.log.debug("Uninstalling from recipe {0}".format(recipe.id))
-        self.log.debug("In cwd - {0}".format(os.getcwd()))
+        self.log.debug("In build dir - {0}".format(self.get_build_dir(recipe)))
         o_proc = None
         if self.log.getEffectiveLevel() >= pb_logging.DEBUG and not try_again:
-            o_proc = output_proc.OutputProcessorMake(preamble="Uninstalling: ")
+            o_proc = self.get_output_processor(preamble="Uninstalling: ")
         cmd = recipe.var_replace_all(self.get_command('uninstall', recipe))
         cmd = self.filter_cmd(cmd, recipe, 'uninstall_filter')
-        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc) == 0:
+        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc, cwd=self.get_build_dir(recipe)) == 0:
             self.log.debug("Uninstall successful")
             return True
         # OK, something bad happened.
@@ -311,13 +331,13 @@ class Source(PackagerBase):
         makewidth to 1 and show the build output.
         """
         self.log.debug("Building recipe {0}".format(recipe.id))
-        self.log.debug("In cwd - {0}".format(os.getcwd()))
+        self.log.debug("In build dir - {0}".format(self.get_build_dir(recipe)))
         o_proc = None
         if self.log.getEffectiveLevel() >= pb_logging.DEBUG and not try_again and not recipe.make_interactive:
-            o_proc = output_proc.OutputProcessorMake(preamble="Building:    ")
+            o_proc = self.get_output_processor(preamble="Building:    ")
         cmd = recipe.var_replace_all(self.get_command('make', recipe))
         cmd = self.filter_cmd(cmd, recipe, 'make_filter')
-        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc) == 0:
+        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc, cwd=self.get_build_dir(recipe)) == 0:
             self.log.debug("Make successful")
             return True
         # OK, something bad happened.
@@ -333,13 +353,13 @@ class Source(PackagerBase):
         Run 'make test' or whatever checks a build was successful
         """
         self.log.debug("Verifying package {0}".format(recipe.id))
-        self.log.debug("In cwd - {0}".format(os.getcwd()))
+        self.log.debug("In build dir - {0}".format(self.get_build_dir(recipe)))
         o_proc = None
         if self.log.getEffectiveLevel() >= pb_logging.DEBUG and not try_again:
-            o_proc = output_proc.OutputProcessorMake(preamble="Verifying: ")
+            o_proc = self.get_output_processor(preamble="Verifying: ")
         cmd = recipe.var_replace_all(self.get_command('verify', recipe))
         cmd = self.filter_cmd(cmd, recipe, 'make_filter')
-        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc) == 0:
+        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc, cwd=self.get_build_dir(recipe)) == 0:
             self.log.debug("Verification successful")
             return True
         # OK, something bad happened.
@@ -356,13 +376,13 @@ class Source(PackagerBase):
         Run 'make install' or whatever copies the files to the right place.
         """
         self.log.debug("Installing package {0}".format(recipe.id))
-        self.log.debug("In cwd - {0}".format(os.getcwd()))
+        self.log.debug("In build dir - {0}".format(self.get_build_dir(recipe)))
         pre_cmd = recipe.var_replace_all(self.get_command('install', recipe))
         cmd = self.filter_cmd(pre_cmd, recipe, 'install_filter')
         o_proc = None
         if self.log.getEffectiveLevel() >= pb_logging.DEBUG:
-            o_proc = output_proc.OutputProcessorMake(preamble="Installing:  ")
-        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc) == 0:
+            o_proc = self.get_output_processor(preamble="Installing:  ")
+        if subproc.monitor_process(cmd, shell=True, o_proc=o_proc, cwd=self.get_build_dir(recipe)) == 0:
             self.log.debug("Installation successful")
             return True
         raise PBException("Installation failed")
@@ -371,6 +391,37 @@ class Source(PackagerBase):
     #########################################################################
     # Helpers
     #########################################################################
+    def fetch(self, recipe, update=False):
+        """
+        Fetch (or update, if update is True) the sources for recipe.
+        """
+        from pybombs.fetcher import Fetcher
+        if update:
+            return Fetcher().update(recipe)
+        return Fetcher().fetch(recipe)
+
+    def get_src_dir(self, recipe):
+        """
+        Return the directory the sources of recipe are fetched into.
+        """
+        return os.path.normpath(os.path.join(self.prefix.src_dir, recipe.id))
+
+    def get_build_dir(self, recipe):
+        """
+        Return the directory all build commands of recipe are run in.
+        """
+        return os.path.normpath(os.path.join(self.get_src_dir(recipe), recipe.installdir))
+
+    def get_output_processor(self, preamble):
+        """
+        Return the output processor for a build step. When multiple packages
+        are being built at the same time, progress bars would overwrite each
+        other, so the output is swallowed instead.
+        """
+        if int(self.cfg.get('jobs', 1)) > 1:
+            return output_proc.OutputProcessorSilent()
+        return output_proc.OutputProcessorMake(preamble=preamble)
+
     def filter_cmd(self, unfiltered_command, recipe, filter_flag):
         """
         - Get a filter from the recipe flags identified by filter_flag
@@ -25,7 +25,7 @@ Packager: zypper (OpenSUSE)
 import os
 import re
 import subprocess
-from pybombs.packagers.extern import ExternCmdPackagerBase, ExternPackager
+from pybombs.packagers.extern import ExternCmdPackagerBase, ExternPackager, parse_info_blocks
 from pybombs.utils import subproc
 from pybombs.utils import sysutils
 from pybombs.utils import utils
@@ -34,6 +34,8 @@ class ExternalZypper(ExternPackager):
     """
     Wrapper for zypper
     """
+    bulk_query = True
+
     def __init__(self, logger):
         ExternPackager.__init__(self, logger)
         self.command = None
@@ -69,6 +71,33 @@ class ExternalZypper(ExternPackager):
             self.log.error(str(ex))
         return False
 
+    def get_available_versions(self, pkgnames):
+        """
+        Return the available versions of all of pkgnames, using a single
+        `zypper info' call.
+        """
+        try:
+            out = subproc.get_output(
+                [self.command, "info"] + list(pkgnames),
+                stderr=subprocess.STDOUT,
+                env=utils.dict_merge(os.environ, {'LC_ALL': 'C'}),
+            )
+        except Exception as ex:
+            self.log.error("Error running {0} info".format(self.command))
+            self.log.error(str(ex))
+            return {}
+        versions = {}
+        for block in parse_info_blocks(out):
+            name, ver = block.get('Name'), block.get('Version')
+            if not name or not ver:
+                continue
+            versions.setdefault(name, ver)
+            versions.setdefault("{0}.{1}".format(name, block.get('Arch')), ver)
+        for pkgname in pkgnames:
+            if pkgname in versions:
+                self.log.debug("Package {0} has version {1} in {2}".format(pkgname, versions[pkgname], self.command))
+        return {pkgname: versions.get(pkgname, False) for pkgname in pkgnames}
+
     def get_installed_version(self, pkgname):
         """
         Return the currently installed version. If pkgname is not installed,
@@ -133,20 +162,26 @@ class ExternalZypper(ExternPackager):
         """
         zypper install pkgname
         """
-        return self._run_cmd(pkgname, 'install')
+        return self._run_cmd([pkgname], 'install')
+
+    def install_batch(self, pkgnames):
+        """
+        zypper install pkgname1 pkgname2 ...
+        """
+        return self._run_cmd(list(pkgnames), 'install')
 
     def update(self, pkgname):
         """
         zypper update pkgname
         """
-        return self._run_cmd(pkgname, 'update')
+        return self._run_cmd([pkgname], 'update')
 
-    def _run_cmd(self, pkgname, cmd):
+    def _run_cmd(self, pkgnames, cmd):
         """
         Call zypper with cmd.
         """
         try:
-            subproc.monitor_process([self.command, cmd, "-y", pkgname], elevate=True)
+            subproc.monitor_process([self.command, cmd, "-y"] + pkgnames, elevate=True)
             return True
         except Exception as ex:
             self.log.error("Running `{0} install' failed.".format(self.command))
@@ -171,3 +206,13 @@ class Zypper(ExternCmdPackagerBase):
         """
         return self.packager.command is not None
 
+    def get_db_files(self):
+        """
+        The rpm database, and the repository metadata
+        """
+        return [
+            '/var/lib/rpm/Packages',
+            '/var/lib/rpm/rpmdb.sqlite',
+            '/usr/lib/sysimage/rpm/rpmdb.sqlite',
+            '/var/cache/zypp/solv',
+        ]
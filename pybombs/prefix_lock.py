@@ -0,0 +1,312 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Locks, so several PyBOMBS processes can work on the same prefix
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from pybombs import pb_logging
+from pybombs.pb_exception import PBException
+
+POLL_INTERVAL = 0.2 # s
+WAIT_MESSAGE_INTERVAL = 60 # s
+# errnos that mean the file system can't lock files (e.g. some NFS setups)
+NO_LOCKING_ERRNOS = (errno.ENOLCK, errno.EOPNOTSUPP, errno.ENOSYS)
+
+def get_lock_timeout():
+    """
+    Return the 'lock_timeout' config option in seconds, or None if we wait
+    for locks forever.
+    """
+    from pybombs.config_manager import config_manager
+    try:
+        timeout = float(config_manager.get('lock_timeout', 0))
+    except ValueError:
+        raise PBException("Invalid lock_timeout: {0}".format(config_manager.get('lock_timeout')))
+    return timeout if timeout > 0 else None
+
+def _pid_is_running(pid):
+    " Return False if there's no process pid on this host "
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        return ex.errno != errno.ESRCH
+    return True
+
+class FileLock(object):
+    """
+    An advisory lock (flock()) on lock_file, either shared or exclusive.
+
+    The kernel drops the lock when the holding process exits, no matter how,
+    so a crashed PyBOMBS can't leave a lock behind. While holding an exclusive
+    lock, we write our PID, host name and command line into the lock file, so
+    whoever is waiting for it can tell who they're waiting for (and whether
+    that process is still around).
+
+    If the lock file can't be created, or the file system doesn't support
+    locking, acquire() logs that and returns False, and we carry on without
+    the lock.
+    """
+    def __init__(self, lock_file, exclusive=True, timeout=None, description=None):
+        self.log = pb_logging.logger.getChild("FileLock")
+        self.lock_file = lock_file
+        self.exclusive = exclusive
+        self.timeout = timeout
+        self.description = description or lock_file
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def is_locked(self):
+        " Return True if we're holding the lock "
+        return self._fd is not None
+
+    def acquire(self):
+        """
+        Wait until we get the lock. Raises a PBException if that takes longer
+        than timeout seconds.
+        """
+        if self._fd is not None or fcntl is None:
+            return self._fd is not None
+        lock_dir = os.path.dirname(self.lock_file)
+        try:
+            if self.exclusive and not os.path.isdir(lock_dir):
+                os.makedirs(lock_dir)
+            fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+        except (IOError, OSError) as ex:
+            if ex.errno == errno.EEXIST and os.path.isdir(lock_dir):
+                return self.acquire() # Someone else created lock_dir
+            self.log.debug("Not locking {0}: {1}".format(self.description, str(ex)))
+            return False
+        # Don't let build commands inherit the lock:
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+        start_time = time.time()
+        next_message = start_time
+        while True:
+            try:
+                fcntl.flock(fd, (fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+                break
+            except (IOError, OSError) as ex:
+                if ex.errno in (errno.EAGAIN, errno.EACCES):
+                    pass
+                elif ex.errno in NO_LOCKING_ERRNOS:
+                    os.close(fd)
+                    self.log.warn("Can't lock {0} ({1}), continuing without lock.".format(self.description, str(ex)))
+                    return False
+                else:
+                    os.close(fd)
+                    self.log.error("Can't lock {0}: {1}".format(self.description, str(ex)))
+                    raise PBException("Can't lock {0}.".format(self.description))
+            now = time.time()
+            if self.timeout is not None and now - start_time >= self.timeout:
+                os.close(fd)
+                self.log.error("Timed out after {0:.0f}s waiting for {1} ({2}).".format(
+                    now - start_time, self.description, self.get_owner_info()
+                ))
+                raise PBException("Timed out waiting for {0}.".format(self.description))
+            if now >= next_message:
+                self.log.info("Waiting for {0} ({1})...".format(self.description, self.get_owner_info()))
+                next_message = now + WAIT_MESSAGE_INTERVAL
+            time.sleep(POLL_INTERVAL)
+        if self.exclusive:
+            owner = {
+                'pid': os.getpid(),
+                'host': socket.gethostname(),
+                'time': time.time(),
+                'command': " ".join(sys.argv),
+            }
+            try:
+                os.ftruncate(fd, 0)
+                os.write(fd, json.dumps(owner).encode('utf-8'))
+            except OSError:
+                pass
+        self._fd = fd
+        return True
+
+    def release(self):
+        " Release the lock, if we're holding it "
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if self.exclusive:
+                os.ftruncate(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        except (IOError, OSError):
+            pass
+        os.close(fd)
+
+    def get_owner_info(self):
+        """
+        Return a description of whoever is holding the lock. If the lock file
+        names a process on this host that's no longer running, the lock
+        must be held by a process it left behind (or by a shared lock holder),
+        so we say that instead.
+        """
+        try:
+            with open(self.lock_file) as lock_file:
+                owner = json.loads(lock_file.read())
+            pid = int(owner['pid'])
+            host = owner['host']
+            since = time.time() - float(owner['time'])
+        except (IOError, OSError, ValueError, TypeError, KeyError):
+            return "held by another process"
+        if host == socket.gethostname() and not _pid_is_running(pid):
+            return "stale owner: PID {0} has exited, the lock is now held by another process " \
+                    "(maybe one that PID {0} started)".format(pid)
+        return "held by PID {pid} on {host} for {since:.0f}s: {cmd}".format(
+            pid=pid, host=host, since=since, cmd=owner.get('command', '?')
+        )
+
+# Locks this process holds, shared by all PrefixLock objects:
+# lock file -> FileLock for prefix locks, and
+# (lock file, thread ID) -> [FileLock, count] for package locks
+_prefix_locks = {}
+_package_locks = {}
+_registry_lock = threading.Lock()
+
+class PrefixLock(object):
+    """
+    The locking protocol for a prefix. All lock files live in the 'locks'
+    subdirectory of the prefix config directory.
+
+    - The prefix lock: Commands that install, update or remove individual
+      packages hold it shared, so they can run at the same time. Commands
+      that work on the prefix as a whole (e.g. replacing the inventory or
+      deploying the prefix) hold it exclusively. Once taken, it's held
+      until the process exits or unlock_prefix() is called.
+    - Package locks: Exclusive, one per package. Whoever fetches, builds or
+      removes a package holds its lock, so concurrent runs that work on
+      different packages proceed in parallel. After getting a package lock,
+      the inventory is re-read, so we see what the previous holder did.
+      Package locks are reentrant within a thread.
+
+    Package locks are only ever taken one at a time per thread, and while
+    holding one nobody waits for the prefix lock, so this can't deadlock.
+    """
+    lock_dir_name = 'locks'
+    prefix_lock_name = 'prefix.lock'
+
+    def __init__(self, prefix_dir, prefix_cfg_dir, inventory=None):
+        self.log = pb_logging.logger.getChild("PrefixLock")
+        self.prefix_dir = prefix_dir
+        self.lock_dir = os.path.join(prefix_cfg_dir, self.lock_dir_name)
+        self.inventory = inventory
+
+    def lock_prefix(self, exclusive=False):
+        """
+        Lock the prefix. If we already hold a shared prefix lock and want an
+        exclusive one, it's converted (not atomically).
+        """
+        lock_file = os.path.join(self.lock_dir, self.prefix_lock_name)
+        with _registry_lock:
+            held_lock = _prefix_locks.get(lock_file)
+            if held_lock is not None:
+                if held_lock.exclusive or not exclusive:
+                    return
+                del _prefix_locks[lock_file]
+                held_lock.release()
+        if not os.path.isdir(self.lock_dir):
+            try:
+                os.makedirs(self.lock_dir)
+            except OSError:
+                pass # FileLock will tell us
+        prefix_lock = FileLock(
+            lock_file,
+            exclusive=exclusive,
+            timeout=get_lock_timeout(),
+            description="{0} lock on prefix {1}".format(
+                "exclusive" if exclusive else "shared", self.prefix_dir
+            ),
+        )
+        if not prefix_lock.acquire():
+            return
+        self.log.debug("Got {0}".format(prefix_lock.description))
+        with _registry_lock:
+            _prefix_locks[lock_file] = prefix_lock
+
+    def unlock_prefix(self):
+        " Release the prefix lock "
+        lock_file = os.path.join(self.lock_dir, self.prefix_lock_name)
+        with _registry_lock:
+            prefix_lock = _prefix_locks.pop(lock_file, None)
+        if prefix_lock is not None:
+            prefix_lock.release()
+
+    @contextmanager
+    def package(self, pkg):
+        """
+        Context manager: Hold the lock for package pkg.
+        """
+        key = (os.path.join(self.lock_dir, 'packages', pkg + '.lock'), threading.current_thread().ident)
+        with _registry_lock:
+            held_lock = _package_locks.get(key)
+            if held_lock is not None:
+                held_lock[1] += 1
+        if held_lock is None:
+            pkg_lock = FileLock(
+                key[0],
+                exclusive=True,
+                timeout=get_lock_timeout(),
+                description="lock on package {0}".format(pkg),
+            )
+            pkg_lock.acquire()
+            if self.inventory is not None:
+                self.inventory.refresh()
+            with _registry_lock:
+                held_lock = _package_locks[key] = [pkg_lock, 1]
+        try:
+            yield
+        finally:
+            with _registry_lock:
+                held_lock[1] -= 1
+                if held_lock[1] == 0:
+                    del _package_locks[key]
+                    held_lock[0].release()
+
+if __name__ == "__main__":
+    import tempfile
+    test_lock_file = os.path.join(tempfile.mkdtemp(), 'test.lock')
+    with FileLock(test_lock_file) as test_lock:
+        print("Locked: {0}".format(test_lock.is_locked()))
+        if os.fork() == 0:
+            try:
+                FileLock(test_lock_file, exclusive=False, timeout=1).acquire()
+            except PBException as test_ex:
+                print(str(test_ex))
+            os._exit(0)
+        os.wait()
@@ -25,15 +25,18 @@ Recipe representation class.
 import re
 import os
 import shlex
-from six import iteritems
+import threading
+from copy import deepcopy
+from collections import OrderedDict
 try:
-    from collections.abc import Sequence
+    from collections.abc import Sequence, Mapping
 except ImportError:
-    from collections import Sequence
+    from collections import Sequence, Mapping
 
 
 from pybombs import pb_logging
 from pybombs import recipe_manager
+from pybombs import recipe_index
 from pybombs import config_manager
 from pybombs.pb_exception import PBException
 from pybombs.config_file import PBConfigFile
@@ -44,11 +47,20 @@ class PBPackageRequirement(object):
     Store info on a dependency package:
     - Package name (typically deb or rpm or something like that)
     - Version + Comparator
+
+    Requirements are shared between all users of the same satisfy
+    expression (see parse_package_reqs()), so they can't be modified.
     """
-    def __init__(self, name):
-        self.name = name
-        self.compare = None
-        self.version = None
+    __slots__ = ('name', 'compare', 'version', '_names')
+
+    def __init__(self, name, compare=None, version=None):
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'compare', compare)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, '_names', (name,))
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("Package requirements are immutable.")
 
     def ev(self, func):
         """
@@ -56,155 +68,211 @@ class PBPackageRequirement(object):
         """
         return func(self.name, self.compare or ">=", self.version)
 
+    def select(self, func):
+        """
+        Like ev(), but func() returns a list of things this requirement
+        needs (or None if it can't be satisfied), and the lists of all
+        requirements needed to satisfy the whole expression get merged.
+        """
+        return func(self.name, self.compare or ">=", self.version)
+
+    def get_names(self):
+        " Return a list of all package names referenced in this requirement "
+        return list(self._names)
+
     def __str__(self, lvl=0):
         return " "*lvl + "PackageRequirement({0}, {1}, {2})".format(self.name, self.compare, self.version)
 
 
 class PBPackageRequirementPair(object):
     """
-    Joining logic for multiple dep packages (rpms, debs, etc.)
+    Joining logic for multiple dep packages (rpms, debs, etc.). Immutable,
+    like PBPackageRequirement.
     """
-    def __init__(self, pkg):
-        self.first = pkg
-        self.second = None
-        self.combiner = None
+    __slots__ = ('first', 'second', 'combiner', '_names')
+
+    def __init__(self, first, combiner, second):
+        assert combiner in ('&&', '||')
+        object.__setattr__(self, 'first', first)
+        object.__setattr__(self, 'combiner', combiner)
+        object.__setattr__(self, 'second', second)
+        names = first.get_names()
+        names += [x for x in second.get_names() if x not in names]
+        object.__setattr__(self, '_names', tuple(names))
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("Package requirements are immutable.")
 
     def ev(self, func):
-        if self.combiner is None or self.second is None:
-            return self.first.ev(func)
-        elif self.combiner == "&&":
+        if self.combiner == "&&":
             return self.first.ev(func) and self.second.ev(func)
-        elif self.combiner == "||":
-            return self.first.ev(func) or self.second.ev(func)
+        return self.first.ev(func) or self.second.ev(func)
+
+    def get_names(self):
+        " Return a list of all package names referenced in this requirement "
+        return list(self._names)
+
+    def select(self, func):
+        " See PBPackageRequirement.select() "
+        first = self.first.select(func)
+        if self.combiner == "&&":
+            if first is None:
+                return None
+            second = self.second.select(func)
+            if second is None:
+                return None
+            return first + second
+        if first is not None:
+            return first
+        return self.second.select(func)
 
     def __str__(self, lvl=0):
         a = " "*lvl + "PBPackageRequirementPair: ({0})\n".format(self.combiner)
         a = a + " "*lvl + self.first.__str__(1) + "\n"
-        if self.second:
-            a = a + " "*lvl + self.second.__str__(1)
-        else:
-            a = a + " "*lvl + "None"
+        a = a + " "*lvl + self.second.__str__(1)
         return a
 
 class PBPackageRequirementScanner(object):
     """
     Turns a package requirement string (something like
     libfoo >= 2.0 && libbar >= 3.0) into a PBPackageRequirement(Pair).
+
+    && binds tighter than ||, i.e. 'a || b && c' means 'a || (b && c)'.
+    Both are left-associative. Grammar:
+
+        expr := and_expr ( '||' and_expr )*
+        and_expr := atom ( '&&' atom )*
+        atom := '(' expr ')' | PKGNAME+ [ COMPARATOR ] [ VERSION ]
     """
-    ### Tokens => Functors
-    # Token matching is simple: If the key is a string, it must match. If it's
-    # a tuple, the token must be an element. If it's a regular expression
-    # MatchObject, it has to match().
-    lexicon = {
-        # Package name
-        re.compile(r'[a-zA-Z-][a-zA-Z0-9./+_-]+'): lambda s, tok: s.pl_pkg(tok),
-        # Version
-        re.compile(r'[0-9]+[0-9.]*'): lambda s, tok: s.pl_ver(tok),
-        # Open parens
-        '(': lambda s, tok: s.pl_lpar(tok),
-        # Close parens
-        ')': lambda s, tok: s.pl_rpar(tok),
-        # Comparators
-        ('>=', '<=', '==', '!='): lambda s, tok: s.pl_cmp(tok),
-        # Combiners
-        ('&&', '||'): lambda s, tok: s.pl_cmb(tok),
-    }
+    # Package names may consist of several tokens (e.g. 'foo bar' is the
+    # package 'foo bar')
+    re_pkg = re.compile(r'[a-zA-Z-][a-zA-Z0-9./+_-]+')
+    re_ver = re.compile(r'[0-9]+[0-9.]*')
+    comparators = ('>=', '<=', '==', '!=')
+    combiners = ('&&', '||')
 
     def __init__(self, req_string):
         self.preq = None
-        self.stack = []
         if not req_string:
             return
+        self.req_string = req_string
+        self.tokens = [(self.classify(tok), tok) for tok in self.tokenize(req_string)]
+        self.pos = 0
+        self.preq = self.parse_expr()
+        if self.pos != len(self.tokens):
+            raise PBException("Parsing Error. Did not expect `{0}' in `{1}'.".format(
+                self.tokens[self.pos][1], req_string))
+
+    @staticmethod
+    def tokenize(req_string):
+        " Split req_string into tokens "
         lexer = shlex.shlex(req_string)
         lexer.wordchars += '-<>=.&|/+'
-        while True:
-            token = lexer.get_token()
-            if token == lexer.eof:
-                self.end_distro_pkg_expr()
-                break
-            self.get_token_functor(token)(self, token)
-
-    def get_token_functor(self, token):
-        " Return a functor for a given token or throw "
-        for (match, functor) in self.lexicon.items():
-            if isinstance(match, str) and token == match:
-                return functor
-            if isinstance(match, tuple) and token in match:
-                return functor
-            if hasattr(match, 'match') and match.match(token):
-                return functor
+        return list(iter(lexer.get_token, lexer.eof))
+
+    def classify(self, token):
+        " Return the type of token, or throw "
+        if token in ('(', ')'):
+            return token
+        if token in self.comparators:
+            return 'cmp'
+        if token in self.combiners:
+            return token
+        if self.re_pkg.match(token):
+            return 'pkg'
+        if self.re_ver.match(token):
+            return 'ver'
         raise PBException("Invalid token: {0}".format(token))
 
-    def pl_pkg(self, pkg_name):
-        " Called in a package requirements list, when a package name is found "
-        if self.preq is None:
-            self.preq = PBPackageRequirement(pkg_name)
-        elif isinstance(self.preq, PBPackageRequirement):
-            if self.preq.compare is None:
-                self.preq.name = " ".join((self.preq.name, pkg_name))
-            else:
-                raise PBException("Parsing Error. Did not expect package name here.")
-        elif isinstance(self.preq, PBPackageRequirementPair):
-            if self.preq.second is None:
-                self.preq.second = PBPackageRequirement(pkg_name)
-            else:
-                if self.preq.second.compare is None:
-                    self.preq.second.name = " ".join((self.preq.second.name, pkg_name))
-                else:
-                    raise PBException("Parsing Error. Did not expect package name here ({0}).".format(self.preq.second))
-        else:
-            raise PBException("Random Foobar Parsing Error.")
-
-    def pl_lpar(self, par):
-        " Called in a package requirements list, when lparens are found "
-        assert par == "("
-        self.stack.append(self.preq)
-        self.preq = None
-
-    def pl_rpar(self, par):
-        " Called in a package requirements list, when rparens are found "
-        assert par == ")"
-        prev = self.stack.pop()
-        if prev is not None:
-            prev.second = self.preq
-            self.preq = prev
-
-    def pl_cmp(self, cmpr):
-        " Called in a package requirements list, when version comparator is found "
-        if isinstance(self.preq, PBPackageRequirement):
-            self.preq.compare = cmpr
-        else:
-            self.preq.second.compare = cmpr
-
-    def pl_ver(self, ver):
-        " Called in a package requirements list, when version number is found "
-        if isinstance(self.preq, PBPackageRequirement):
-            self.preq.version = ver
-        else:
-            self.preq.second.version = ver
-
-    def pl_cmb(self, cmb):
-        " Called in a package requirements list, when a logical combiner (||, &&) is found "
-        if self.preq is None:
-            raise PBException("Parsing Error. Did not expect combiner here.")
-        self.preq = PBPackageRequirementPair(self.preq)
-        self.preq.combiner = cmb
-
-    def end_distro_pkg_expr(self):
-        " Called when a list of package reqs is finished "
-        self.stack = []
-        return "foo"
+    def peek(self):
+        " Return the type of the next token, or None if there are none left "
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def next_token(self, expected=None):
+        " Consume the next token and return its value "
+        if expected is not None and self.peek() != expected:
+            raise PBException("Parsing Error. Expected {0}, got {1} in `{2}'.".format(
+                {'pkg': 'package name'}.get(expected, "`{0}'".format(expected)),
+                "`{0}'".format(self.tokens[self.pos][1]) if self.peek() else "end of expression",
+                self.req_string,
+            ))
+        self.pos += 1
+        return self.tokens[self.pos - 1][1]
+
+    def parse_expr(self):
+        " expr := and_expr ( '||' and_expr )* "
+        preq = self.parse_and_expr()
+        while self.peek() == '||':
+            preq = PBPackageRequirementPair(preq, self.next_token(), self.parse_and_expr())
+        return preq
+
+    def parse_and_expr(self):
+        " and_expr := atom ( '&&' atom )* "
+        preq = self.parse_atom()
+        while self.peek() == '&&':
+            preq = PBPackageRequirementPair(preq, self.next_token(), self.parse_atom())
+        return preq
+
+    def parse_atom(self):
+        " atom := '(' expr ')' | PKGNAME+ [ COMPARATOR ] [ VERSION ] "
+        if self.peek() == '(':
+            self.next_token()
+            preq = self.parse_expr()
+            self.next_token(')')
+            return preq
+        names = [self.next_token('pkg')]
+        while self.peek() == 'pkg':
+            names.append(self.next_token())
+        compare = self.next_token() if self.peek() == 'cmp' else None
+        version = self.next_token() if self.peek() == 'ver' else None
+        return PBPackageRequirement(" ".join(names), compare, version)
 
     def get_preq(self):
         " Return result, or None for no requirements. "
         return self.preq
 
+_PACKAGE_REQS_CACHE = {}
+def parse_package_reqs(req_string):
+    """
+    Return the PBPackageRequirement(Pair) for req_string, or None for no
+    requirements. Every expression is only parsed once, all callers with
+    the same req_string share the result.
+    """
+    if req_string not in _PACKAGE_REQS_CACHE:
+        _PACKAGE_REQS_CACHE[req_string] = PBPackageRequirementScanner(req_string).get_preq()
+    return _PACKAGE_REQS_CACHE[req_string]
+
+
+# Starts with a $, unless preceded by \
+VAR_RE = re.compile(r'(?<!\\)\$([a-z][a-z0-9_]*)')
+_VAR_TEMPLATE_CACHE = {}
+def parse_var_template(s):
+    """
+    Split s into a tuple of (is_var, segment) pairs, where segment is
+    either a literal piece of s or the name of a variable ('$foo' -> 'foo').
+    Every string is only parsed once.
+    """
+    if s not in _VAR_TEMPLATE_CACHE:
+        segments = []
+        pos = 0
+        for mo in VAR_RE.finditer(s):
+            if mo.start() > pos:
+                segments.append((False, s[pos:mo.start()]))
+            segments.append((True, mo.group(1)))
+            pos = mo.end()
+        if pos < len(s):
+            segments.append((False, s[pos:]))
+        _VAR_TEMPLATE_CACHE[s] = tuple(segments)
+    return _VAR_TEMPLATE_CACHE[s]
+
 
 def load_recipe_from_file(filename):
     """
     Turn a .lwr file into a valid recipe datastructure.
     """
-    data = PBConfigFile(filename).get()
+    data = PBConfigFile(filename, read_only=True).get()
     # Make sure dependencies is always a valid list:
     if 'depends' in data and data['depends'] is not None:
         if not isinstance(data['depends'], Sequence):
@@ -226,48 +294,209 @@ def normalize_package_data(package_data_dict):
     return package_data_dict
 
 
+TEMPLATE_CACHE = {}
+TEMPLATE_CACHE_LOCK = threading.RLock()
+def get_template(name, _resolving=()):
+    """
+    Return the data of template `name', with everything it inherits from
+    already merged in, or None if there is no such template.
+
+    Templates are only loaded and resolved once per process (and are
+    stored in the recipe index of the template directory). The returned
+    data is shared between all recipes, and must not be modified.
+    """
+    with TEMPLATE_CACHE_LOCK:
+        if name in TEMPLATE_CACHE:
+            return TEMPLATE_CACHE[name]
+        log = pb_logging.logger.getChild("get_template")
+        try:
+            filename = recipe_manager.recipe_manager.get_template_filename(name)
+        except PBException:
+            log.warn("Recipe attempting to inherit from unknown template {0}".format(name))
+            return None
+        template_dir = config_manager.config_manager.get_template_dir()
+        index = recipe_index.get_index(os.path.dirname(filename))
+        data = index.get_recipe_data(filename)
+        if data is None:
+            fingerprints = [
+                (template_dir, recipe_index.get_file_fingerprint(template_dir)),
+                (filename, recipe_index.get_file_fingerprint(filename)),
+            ]
+            log.trace("Loading template file: {0}".format(filename))
+            data = recipe_index.to_plain(load_recipe_from_file(filename))
+            parent_name = data.get('inherit')
+            if parent_name in _resolving + (name,):
+                log.warn("Template {0} inherits from itself".format(name))
+            elif parent_name:
+                parent = get_template(parent_name, _resolving + (name,))
+                if parent is not None:
+                    fingerprints += parent[1]
+                    data = inherit_data(parent[0], data)
+            data = (data, fingerprints)
+            index.set_recipe_data(filename, data, fingerprints)
+        TEMPLATE_CACHE[name] = data
+        return data
+
+def inherit_data(parent_data, data):
+    """
+    Merge data on top of the data it inherits from. Dependencies are
+    concatenated; all other values in data override or extend the values
+    from parent_data.
+    """
+    result = dict_merge(parent_data, data)
+    result['depends'] = data.get('depends', []) + parent_data.get('depends', [])
+    result['inherit'] = parent_data.get('inherit')
+    return result
+
+
+class RecipeVars(dict):
+    """
+    The vars of a recipe. Counts modifications, so the recipe can tell
+    when its cached variable values are out of date.
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.version = 0
+
+    def __setitem__(self, key, value):
+        self.version += 1
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.version += 1
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        self.version += 1
+        dict.clear(self)
+
+    def pop(self, *args):
+        self.version += 1
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.version += 1
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self.version += 1
+        dict.update(self, *args, **kwargs)
+
 class Recipe(object):
     """
     Object representation of a recipe file.
+
+    Recipe values are accessed as attributes, e.g. recipe.depends. They are
+    resolved on first access, by merging (in this order of precedence):
+    - The local package and category flags (for package recipes)
+    - The recipe file itself
+    - The template the recipe inherits from (which already includes its own
+      parent templates)
     """
     def __init__(self, filename):
         self.id = os.path.splitext(os.path.basename(filename))[0]
         self.log = pb_logging.logger.getChild("Recipe[{0}]".format(self.id))
         self.inherit = 'empty'
         self._static = False
-        # Load original recipe:
-        self.log.trace("Loading recipe file: {0}".format(filename))
-        self._data = load_recipe_from_file(filename)
-        # Recursively do the inheritance:
-        while self._data.get('inherit', 'empty'):
-            inherit_from = self._data.get('inherit', 'empty')
-            try:
-                filename = recipe_manager.recipe_manager.get_template_filename(inherit_from)
-                self.log.trace("Loading template file: {0}".format(filename))
-            except PBException:
-                self.log.warn("Recipe attempting to inherit from unknown template {0}".format(
-                    inherit_from
-                ))
-                break
-            self.log.trace("Inheriting from file {0}".format(filename))
-            parent_data = load_recipe_from_file(filename)
-            self._data['depends'] = self._data['depends'] + parent_data['depends']
-            self._data = dict_merge(parent_data, self._data)
-            self._data['inherit'] = parent_data.get('inherit')
-        if self._data.get('target') == 'package':
-            self._data = self.get_local_package_data()
+        self._lock = threading.RLock()
+        self._fields = {}
+        self._local_flags = None
+        self._keys = None
+        self._var_scope = {}
+        self._var_scope_key = None
+        filename = os.path.abspath(filename)
+        index = recipe_index.get_index(os.path.dirname(filename))
+        self._own = index.get_recipe_data(filename)
+        if self._own is None:
+            fingerprints = [(filename, recipe_index.get_file_fingerprint(filename))]
+            self.log.trace("Loading recipe file: {0}".format(filename))
+            self._own = recipe_index.to_plain(load_recipe_from_file(filename))
+            index.set_recipe_data(filename, self._own, fingerprints)
         else:
-            self._data = normalize_package_data(self._data)
-        # Map all recipe info onto self:
-        for k, v in iteritems(self._data):
-            if not hasattr(self, k):
-                setattr(self, k, v)
+            self.log.trace("Loaded recipe from index: {0}".format(filename))
+        self._template = {}
+        inherit_from = self._own.get('inherit', 'empty')
+        if inherit_from:
+            self.log.trace("Inheriting from template {0}".format(inherit_from))
+            self._template = (get_template(inherit_from) or ({}, []))[0]
         self.log.trace("Loaded recipe - {0}".format(self.id))
 
+    def __getattr__(self, name):
+        """
+        Only called if name is not a regular attribute: Look it up in the
+        recipe data.
+        """
+        if name.startswith('_') or name not in self._get_keys():
+            raise AttributeError(
+                "Recipe `{0}' has no attribute `{1}'".format(self.__dict__.get('id'), name)
+            )
+        return self._get_field(name)
+
+    def _get_keys(self):
+        " Return the names of all recipe values, in order "
+        with self._lock:
+            if self._keys is None:
+                keys = OrderedDict((k, None) for k in self._template)
+                keys.update((k, None) for k in self._own)
+                keys.update((k, None) for k in self._get_local_flags())
+                self._keys = list(keys.keys())
+            return self._keys
+
+    def _get_local_flags(self):
+        """
+        Return the local package and category flags for this recipe, if
+        it's a package recipe.
+        """
+        with self._lock:
+            if self._local_flags is None:
+                self._local_flags = {}
+                if self._get_recipe_value('target') == 'package':
+                    self._local_flags = config_manager.config_manager.get_package_flags(
+                        self.id, self._get_recipe_value('category')
+                    )
+            return self._local_flags
+
+    def _get_recipe_value(self, key):
+        """
+        Return a value as defined by the recipe and its templates. This
+        copies every template value that it returns.
+        """
+        if key == 'depends':
+            return self._own.get('depends', []) + self._template.get('depends', [])
+        if key == 'inherit' and self._template:
+            return self._template.get('inherit')
+        if key in self._own:
+            if isinstance(self._own[key], Mapping) and isinstance(self._template.get(key), Mapping):
+                return dict_merge(self._template[key], self._own[key])
+            return self._own[key]
+        return deepcopy(self._template.get(key))
+
+    def _get_field(self, key):
+        """
+        Return the final value for key. It is resolved only once, so it
+        may be modified by the caller (e.g. recipe.vars).
+        """
+        with self._lock:
+            if key not in self._fields:
+                value = self._get_recipe_value(key)
+                local_flags = self._get_local_flags()
+                if key in local_flags:
+                    value = dict_merge({key: value}, {key: local_flags[key]})[key]
+                if key == 'source' and not isinstance(value, list):
+                    value = [value,]
+                if key == 'vars':
+                    value = RecipeVars(value or {})
+                self._fields[key] = value
+            return self._fields[key]
+
     def __str__(self):
         from ruamel import yaml
         out = "Recipe: {id}\n".format(id=str(self.id))
-        out += yaml.dump(self._data, default_flow_style=False)
+        out += yaml.dump(self.get_dict(), default_flow_style=False)
         return out
 
     def get_dict(self):
@@ -275,7 +504,7 @@ class Recipe(object):
         Return recipe data as dictionary.
         r.get_dict()['foo'] is the same as r.foo.
         """
-        return normalize_package_data(self._data)
+        return OrderedDict((k, self._get_field(k)) for k in self._get_keys())
 
     def get_package_reqs(self, pkg_type):
         """
@@ -293,8 +522,7 @@ class Recipe(object):
                 req_string = getattr(self, satisfy_key, {}).get(pkg_type)
         if req_string is True:
             return req_string
-        self.log.trace("Parsing requirements string: {}".format(req_string))
-        return PBPackageRequirementScanner(req_string).get_preq()
+        return parse_package_reqs(req_string)
 
     def set_static(self, static):
         """
@@ -324,43 +552,63 @@ class Recipe(object):
         """
         Replace all the $variables in string 's' with the vars
         from 'recipe'. If keys are not in vars, try config options.
-        Default to empty strings.
+        Variables may reference other variables; circular references
+        are an error.
+        """
+        with self._lock:
+            try:
+                return self._expand_vars(s, ())
+            except PBException as ex:
+                self.log.error("Error parsing {s}: {e}".format(s=s, e=str(ex)))
+                raise ex
+
+    def _expand_vars(self, s, resolving):
         """
+        Expand all variables in s. resolving is the chain of variables
+        that are currently being expanded. Lock must be held.
+        """
+        return "".join(
+            self._get_var_value(segment, resolving) if is_var else segment
+            for is_var, segment in parse_var_template(s)
+        )
+
+    def _get_var_value(self, var_name, resolving):
+        """
+        Return the fully expanded value of variable var_name. Values are
+        cached in the variable scope of this recipe, which is reset whenever
+        self.vars or the configuration changes. Lock must be held.
+        """
+        cfg = config_manager.config_manager
+        rec_vars = self.vars
+        scope_key = (id(rec_vars), rec_vars.version, cfg.generation)
+        if self._var_scope_key != scope_key:
+            self._var_scope = {}
+            self._var_scope_key = scope_key
+        if var_name in self._var_scope:
+            return self._var_scope[var_name]
+        if var_name in resolving:
+            raise PBException("Circular variable definition: {0}".format(
+                " -> ".join("$" + x for x in resolving[resolving.index(var_name):] + (var_name,))
+            ))
         # PyBOMBS1 supported a conditional replacement mechanism,
         # where variable==FOO?{a}:{b} would return a if variables
         # matches FOO, or b otherwise. We'll leave this out for now.
-        def var_replace(mo, var_dict, cfg):
-            """
-            Expects arguments to be matchobjects for strings starting with $.
-            Returns the variable replacement value.
-            """
-            var_name_dollar = mo.group(0)
-            assert len(var_name_dollar) > 1 and var_name_dollar[0] == '$'
-            var_name = var_name_dollar[1:] # Strip $
-            if var_name == 'prefix':
-                return cfg.get_active_prefix().prefix_dir
-            if var_name == 'src_dir':
-                return cfg.get_active_prefix().src_dir
-            if var_name == 'python_path':
-                return cfg.get_active_prefix().python_path
-            if var_name in var_dict:
-                return var_dict.get(var_name)
+        if var_name == 'prefix':
+            value = cfg.get_active_prefix().prefix_dir
+        elif var_name == 'src_dir':
+            value = cfg.get_active_prefix().src_dir
+        elif var_name == 'python_path':
+            value = cfg.get_active_prefix().python_path
+        elif var_name in rec_vars:
+            value = rec_vars[var_name]
+        else:
             try:
-                return str(cfg.get(var_name))
+                value = cfg.get(var_name)
             except PBException:
-                raise PBException("Could not expand variable {0}.".format(var_name_dollar))
-        ###
-        # Starts with a $, unless preceded by \
-        var_re = re.compile(r'(?<!\\)\$[a-z][a-z0-9_]*')
-        var_repl = lambda mo: var_replace(mo, self.vars, config_manager.config_manager)
-        try:
-            (s, n_subs) = var_re.subn(var_repl, s)
-        except PBException as ex:
-            self.log.error("Error parsing {s}: {e}".format(s=s, e=str(ex)))
-            raise ex
-        if n_subs == 0:
-            return s
-        return self.var_replace_all(s)
+                raise PBException("Could not expand variable ${0}.".format(var_name))
+        value = self._expand_vars(str(value), resolving + (var_name,))
+        self._var_scope[var_name] = value
+        return value
 
     def get_local_package_data(self):
         """
@@ -370,12 +618,7 @@ class Recipe(object):
         This allows users to override anything in a recipe with whatever's stored
         in the `package:` and `category:` sections of their local config files.
         """
-        return normalize_package_data(dict_merge(
-            self.get_dict(),
-            config_manager.config_manager.get_package_flags(
-                self.id, self.get_dict().get('category')
-            )
-        ))
+        return self.get_dict()
 
 
 RECIPE_CACHE = {}
@@ -0,0 +1,198 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Compiled recipe index: Caches directory listings and parsed recipe data for
+every recipe location, so recipes don't have to be parsed on every run.
+"""
+
+import os
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from six import string_types, text_type
+from pybombs import pb_logging
+from pybombs.config_manager import config_manager
+from pybombs.utils.sysutils import get_file_fingerprint
+
+INDEX_VERSION = 2
+INDEX_DIR_NAME = 'recipe_index'
+PICKLE_PROTOCOL = 2 # Readable by Python 2 and 3
+
+def to_plain(data):
+    """
+    Turn the ruamel.yaml types we get from PBConfigFile (CommentedMap,
+    CommentedSeq, ScalarString, ...) into plain Python types that can be
+    pickled.
+    """
+    if isinstance(data, dict):
+        return OrderedDict((to_plain(k), to_plain(v)) for k, v in data.items())
+    if isinstance(data, (list, tuple)):
+        return [to_plain(x) for x in data]
+    if isinstance(data, bool):
+        return bool(data)
+    if isinstance(data, string_types):
+        return text_type(data) if isinstance(data, text_type) else str(data)
+    if isinstance(data, int):
+        return int(data)
+    if isinstance(data, float):
+        return float(data)
+    return data
+
+class RecipeIndex(object):
+    """
+    Index for a single directory of recipes or templates. It stores:
+    - The list of files in the directory, valid as long as the directory
+      mtime doesn't change
+    - For every recipe (or template), its parsed data, valid as long as none
+      of the files it was compiled from change
+    """
+    def __init__(self, dirname, index_dir):
+        self.log = pb_logging.logger.getChild("RecipeIndex")
+        self.dirname = os.path.abspath(dirname)
+        self.index_file = os.path.join(
+            index_dir,
+            hashlib.md5(self.dirname.encode('utf-8')).hexdigest() + '.idx'
+        )
+        self._lock = threading.RLock()
+        self._data = None
+        self._dirty = False
+
+    def list_files(self, extension):
+        """
+        Return the sorted names of all files in this directory that end with
+        extension. Only calls os.listdir() if the directory has changed.
+        """
+        fingerprint = get_file_fingerprint(self.dirname)
+        with self._lock:
+            self._load()
+            listing = self._data['listing']
+            if listing.get('fingerprint') != fingerprint or fingerprint is None:
+                self.log.debug("Scanning {0}".format(self.dirname))
+                listing = {'fingerprint': fingerprint, 'files': sorted(os.listdir(self.dirname))}
+                self._data['listing'] = listing
+                self._mark_dirty()
+            return [f for f in listing['files'] if os.path.splitext(f)[1] == extension]
+
+    def get_recipe_data(self, filename):
+        """
+        Return the data for the recipe stored in filename, or None if
+        it's not in the index or if any of the files it depends on changed.
+        Every call returns a new copy, so the caller may modify it.
+        """
+        with self._lock:
+            self._load()
+            entry = self._data['recipes'].get(filename)
+        if entry is None:
+            return None
+        for dep_file, fingerprint in entry['files']:
+            if get_file_fingerprint(dep_file) != fingerprint:
+                self.log.trace("{0} changed, can't use index for {1}".format(dep_file, filename))
+                return None
+        return pickle.loads(entry['data'])
+
+    def set_recipe_data(self, filename, data, fingerprints):
+        """
+        Store the data of a recipe.
+
+        - fingerprints: List of (filename, fingerprint) tuples for every file
+          (or directory) the data depends on. They must be taken before
+          reading the files.
+        """
+        entry = {
+            'files': [
+                (dep_file, tuple(fingerprint) if fingerprint is not None else None)
+                for dep_file, fingerprint in fingerprints
+            ],
+            'data': pickle.dumps(to_plain(data), PICKLE_PROTOCOL),
+        }
+        with self._lock:
+            self._load()
+            self._data['recipes'][filename] = entry
+            self._mark_dirty()
+
+    def save(self):
+        """
+        Write the index to disk, if anything changed. Entries that another
+        process added in the meantime are kept.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            for filename, entry in self._read_index_file().get('recipes', {}).items():
+                self._data['recipes'].setdefault(filename, entry)
+            tmp_filename = "{0}.{1}.tmp".format(self.index_file, os.getpid())
+            try:
+                if not os.path.isdir(os.path.dirname(self.index_file)):
+                    os.makedirs(os.path.dirname(self.index_file))
+                with open(tmp_filename, 'wb') as index_file:
+                    pickle.dump(self._data, index_file, PICKLE_PROTOCOL)
+                os.rename(tmp_filename, self.index_file)
+                self._dirty = False
+            except (IOError, OSError) as ex:
+                self.log.debug("Could not write recipe index {0}: {1}".format(self.index_file, str(ex)))
+
+    def _mark_dirty(self):
+        " Make sure the index gets saved. Lock must be held. "
+        if not self._dirty:
+            self._dirty = True
+            atexit.register(self.save)
+
+    def _load(self):
+        " Load index from disk, unless it's already loaded. Lock must be held. "
+        if self._data is not None:
+            return
+        self._data = {'version': INDEX_VERSION, 'dirname': self.dirname, 'listing': {}, 'recipes': {}}
+        if not config_manager.refresh:
+            self._data.update(self._read_index_file())
+
+    def _read_index_file(self):
+        " Return the contents of the index file, or an empty dict if it's not valid "
+        if not os.path.isfile(self.index_file):
+            return {}
+        try:
+            with open(self.index_file, 'rb') as index_file:
+                data = pickle.load(index_file)
+            if data.get('version') == INDEX_VERSION and data.get('dirname') == self.dirname:
+                return data
+        except Exception as ex:
+            self.log.debug("Ignoring invalid recipe index {0}: {1}".format(self.index_file, str(ex)))
+        return {}
+
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+def get_index(dirname):
+    """
+    Return the RecipeIndex for dirname. There's only one per directory.
+    """
+    dirname = os.path.abspath(dirname)
+    with _INDEXES_LOCK:
+        if dirname not in _INDEXES:
+            _INDEXES[dirname] = RecipeIndex(
+                dirname,
+                os.path.join(config_manager.local_cfg_dir, INDEX_DIR_NAME)
+            )
+        return _INDEXES[dirname]
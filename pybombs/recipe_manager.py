@@ -25,6 +25,7 @@ Recipe Manager: Handles the available recipes
 import os
 from pybombs import config_manager
 from pybombs import pb_logging
+from pybombs import recipe_index
 from pybombs.pb_exception import PBException
 
 class RecipeListManager(object):
@@ -72,6 +73,10 @@ class RecipeListManager(object):
         """ Returns a list of all recipe names """
         return self._recipe_list.keys()
 
+    def get_locations(self):
+        """ Returns the list of recipe directories, most important first """
+        return list(self._locations)
+
     def _append_location(self, dirname):
         """
         Goes through directory 'dirname' and looks at all .lwr files.
@@ -79,6 +84,9 @@ class RecipeListManager(object):
         then adds the filename into the list.
 
         Also checks for a template directory and adds any templates.
+
+        Directory listings come from the recipe index, so directories are
+        only scanned when they have changed.
         """
         dirname = os.path.expanduser(dirname)
         if dirname in self._locations:
@@ -90,19 +98,21 @@ class RecipeListManager(object):
             return
         self.log.debug("Scanning directory '{0}' for recipes...".format(dirname))
         # Load list of .lwr files from this dir:
-        lwr_files = [f for f in os.listdir(dirname) if os.path.splitext(f)[1] == '.lwr']
+        lwr_files = recipe_index.get_index(dirname).list_files('.lwr')
         self.log.debug("Found {0} new recipes.".format(len(lwr_files)))
         for f in lwr_files:
             pkgname = os.path.splitext(f)[0]
             abs_filename = os.path.join(dirname, f)
             if pkgname not in self._recipe_list.keys():
                 self._recipe_list[pkgname] = abs_filename
+        if self._template_list:
+            return
         self.log.debug("Loading templates.")
         # Load any templates from this directory.
         template_dir = self.cfg.get_template_dir()
         if not os.path.isdir(template_dir):
             raise PBException("No template directory found at {0}".format(dirname))
-        template_files = [f for f in os.listdir(template_dir) if os.path.splitext(f)[1] == '.lwt']
+        template_files = recipe_index.get_index(template_dir).list_files('.lwt')
         for f in template_files:
             template = os.path.splitext(f)[0]
             abs_filename = os.path.join(template_dir, f)
@@ -0,0 +1,258 @@
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Recipe search: A persistent inverted index (term -> recipes) for every
+recipe location, updated incrementally when recipe files change.
+"""
+
+import os
+import re
+import bisect
+import hashlib
+import threading
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from six import string_types
+from pybombs import pb_logging
+from pybombs import recipe_index
+from pybombs.utils.sysutils import get_file_fingerprint
+from pybombs.config_manager import config_manager
+from pybombs.pb_exception import PBException
+
+SEARCH_INDEX_VERSION = 1
+
+# Searchable recipe fields, and how much a match in each field counts
+FIELD_WEIGHTS = {
+    'name': 10,
+    'category': 4,
+    'description': 3,
+    'depends': 2,
+    'source': 1,
+}
+
+def get_terms(text):
+    """
+    Split text into lower-case search terms. Terms with dashes or dots
+    (e.g. 'gr-osmosdr') are also split up, so both 'gr-osmosdr' and
+    'osmosdr' find the recipe.
+    """
+    terms = set()
+    for word in re.split(r'[^a-z0-9_.+-]+', text.lower()):
+        word = word.strip('.-+')
+        if not word:
+            continue
+        terms.add(word)
+        terms.update(x for x in re.split(r'[.+-]+', word) if x)
+    return terms
+
+def get_recipe_terms(name, data):
+    """
+    Return a dict term -> score for a recipe called name with the (raw,
+    uninherited) recipe data.
+    """
+    def _to_text(value):
+        " Turn a recipe value into a string "
+        if value is None:
+            return ""
+        if isinstance(value, string_types):
+            return value
+        if isinstance(value, (list, tuple)):
+            return " ".join(_to_text(x) for x in value)
+        return str(value)
+    terms = {}
+    texts = {
+        'name': name,
+        'category': data.get('category'),
+        'description': data.get('description'),
+        'depends': data.get('depends'),
+        'source': data.get('source'),
+    }
+    for field, text in texts.items():
+        for term in get_terms(_to_text(text)):
+            terms[term] = terms.get(term, 0) + FIELD_WEIGHTS[field]
+    return terms
+
+class SearchIndex(object):
+    """
+    Inverted index for all recipes in one recipe directory.
+
+    For every .lwr file, it stores the file's fingerprint, a short summary
+    (category, description) and its search terms. On top of that, it
+    stores for every term which recipes contain it. update() only looks
+    at recipe files that were added, removed or changed since the last
+    update.
+    """
+    def __init__(self, dirname, index_dir):
+        self.log = pb_logging.logger.getChild("SearchIndex")
+        self.dirname = os.path.abspath(dirname)
+        self.index_file = os.path.join(
+            index_dir,
+            hashlib.md5(self.dirname.encode('utf-8')).hexdigest() + '.search'
+        )
+        self._lock = threading.RLock()
+        self._data = None
+        self._sorted_terms = None
+
+    def update(self):
+        """
+        Bring the index up to date with the recipe files in this directory,
+        and save it if anything changed. Returns the number of recipes that
+        were (re-)indexed or removed.
+        """
+        with self._lock:
+            self._load()
+            lwr_files = recipe_index.get_index(self.dirname).list_files('.lwr')
+            changed = 0
+            for filename in set(self._data['recipes']) - set(lwr_files):
+                self._remove(filename)
+                changed += 1
+            for filename in lwr_files:
+                abs_filename = os.path.join(self.dirname, filename)
+                fingerprint = get_file_fingerprint(abs_filename)
+                entry = self._data['recipes'].get(filename)
+                if entry is not None and entry['fingerprint'] == fingerprint:
+                    continue
+                self._remove(filename)
+                self._add(filename, abs_filename, fingerprint)
+                changed += 1
+            if changed:
+                self.log.debug("Re-indexed {0} recipe(s) in {1}".format(changed, self.dirname))
+                self._sorted_terms = None
+                self._save()
+            return changed
+
+    def search(self, query_terms):
+        """
+        Return a dict recipe name -> score of all recipes that match every
+        one of query_terms. A query term matches every term it is a prefix
+        of; exact matches score higher. Call update() first.
+        """
+        with self._lock:
+            self._load()
+            if self._sorted_terms is None:
+                self._sorted_terms = sorted(self._data['terms'])
+            results = None
+            for query_term in query_terms:
+                matches = {}
+                idx = bisect.bisect_left(self._sorted_terms, query_term)
+                while idx < len(self._sorted_terms) and self._sorted_terms[idx].startswith(query_term):
+                    term = self._sorted_terms[idx]
+                    bonus = 2 if term == query_term else 1
+                    for filename, score in self._data['terms'][term].items():
+                        matches[filename] = max(matches.get(filename, 0), score * bonus)
+                    idx += 1
+                if results is None:
+                    results = matches
+                else:
+                    results = {f: s + matches[f] for f, s in results.items() if f in matches}
+                if not results:
+                    return {}
+            return {
+                os.path.splitext(filename)[0]: score
+                for filename, score in (results or {}).items()
+            }
+
+    def get_summary(self, name):
+        " Return the summary dict (category, description) of recipe name "
+        with self._lock:
+            self._load()
+            entry = self._data['recipes'].get(name + '.lwr')
+            return entry['summary'] if entry is not None else {}
+
+    def _add(self, filename, abs_filename, fingerprint):
+        " Add a recipe file to the index. Lock must be held. "
+        data = recipe_index.get_index(self.dirname).get_recipe_data(abs_filename)
+        if data is None:
+            from pybombs.recipe import load_recipe_from_file
+            try:
+                data = recipe_index.to_plain(load_recipe_from_file(abs_filename))
+            except (PBException, Exception) as ex: # PBException isn't an Exception
+                self.log.debug("Not indexing invalid recipe {0}: {1}".format(abs_filename, str(ex)))
+                data = {}
+        name = os.path.splitext(filename)[0]
+        terms = get_recipe_terms(name, data)
+        description = data.get('description') or ''
+        self._data['recipes'][filename] = {
+            'fingerprint': fingerprint,
+            'summary': {
+                'category': data.get('category') or '',
+                'description': description if isinstance(description, string_types) else str(description),
+            },
+            'terms': terms,
+        }
+        for term, score in terms.items():
+            self._data['terms'].setdefault(term, {})[filename] = score
+
+    def _remove(self, filename):
+        " Remove a recipe file from the index. Lock must be held. "
+        entry = self._data['recipes'].pop(filename, None)
+        if entry is None:
+            return
+        for term in entry['terms']:
+            recipes = self._data['terms'].get(term, {})
+            recipes.pop(filename, None)
+            if not recipes:
+                self._data['terms'].pop(term, None)
+
+    def _load(self):
+        " Load index from disk, unless it's already loaded. Lock must be held. "
+        if self._data is not None:
+            return
+        self._data = {'version': SEARCH_INDEX_VERSION, 'dirname': self.dirname, 'recipes': {}, 'terms': {}}
+        if config_manager.refresh or not os.path.isfile(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'rb') as index_file:
+                data = pickle.load(index_file)
+            if data.get('version') == SEARCH_INDEX_VERSION and data.get('dirname') == self.dirname:
+                self._data = data
+        except Exception as ex:
+            self.log.debug("Ignoring invalid search index {0}: {1}".format(self.index_file, str(ex)))
+
+    def _save(self):
+        " Write the index to disk. Lock must be held. "
+        tmp_filename = "{0}.{1}.tmp".format(self.index_file, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.index_file)):
+                os.makedirs(os.path.dirname(self.index_file))
+            with open(tmp_filename, 'wb') as index_file:
+                pickle.dump(self._data, index_file, recipe_index.PICKLE_PROTOCOL)
+            os.rename(tmp_filename, self.index_file)
+        except (IOError, OSError) as ex:
+            self.log.debug("Could not write search index {0}: {1}".format(self.index_file, str(ex)))
+
+
+_SEARCH_INDEXES = {}
+_SEARCH_INDEXES_LOCK = threading.Lock()
+def get_search_index(dirname):
+    """
+    Return the SearchIndex for dirname. There's only one per directory.
+    """
+    dirname = os.path.abspath(dirname)
+    with _SEARCH_INDEXES_LOCK:
+        if dirname not in _SEARCH_INDEXES:
+            _SEARCH_INDEXES[dirname] = SearchIndex(
+                dirname,
+                os.path.join(config_manager.local_cfg_dir, recipe_index.INDEX_DIR_NAME)
+            )
+        return _SEARCH_INDEXES[dirname]
@@ -23,8 +23,6 @@ Utils for handling archives
 """
 
 import os
-import zipfile
-import tarfile
 import tempfile
 import shutil
 from pybombs import pb_logging
@@ -33,6 +31,8 @@ def extract_to(filename, path):
     """
     Extract an archive into a directory. Return the prefix for the extracted files.
     """
+    import tarfile
+    import zipfile
     log = pb_logging.logger.getChild("extract_to")
     if tarfile.is_tarfile(filename):
         archive = tarfile.open(filename)
@@ -66,6 +66,8 @@ def is_archive(filename):
     """
     Return True if 'filename' is a zipped archive.
     """
+    import tarfile
+    import zipfile
     return os.path.isfile(filename) and \
             (tarfile.is_tarfile(filename) or zipfile.is_zipfile(filename))
 
@@ -79,6 +79,18 @@ class OutputProcessorDots(OutputProcessor):
     def process_output(self, stdoutdata, stderrdata):
         sys.stdout.write('.')
 
+class OutputProcessorSilent(OutputProcessor):
+    """ Swallows all output, e.g. when several processes share a terminal. """
+    def __init__(self):
+        OutputProcessor.__init__(self)
+        self.extra_popen_args = {'stdout': PIPE, 'stderr': STDOUT}
+
+    def process_output(self, stdoutdata, stderrdata):
+        pass
+
+    def process_final(self):
+        pass
+
 class OutputProcessorMake(OutputProcessor):
     """
     Shows progress when running 'make'
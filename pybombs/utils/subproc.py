@@ -39,6 +39,10 @@ READ_TIMEOUT = 0.1 # s
 
 CalledProcessError = subprocess.CalledProcessError
 
+# Quit events of all processes currently run by monitor_process()
+_ACTIVE_QUIT_EVENTS = set()
+_ACTIVE_QUIT_EVENTS_LOCK = threading.Lock()
+
 
 def check_output(*args, **kwargs):
     """
@@ -49,6 +53,18 @@ def check_output(*args, **kwargs):
     """
     return subprocess.check_output(*args, **kwargs).decode('utf-8')
 
+def get_output(*args, **kwargs):
+    """
+    Like check_output(), but if the command returns a non-zero exit code,
+    return whatever it wrote to stdout instead of raising. Useful for
+    commands that query many things at once and fail if a single one of
+    them fails.
+    """
+    try:
+        return check_output(*args, **kwargs)
+    except subprocess.CalledProcessError as ex:
+        return (ex.output or b'').decode('utf-8')
+
 
 def get_child_pids(pid):
     """
@@ -131,9 +147,10 @@ def run_with_output_processing(p, o_proc, event, cleanup=None):
     o_proc.process_final()
     return p.returncode
 
-def _process_thread(event, args, kwargs):
+def _process_thread(event, args, kwargs, result):
     """
-    This actually runs the process.
+    This actually runs the process. The return code is stored in
+    result['ret_code'].
     """
     def elevate_command(args, elevate_pre_args):
         " Modify the command to run with elevated privileges. "
@@ -157,7 +174,7 @@ def _process_thread(event, args, kwargs):
             )
     from pybombs.config_manager import config_manager
     from pybombs.utils import output_proc
-    _process_thread.result = 0
+    result['ret_code'] = 0
     extra_popen_args = {}
     use_oproc = False
     o_proc = kwargs.get('o_proc')
@@ -180,6 +197,7 @@ def _process_thread(event, args, kwargs):
             args,
             shell=kwargs.get('shell', False),
             env=kwargs.get('env', config_manager.get_active_prefix().env),
+            cwd=kwargs.get('cwd'),
             **extra_popen_args
         )
     except OSError:
@@ -188,6 +206,7 @@ def _process_thread(event, args, kwargs):
             log.debug("Make sure command can be elevated using `{epa}' " \
                            "on this platform!".format(
                                epa=config_manager.get('elevate_pre_args')))
+        result['ret_code'] = -1
         return -1
     if use_oproc:
         ret_code = run_with_output_processing(
@@ -206,7 +225,7 @@ def _process_thread(event, args, kwargs):
                 if kwargs.get('cleanup') is not None:
                     kwargs.get('cleanup')()
                 break
-    _process_thread.result = ret_code
+    result['ret_code'] = ret_code
     event.set()
     return ret_code
 
@@ -227,29 +246,39 @@ def monitor_process(args, **kwargs):
     - o_proc: An output processor
     - cleanup: A callback to clean up artifacts if the process is killed
     - elevate: Run with elevated privileges (e.g., 'sudo <command>')
+    - cwd: Run the process in this directory instead of the current working
+           directory. Prefer this over os.chdir(), which is not thread-safe.
 
     Returns the process's return value.
+
+    This function may be called from multiple threads at the same time.
     """
     log = logger.getChild("monitor_process()")
     if kwargs.get('elevate'):
         log.debug("Running with elevated privileges.")
+    quit_event = threading.Event()
+    result = {'ret_code': 0}
+    with _ACTIVE_QUIT_EVENTS_LOCK:
+        _ACTIVE_QUIT_EVENTS.add(quit_event)
     try:
-        quit_event = threading.Event()
         monitor_thread = threading.Thread(
             target=_process_thread,
-            args=(quit_event, args, kwargs)
+            args=(quit_event, args, kwargs, result)
         )
         monitor_thread.start()
-        while monitor_thread.isAlive:
+        while monitor_thread.is_alive():
             # Try if it's finished:
             monitor_thread.join(1)
             if quit_event.is_set() or not monitor_thread.is_alive():
                 log.debug("Thread signaled termination or returned")
                 break
-        log.debug("Return value: {0}".format(_process_thread.result))
-        if _process_thread.result != 0 and kwargs.get("throw", False):
-            raise PBException("Process returned value: " + str(_process_thread.result))
-        return _process_thread.result
+        # If we were stopped by terminate_all(), let the thread finish killing
+        # the process so the return value is valid:
+        monitor_thread.join()
+        log.debug("Return value: {0}".format(result['ret_code']))
+        if result['ret_code'] != 0 and kwargs.get("throw", False):
+            raise PBException("Process returned value: " + str(result['ret_code']))
+        return result['ret_code']
     except KeyboardInterrupt:
         print("")
         log.info("Caught Ctrl+C. Killing all sub-processes.")
@@ -261,6 +290,18 @@ def monitor_process(args, **kwargs):
             raise ex
         else:
             return -1
+    finally:
+        with _ACTIVE_QUIT_EVENTS_LOCK:
+            _ACTIVE_QUIT_EVENTS.discard(quit_event)
+
+def terminate_all():
+    """
+    Kill all processes that are currently being run through monitor_process(),
+    from any thread. Their cleanup callbacks are called as usual.
+    """
+    with _ACTIVE_QUIT_EVENTS_LOCK:
+        for quit_event in _ACTIVE_QUIT_EVENTS:
+            quit_event.set()
 
 
 def match_output(command, pattern, match_key=None, **kwargs):
@@ -53,6 +53,16 @@ def which(program, env=None):
                 return exe_file
     return None
 
+def get_file_fingerprint(filename):
+    """
+    Return something that changes when the file changes (or disappears)
+    """
+    try:
+        stat = os.stat(filename)
+        return (stat.st_mtime, stat.st_size)
+    except OSError:
+        return None
+
 def dir_is_writable(dir_path):
     " Returns True if dir_path is a writable directory "
     return op.isdir(dir_path) and os.access(dir_path, os.W_OK|os.X_OK)
@@ -23,38 +23,52 @@
 from __future__ import print_function
 from functools import reduce
 
+def get_column_widths(headers, data, col_order):
+    """
+    Return a dict col_id -> width of the widest entry in that column
+    (including the header).
+    """
+    return {
+        col_id: reduce(lambda a, x: max(a, len(str(x[col_id]))), data, len(str(headers[col_id])))
+        for col_id in col_order
+    }
+
+def print_header(headers, col_order, max_widths):
+    """
+    Print the table header and the line below it.
+    """
+    hdr_len = 0
+    for col_id in col_order:
+        format_string = "{0:" + str(max_widths[col_id]) + "}  "
+        hdr_title = format_string.format(headers[col_id])
+        print(hdr_title, end="")
+        hdr_len += len(str(hdr_title))
+    print("")
+    print("-" * hdr_len)
+
+def print_row(row, col_order, max_widths):
+    """
+    Print a single table row. Use this together with print_header() to
+    print tables row by row, e.g. while the rows are still being computed.
+    """
+    for col_id in col_order:
+        format_string = "{{0:{width}}}  ".format(width=max_widths[col_id])
+        print(format_string.format(row[col_id]), end="")
+    print("")
+
 def print_table(headers, data, col_order=None, sort_by=None):
     """
     Print a table.
     """
-    def get_max_column_widths(cols, headers, data):
-        return {col_id: reduce(lambda a, x: max(a, len(str(x[col_id]))), data, len(str(headers[col_id]))) for col_id in cols}
-    def print_header(cols, headers, max_widths):
-        hdr_len = 0
-        for col_id in col_order:
-            format_string = "{0:" + str(max_widths[col_id]) + "}  "
-            hdr_title = format_string.format(headers[col_id])
-            print(hdr_title, end="")
-            hdr_len += len(str(hdr_title))
-        print("")
-        print("-" * hdr_len)
-    def sort_data(data, cols, sort_by):
-        return sorted(data, key=lambda k: k[sort_by])
-    def print_data(cols, data, max_widths):
-        for row in data:
-            for col_id in cols:
-                format_string = "{{0:{width}}}  ".format(width=max_widths[col_id])
-                print(format_string.format(row[col_id]), end="")
-            print("")
-        print("")
-    # Go, go, go!
     if col_order is None:
         col_order = headers.keys()
-    max_widths = get_max_column_widths(col_order, headers, data)
+    max_widths = get_column_widths(headers, data, col_order)
     if sort_by is not None:
-        data = sort_data(data, col_order, sort_by)
-    print_header(col_order, headers, max_widths)
-    print_data(col_order, data, max_widths)
+        data = sorted(data, key=lambda k: k[sort_by])
+    print_header(headers, col_order, max_widths)
+    for row in data:
+        print_row(row, col_order, max_widths)
+    print("")
 
 
 if __name__ == "__main__":
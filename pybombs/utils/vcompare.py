@@ -23,16 +23,28 @@ Version comparison functions
 """
 
 import operator
-try:
-    from distutils.version import LooseVersion
-except ImportError:
-    from pybombs.utils.version import LooseVersion
+
+_loose_version = None
+def _get_loose_version():
+    """
+    Return the LooseVersion class. Importing distutils pulls in setuptools,
+    which is slow, so we only do that the first time a version is compared.
+    """
+    global _loose_version
+    if _loose_version is None:
+        try:
+            from distutils.version import LooseVersion
+        except ImportError:
+            from pybombs.utils.version import LooseVersion
+        _loose_version = LooseVersion
+    return _loose_version
 
 def vcompare(cmp_op, version_x, version_y):
     """
     Confirm if version x compares to y given an operator op.
     """
     operators = {'<=': operator.le, '==': operator.eq, '>=': operator.ge, '!=': operator.ne}
+    LooseVersion = _get_loose_version()
     try:
         return operators[cmp_op](LooseVersion(version_x), LooseVersion(version_y))
     except TypeError:
@@ -20,4 +20,10 @@ fi
 echo "Building source distribution package (sdist)..."
 python setup.py -q sdist
 
+echo "Measuring startup time..."
+python tests/startup_time.py --max-import-ms 250 --max-command-ms 750
+
+echo "Running config micro-benchmarks..."
+python tests/config_benchmark.py
+
 (cd tests && ./run-tests.sh $*)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Config micro-benchmarks: Times config lookups (ConfigManager.get()) and
+recipe variable expansion, which looks up config values. Every benchmark is
+run with the merged config view, and with a walk through all layers of the
+config cascade for comparison (the way get() used to work).
+"""
+
+from __future__ import print_function
+import os
+import sys
+import shutil
+import timeit
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')))
+
+RECIPE = """
+category: common
+inherit: cmake
+source: git+https://example.com/foo.git
+vars:
+  config_opt: "-DENABLE_FOO=ON"
+"""
+TEMPLATE = "cmake .. -DCMAKE_BUILD_TYPE=$cmakebuildtype -DENABLE_DOXYGEN=$builddocs " \
+        "-DCMAKE_INSTALL_PREFIX=$prefix $config_opt && make -j$makewidth && make install"
+
+def get_from_cascade(self, key, default=None):
+    " ConfigManager.get(), walking the cascade "
+    from pybombs.pb_exception import PBException
+    for set_of_vals in reversed(self.cfg_cascade):
+        if key in set_of_vals.keys():
+            return set_of_vals[key]
+    if default is not None:
+        return default
+    raise PBException("Invalid configuration key: {0}".format(key))
+
+def run_benchmarks(num_runs, recipe_file):
+    """
+    Return a list of (description, microseconds per call)
+    """
+    from pybombs import recipe
+    from pybombs.config_manager import config_manager
+    rec = recipe.Recipe(recipe_file)
+    def expand():
+        " Expand TEMPLATE with an empty variable scope "
+        config_manager.set('makewidth', '4') # Resets the scope
+        return rec.var_replace_all(TEMPLATE)
+    benchmarks = [
+        ("get(), existing key", lambda: config_manager.get('makewidth')),
+        ("get(), default value", lambda: config_manager.get('no-such-key', 'default')),
+        ("var_replace_all()", expand),
+    ]
+    return [
+        (desc, 1e6 * min(timeit.repeat(func, number=num_runs, repeat=3)) / num_runs)
+        for desc, func in benchmarks
+    ]
+
+def main():
+    " Go, go, go! "
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--runs', type=int, default=20000,
+                        help="Call every function this many times (default: 20000)")
+    args = parser.parse_args()
+    sys.argv = sys.argv[:1] # Don't let the config manager see our args
+    tmp_dir = tempfile.mkdtemp()
+    os.environ['HOME'] = tmp_dir
+    try:
+        recipe_file = os.path.join(tmp_dir, 'foo.lwr')
+        with open(recipe_file, 'w') as rec_file:
+            rec_file.write(RECIPE)
+        from pybombs.config_manager import ConfigManager
+        results = run_benchmarks(args.runs, recipe_file)
+        get_from_flat = ConfigManager.get
+        ConfigManager.get = get_from_cascade
+        try:
+            cascade_results = run_benchmarks(args.runs, recipe_file)
+        finally:
+            ConfigManager.get = get_from_flat
+    finally:
+        shutil.rmtree(tmp_dir)
+    print("{0:<24} {1:>12} {2:>12}".format("", "Merged view", "Cascade"))
+    for (desc, usecs), (_, cascade_usecs) in zip(results, cascade_results):
+        print("{0:<24} {1:>9.2f} us {2:>9.2f} us".format(desc, usecs, cascade_usecs))
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Startup benchmark: Measures how long it takes to import PyBOMBS and to get
+to the first command, using the PyBOMBS from this source tree. Every
+measurement runs in a fresh interpreter with an empty home directory; the
+best of all runs is reported.
+
+Returns non-zero if one of the given budgets is exceeded, or if the
+generated command help table (pybombs/commands/cmd_help.py) doesn't match
+the command classes. Run with --update-cmd-help to regenerate it.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+SRC_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+CMD_HELP_FILE = os.path.join(SRC_DIR, 'pybombs', 'commands', 'cmd_help.py')
+
+CMD_HELP_HEADER = '''#
+# Copyright 2016 Free Software Foundation, Inc.
+#
+# This file is part of PyBOMBS
+#
+# PyBOMBS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# PyBOMBS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyBOMBS; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+"""
+Help strings for the command list, so showing it doesn't import every
+command module. Generated by tests/startup_time.py --update-cmd-help,
+don't edit.
+"""
+
+# Command -> (help string, hidden)
+CMD_HELP = {
+'''
+
+def make_cmd_help():
+    """
+    Return the contents of cmd_help.py, taken from the command classes
+    """
+    sys.path.insert(0, SRC_DIR)
+    from pybombs.commands import COMMANDS
+    from pybombs.commands.base import get_cmd_class
+    out = CMD_HELP_HEADER
+    for cmd_name, _, _ in COMMANDS:
+        cmd_class = get_cmd_class(cmd_name)
+        out += "    {0!r}: ({1!r}, {2!r}),\n".format(
+            str(cmd_name), str(cmd_class.cmds[cmd_name]), cmd_class.hidden
+        )
+    return out + "}\n"
+
+IMPORT_SNIPPET = "import time; t = time.time(); import pybombs.main; print(time.time() - t)"
+
+def run_python(args, home_dir):
+    """
+    Run the Python interpreter with args, return (wall time, stdout)
+    """
+    env = dict(os.environ)
+    env['HOME'] = home_dir
+    env['PYTHONPATH'] = SRC_DIR
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable] + args,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stdout, stderr = proc.communicate()
+    duration = time.time() - start
+    if proc.returncode != 0:
+        print(stderr.decode('utf-8', 'replace'))
+        raise RuntimeError("`python {0}' failed.".format(" ".join(args)))
+    return duration, stdout.decode('utf-8', 'replace')
+
+def measure(num_runs, home_dir):
+    """
+    Return a list of (description, milliseconds)
+    """
+    pybombs = ['-m', 'pybombs.main']
+    benchmarks = [
+        ("Python interpreter", lambda: run_python(['-c', 'pass'], home_dir)[0]),
+        ("import pybombs.main", lambda: float(run_python(['-c', IMPORT_SNIPPET], home_dir)[1])),
+        ("pybombs --help", lambda: run_python(pybombs + ['--help'], home_dir)[0]),
+        ("pybombs config makewidth", lambda: run_python(pybombs + ['config', 'makewidth'], home_dir)[0]),
+    ]
+    return [
+        (desc, 1000 * min(func() for _ in range(num_runs)))
+        for desc, func in benchmarks
+    ]
+
+def main():
+    " Go, go, go! "
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--runs', type=int, default=5,
+                        help="Run every measurement this many times (default: 5)")
+    parser.add_argument('--max-import-ms', type=float,
+                        help="Fail if importing pybombs.main takes longer than this")
+    parser.add_argument('--max-command-ms', type=float,
+                        help="Fail if running the first command takes longer than this")
+    parser.add_argument('--update-cmd-help', action='store_true',
+                        help="Regenerate pybombs/commands/cmd_help.py and exit")
+    args = parser.parse_args()
+    sys.argv = sys.argv[:1] # Don't let the config manager see our args
+    cmd_help = make_cmd_help()
+    if args.update_cmd_help:
+        with open(CMD_HELP_FILE, 'w') as cmd_help_file:
+            cmd_help_file.write(cmd_help)
+        return 0
+    with open(CMD_HELP_FILE) as cmd_help_file:
+        cmd_help_ok = cmd_help_file.read() == cmd_help
+    home_dir = tempfile.mkdtemp()
+    try:
+        results = measure(max(args.runs, 1), home_dir)
+    finally:
+        shutil.rmtree(home_dir)
+    for desc, msecs in results:
+        print("{0:<28} {1:8.1f} ms".format(desc, msecs))
+    results = dict(results)
+    budgets = [
+        ("import pybombs.main", args.max_import_ms),
+        ("pybombs config makewidth", args.max_command_ms),
+    ]
+    failed = False
+    if not cmd_help_ok:
+        print("{0} is out of date, run {1} --update-cmd-help!".format(CMD_HELP_FILE, sys.argv[0]))
+        failed = True
+    for desc, budget in budgets:
+        if budget is not None and results[desc] > budget:
+            print("{0} took longer than {1} ms!".format(desc, budget))
+            failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    exit(main())